@@ -1,32 +1,72 @@
 import os
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 from pymongo.errors import CollectionInvalid
 
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "cst_db")
 
-client = MongoClient(MONGO_URL)
+# Async driver: every call is awaited so a slow aggregate never blocks the event loop
+client = AsyncMongoClient(MONGO_URL)
 db = client[DB_NAME]
 
 def get_database():
     return db
 
-def setup_indexes():
+# Superseded single-field indexes: status/category are prefixes of the compound
+# indexes below, and citizen_ref.citizen_id was never queried (code filters on citizen_id)
+LEGACY_INDEXES = {
+    "service_requests": ["status_1", "category_1", "citizen_ref.citizen_id_1", "assigned_agent_id_1_timestamps.assigned_at_-1__id_-1"]
+}
+
+async def drop_legacy_indexes():
+    for collection, names in LEGACY_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection].drop_index(name)
+
+async def setup_indexes():
     try:
         # Service Requests Indexes
-        db.service_requests.create_index([("location", "2dsphere")])
-        db.service_requests.create_index("request_id", unique=True)
-        db.service_requests.create_index("status")
-        db.service_requests.create_index("category")
-        db.service_requests.create_index("citizen_ref.citizen_id")
-        
+        # Each listing filters on at most one equality field and sorts newest first,
+        # so every access path is (equality prefix, created_at desc, _id desc): the
+        # filter and the keyset sort both come from the index, no in-memory SORT.
+        await db.service_requests.create_index([("location", "2dsphere")])
+        await db.service_requests.create_index("request_id", unique=True)
+        await db.service_requests.create_index([("timestamps.created_at", -1), ("_id", -1)])
+        await db.service_requests.create_index([("status", 1), ("timestamps.created_at", -1), ("_id", -1)])
+        await db.service_requests.create_index([("category", 1), ("timestamps.created_at", -1), ("_id", -1)])
+        await db.service_requests.create_index([("priority", 1), ("timestamps.created_at", -1), ("_id", -1)])
+        await db.service_requests.create_index([("citizen_id", 1), ("timestamps.created_at", -1), ("_id", -1)])
+        await db.service_requests.create_index([("location.zone_id", 1), ("timestamps.created_at", -1), ("_id", -1)])
+        await db.service_requests.create_index([("assigned_agent_id", 1), ("timestamps.created_at", -1), ("_id", -1)])
+        # Agent task lists and workload counts: agent + open statuses, ordered by assignment
+        await db.service_requests.create_index([("assigned_agent_id", 1), ("status", 1), ("timestamps.assigned_at", -1), ("_id", -1)])
+        # Next-task claims outside the in-process queue: the agent's assigned tasks by effective deadline
+        await db.service_requests.create_index([("assigned_agent_id", 1), ("status", 1), ("queue_due_at", 1), ("_id", 1)])
+        # SLA monitoring: open requests by stored deadline
+        await db.service_requests.create_index([("status", 1), ("sla_target_at", 1)])
+        await db.service_requests.create_index([("status", 1), ("sla_breach_at", 1)])
+        # Rollup claims not yet applied (only present mid-sync), for the reconciler's sweep
+        await db.service_requests.create_index("rollup_pending.claimed_at", sparse=True)
+        await drop_legacy_indexes()
+
         # Citizens Indexes
-        db.citizens.create_index("contacts.email", unique=True)
-        db.citizens.create_index("contacts.phone")
-        
+        await db.citizens.create_index("contacts.email", unique=True)
+        await db.citizens.create_index("contacts.phone")
+        await db.citizens.create_index([("created_at", -1), ("_id", -1)])
+
+        # KPI rollups: one row per bucket and dimension combination; reads scan a bucket range
+        await db.kpi_rollups.create_index(
+            [("granularity", 1), ("bucket", 1), ("zone_id", 1), ("category", 1), ("priority", 1), ("agent_id", 1)],
+            unique=True
+        )
+        await db.trend_rollups.create_index([("granularity", 1), ("dimension", 1), ("key", 1), ("bucket", 1)], unique=True)
+        await db.latency_sketches.create_index([("dimension", 1), ("key", 1), ("metric", 1)], unique=True)
+
         # Service Agents Indexes
-        db.service_agents.create_index("agent_code", unique=True)
-        db.service_agents.create_index([("coverage.geo_fence", "2dsphere")])
+        await db.service_agents.create_index("agent_code", unique=True)
+        await db.service_agents.create_index([("coverage.geo_fence", "2dsphere")])
         print("Indexes created successfully.")
     except Exception as e:
         print(f"Index creation warning: {e}")
@@ -2,9 +2,15 @@ from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.database import setup_indexes
+from app.utils.sequences import seed_request_counter
+from app.utils.event_log import run_event_flusher, flush_events
+from app.utils.sla import backfill_sla_deadlines, run_sla_sweeper
+from app.utils.workload import run_workload_reconciler
+from app.utils.rollups import ensure_kpi_rollups, flush_rollups, run_rollup_reconciler
 from app.routers import requests, citizens, agents, analytics
 import os
 import shutil
+import asyncio
 from datetime import datetime
 
 app = FastAPI(
@@ -20,6 +26,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Static Files
@@ -43,7 +50,30 @@ async def upload_file(file: UploadFile = File(...)):
 
 @app.on_event("startup")
 async def startup_db_client():
-    setup_indexes()
+    await setup_indexes()
+    await seed_request_counter()
+    await requests.load_sensitive_locations()
+    await backfill_sla_deadlines()
+    await ensure_kpi_rollups()
+    await analytics.load_request_clusters()
+    await analytics.load_hotspot_index()
+    await agents.backfill_zone_simplifications()
+    await agents.load_zone_index()
+    await agents.load_agent_index()
+    await agents.load_work_queues()
+    app.state.event_flusher = asyncio.create_task(run_event_flusher())
+    app.state.sla_sweeper = asyncio.create_task(run_sla_sweeper())
+    app.state.workload_reconciler = asyncio.create_task(run_workload_reconciler())
+    app.state.rollup_reconciler = asyncio.create_task(run_rollup_reconciler())
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    app.state.event_flusher.cancel()
+    app.state.sla_sweeper.cancel()
+    app.state.workload_reconciler.cancel()
+    app.state.rollup_reconciler.cancel()
+    await flush_events()
+    await flush_rollups()
 
 app.include_router(requests.router)
 app.include_router(citizens.router)
@@ -1,33 +1,153 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Response
+import asyncio
+import time
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
 from app.database import get_database
 from app.models.schemas import Agent, AgentCreate, RequestStatus, ZoneCreate
 from app.utils.common import get_allowed_transitions
+from app.utils.event_log import log_event
+from app.utils.pagination import apply_cursor, keyset_sort, set_next_cursor
+from app.utils.tiles import tile_versions
+from app.utils.cache import analytics_cache, ZONE_SCOPES
+from app.utils.zones import zone_index, simplified_boundaries
+from app.utils.rollups import sync_rollups
+from app.utils.workload import reconcile_workloads, move_workloads
+from app.utils.agent_index import agent_index
+from app.utils.dispatch import plan_dispatch, DEFAULT_MAX_WORKLOAD
+from app.utils.routing import plan_route
+from app.utils.work_queue import work_queues, QUEUED_STATUS
 
 router = APIRouter(prefix="/agents", tags=["Service Agents"])
 db = get_database()
 
 # --- Zone Management ---
 
+ZONE_TAG_CHUNK_SIZE = 5000
+ZONE_TAG_JOBS = {}
+_zone_tag_tasks = set()
+
+async def load_zone_index():
+    """(Re)build the in-memory zone polygon index used to tag new requests"""
+    zones = await db.zones.find({}, {"_id": 0, "zone_id": 1, "boundary": 1}).sort([("created_at", 1), ("zone_id", 1)]).to_list()
+    zone_index.load(zones)
+    print(f"Zone index loaded with {len(zone_index)} zones.")
+
+async def backfill_zone_simplifications():
+    """Store pre-simplified boundaries on zones created before they were computed at write time"""
+    updated = 0
+    async for zone in db.zones.find({"simplified_boundaries": {"$exists": False}}, {"boundary": 1}):
+        if zone.get("boundary"):
+            await db.zones.update_one({"_id": zone["_id"]}, {"$set": {"simplified_boundaries": simplified_boundaries(zone["boundary"])}})
+            updated += 1
+    if updated:
+        print(f"Simplified boundaries for {updated} zones.")
+
+async def _tag_chunk(chunk, job):
+    """Locate one chunk of requests and write their zone_id with one UpdateMany per zone"""
+    located = [r for r in chunk if (r.get("location") or {}).get("coordinates")]
+    job["skipped"] += len(chunk) - len(located)
+    zone_ids = zone_index.locate_many(
+        [r["location"]["coordinates"][0] for r in located],
+        [r["location"]["coordinates"][1] for r in located]
+    )
+    by_zone = {}
+    moved_zones = set()
+    for req, zone_id in zip(located, zone_ids):
+        if zone_id is None:
+            job["unmatched"] += 1
+        elif zone_id != req["location"].get("zone_id"):
+            by_zone.setdefault(zone_id, []).append(req["_id"])
+            moved_zones.update([zone_id, req["location"].get("zone_id")])
+    ops = [UpdateMany({"_id": {"$in": ids}}, {"$set": {"location.zone_id": zone_id}}) for zone_id, ids in by_zone.items()]
+    if ops:
+        result = await db.service_requests.bulk_write(ops, ordered=False)
+        job["updated"] += result.modified_count
+        await sync_rollups({"_id": {"$in": [_id for ids in by_zone.values() for _id in ids]}})
+        tile_versions.touch(zone_ids=moved_zones)
+    job["processed"] += len(chunk)
+
+async def run_zone_tag_job(job):
+    """Stream requests in chunks and tag each with the zone containing its location"""
+    query = {} if job["retag_all"] else {"location.zone_id": {"$in": [None, ""]}}
+    started = time.perf_counter()
+    try:
+        await load_zone_index()
+        job["total"] = await db.service_requests.count_documents(query)
+        chunk = []
+        async for req in db.service_requests.find(query, {"location": 1}).batch_size(job["chunk_size"]):
+            chunk.append(req)
+            if len(chunk) >= job["chunk_size"]:
+                await _tag_chunk(chunk, job)
+                chunk = []
+                job["requests_per_second"] = round(job["processed"] / (time.perf_counter() - started), 1)
+        if chunk:
+            await _tag_chunk(chunk, job)
+        job["status"] = "completed"
+    except Exception as e:
+        print(f"Zone tagging job {job['job_id']} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    # Open request counts per zone moved; the rollups were synced chunk by chunk
+    analytics_cache.invalidate("zone_counts", "zones_geojson")
+    elapsed = time.perf_counter() - started
+    job["elapsed_seconds"] = round(elapsed, 2)
+    job["requests_per_second"] = round(job["processed"] / elapsed, 1) if elapsed > 0 else None
+    job["finished_at"] = datetime.utcnow()
+
+@router.post("/zones/tag-requests")
+async def start_zone_tagging(chunk_size: int = Body(ZONE_TAG_CHUNK_SIZE), retag_all: bool = Body(False)):
+    """Tag existing requests with their zone in the background; poll GET /agents/zones/tag-requests/{job_id}"""
+    job = {
+        "job_id": str(ObjectId()),
+        "status": "running",
+        "chunk_size": max(1, chunk_size),
+        "retag_all": retag_all,
+        "total": None,
+        "processed": 0,
+        "updated": 0,
+        "unmatched": 0,
+        "skipped": 0,
+        "requests_per_second": None,
+        "started_at": datetime.utcnow(),
+        "finished_at": None
+    }
+    ZONE_TAG_JOBS[job["job_id"]] = job
+    task = asyncio.create_task(run_zone_tag_job(job))
+    _zone_tag_tasks.add(task)
+    task.add_done_callback(_zone_tag_tasks.discard)
+    return job
+
+@router.get("/zones/tag-requests/{job_id}")
+async def get_zone_tagging_job(job_id: str):
+    job = ZONE_TAG_JOBS.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Zone tagging job not found")
+    return job
+
 @router.post("/zones")
 async def create_zone(zone: ZoneCreate):
     """Define a new municipal service zone with a GeoJSON boundary"""
-    existing = db.zones.find_one({"zone_id": zone.zone_id})
+    existing = await db.zones.find_one({"zone_id": zone.zone_id})
     if existing:
         raise HTTPException(status_code=400, detail="Zone ID already exists")
     
     new_zone = zone.dict()
+    new_zone["simplified_boundaries"] = simplified_boundaries(new_zone["boundary"])
     new_zone["created_at"] = datetime.utcnow()
     
-    db.zones.insert_one(new_zone)
+    await db.zones.insert_one(new_zone)
+    analytics_cache.invalidate(*ZONE_SCOPES)
+    tile_versions.reset()
+    await load_zone_index()
     return {"message": "Zone created successfully", "zone_id": zone.zone_id}
 
 @router.get("/zones")
 async def list_zones():
     """List all defined municipal zones"""
-    zones = list(db.zones.find({}))
+    zones = await db.zones.find({}, {"simplified_boundaries": 0}).to_list()
     for z in zones:
         z["_id"] = str(z["_id"])
     return zones
@@ -35,16 +155,47 @@ async def list_zones():
 @router.delete("/zones/{zone_id}")
 async def delete_zone(zone_id: str):
     """Remove a municipal zone"""
-    db.zones.delete_one({"zone_id": zone_id})
+    await db.zones.delete_one({"zone_id": zone_id})
+    analytics_cache.invalidate(*ZONE_SCOPES)
+    tile_versions.reset()
+    await load_zone_index()
     return {"message": "Zone deleted"}
 
 # --- Agent Management ---
 
+# Skill an agent needs for each request category; "general" agents take anything
+CATEGORY_SKILLS = {
+    "pothole": "road",
+    "signage": "road",
+    "lighting": "road",
+    "water_leak": "water",
+    "sewage": "water",
+    "trash": "waste"
+}
+
+async def load_agent_index():
+    """Build the in-memory routing index used by auto-assignment from every active agent (startup; writes upsert single agents)"""
+    agents = await db.service_agents.find(
+        {"active": True},
+        {"name": 1, "active": 1, "skills": 1, "coverage.geo_fence": 1, "schedule": 1, "current_workload": 1}
+    ).sort([("created_at", 1), ("_id", 1)]).to_list()
+    agent_index.load(agents)
+    print(f"Agent routing index loaded with {len(agent_index)} agents.")
+
+async def load_work_queues():
+    """(Re)build the per-agent queues of assigned, not yet started tasks"""
+    reqs = await db.service_requests.find(
+        {"status": QUEUED_STATUS, "assigned_agent_id": {"$ne": None}},
+        {"request_id": 1, "status": 1, "assigned_agent_id": 1, "priority": 1, "sla_breach_at": 1, "triage_metadata.high_impact_flag": 1}
+    ).to_list()
+    work_queues.load(reqs)
+    print(f"Agent work queues loaded with {len(work_queues)} tasks.")
+
 @router.post("/")
 async def create_agent(agent: AgentCreate):
     try:
         # Check if agent_code exists
-        existing = db.service_agents.find_one({"agent_code": agent.agent_code})
+        existing = await db.service_agents.find_one({"agent_code": agent.agent_code})
         if existing:
             raise HTTPException(status_code=400, detail="Agent code already exists")
         
@@ -53,8 +204,9 @@ async def create_agent(agent: AgentCreate):
         new_agent["active"] = True
         new_agent["current_workload"] = 0
         
-        result = db.service_agents.insert_one(new_agent)
-        created = db.service_agents.find_one({"_id": result.inserted_id})
+        result = await db.service_agents.insert_one(new_agent)
+        created = await db.service_agents.find_one({"_id": result.inserted_id})
+        agent_index.upsert(created)
         created["_id"] = str(created["_id"])
         return created
     except HTTPException:
@@ -66,20 +218,22 @@ async def create_agent(agent: AgentCreate):
 @router.get("/")
 async def list_agents(active_only: bool = True):
     query = {"active": True} if active_only else {}
-    agents = list(db.service_agents.find(query))
+    agents = await db.service_agents.find(query).to_list()
     for a in agents:
         a["_id"] = str(a["_id"])
-        # Calculate current workload
-        a["current_workload"] = db.service_requests.count_documents({
-            "assigned_agent_id": str(a["_id"]),
-            "status": {"$in": ["assigned", "in_progress"]}
-        })
+        # Maintained by move_workloads on every assignment/status change
+        a.setdefault("current_workload", 0)
     return agents
 
+@router.post("/workload/reconcile")
+async def reconcile_agent_workloads():
+    """Recount every agent's current_workload from the requests (also runs periodically in the background)"""
+    return {"corrected": await reconcile_workloads()}
+
 @router.post("/assign-request/{request_id}")
 async def assign_request_to_best_agent(request_id: str, agent_id: Optional[str] = None):
     """Auto-assign or manually assign a request to an agent"""
-    req = db.service_requests.find_one({"request_id": request_id})
+    req = await db.service_requests.find_one({"request_id": request_id})
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     
@@ -92,148 +246,299 @@ async def assign_request_to_best_agent(request_id: str, agent_id: Optional[str]
         # Manual assignment
         if not ObjectId.is_valid(agent_id):
             raise HTTPException(status_code=400, detail="Invalid agent ID")
-        chosen_agent = db.service_agents.find_one({"_id": ObjectId(agent_id), "active": True})
+        chosen_agent = await db.service_agents.find_one({"_id": ObjectId(agent_id), "active": True})
         if not chosen_agent:
             raise HTTPException(status_code=404, detail="Agent not found")
     else:
-        # Auto-assignment based on geo coverage + skills + shift
-        # 1. Geo Coverage
-        query = {
-            "coverage.geo_fence": {
-                "$geoIntersects": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": location["coordinates"]
-                    }
-                }
-            },
-            "active": True
-        }
-        
-        candidates = list(db.service_agents.find(query))
-        
-        # 3. Shift Availability
-        now = datetime.now()
-        current_day = now.strftime("%a") # Mon, Tue...
-        current_time = now.strftime("%H:%M")
-        
-        # Filter by Skill
-        CATEGORY_SKILLS = {
-            "pothole": "road",
-            "signage": "road",
-            "lighting": "road",
-            "water_leak": "water",
-            "sewage": "water",
-            "trash": "waste"
-        }
-        required_skill = CATEGORY_SKILLS.get(req.get("category"), "general")
-        skill_candidates = []
-        for c in candidates:
-            if required_skill in c.get("skills", []) or "general" in c.get("skills", []):
-                skill_candidates.append(c)
-        
-        if skill_candidates:
-            candidates = skill_candidates
-        
-        # Filter by Shift
-        shift_candidates = []
-        for c in candidates:
-            is_available = False
-            schedule = c.get("schedule", {})
-            if schedule.get("on_call", False):
-                is_available = True
-            else:
-                for shift in schedule.get("shifts", []):
-                    if shift["day"] == current_day:
-                        if shift["start"] <= current_time <= shift["end"]:
-                            is_available = True
-                            break
-            
-            if is_available:
-                shift_candidates.append(c)
-        
-        if shift_candidates:
-            candidates = shift_candidates
-        
-        if not candidates:
+        # Auto-assignment from the routing index: geo coverage, then skills, then shift, then workload
+        chosen_agent = agent_index.best(
+            location["coordinates"][0], location["coordinates"][1],
+            CATEGORY_SKILLS.get(req.get("category"), "general"), datetime.now()
+        )
+        if not chosen_agent:
             raise HTTPException(status_code=404, detail="No agents available matching criteria (Zone+Skill+Shift)")
-        
-        # 4. Workload Balancing
-        for c in candidates:
-            c["_workload"] = db.service_requests.count_documents({
-                "assigned_agent_id": str(c["_id"]),
-                "status": {"$in": ["assigned", "in_progress"]}
-            })
-        
-        chosen_agent = min(candidates, key=lambda x: x["_workload"])
     
-    # Update Request
-    db.service_requests.update_one(
-        {"request_id": request_id},
+    # Update Request; the version it replaced says whose workload it leaves
+    assignment = {"assigned_agent_id": str(chosen_agent["_id"]), "status": RequestStatus.ASSIGNED.value}
+    before = await db.service_requests.find_one_and_update(
+        {"request_id": request_id, "status": {"$in": ["triaged", "assigned"]}},
         {
             "$set": {
-                "assigned_agent_id": str(chosen_agent["_id"]),
-                "status": RequestStatus.ASSIGNED,
+                **assignment,
                 "workflow.current_state": RequestStatus.ASSIGNED,
                 "workflow.allowed_next": get_allowed_transitions(RequestStatus.ASSIGNED),
                 "timestamps.assigned_at": datetime.utcnow(),
                 "timestamps.updated_at": datetime.utcnow()
             }
-        }
+        },
+        projection={"status": 1, "assigned_agent_id": 1}
     )
+    if not before:
+        raise HTTPException(status_code=409, detail="Request changed status during assignment, please retry")
+    await move_workloads([(before, assignment)])
+    await sync_rollups({"request_id": request_id})
     
     # Log event
-    db.performance_logs.update_one(
-        {"request_id": request_id},
-        {"$push": {"event_stream": {
-            "type": "assigned",
-            "by": {"actor_type": "system", "actor_id": "auto_assign"},
-            "at": datetime.utcnow(),
-            "meta": {"agent_id": str(chosen_agent["_id"]), "agent_name": chosen_agent["name"]}
-        }}}
-    )
+    log_event(request_id, {
+        "type": "assigned",
+        "by": {"actor_type": "system", "actor_id": "auto_assign"},
+        "at": datetime.utcnow(),
+        "meta": {"agent_id": str(chosen_agent["_id"]), "agent_name": chosen_agent["name"]}
+    })
     
     return {"message": "Assigned successfully", "agent_id": str(chosen_agent["_id"]), "agent_name": chosen_agent["name"]}
 
+@router.post("/assign-batch")
+async def assign_batch(
+    zone_id: Optional[str] = Body(None),
+    request_ids: Optional[List[str]] = Body(None),
+    max_workload: int = Body(DEFAULT_MAX_WORKLOAD, ge=1)
+):
+    """Assign every triaged request in a zone (or from a list of IDs) in one optimized pass"""
+    if not zone_id and not request_ids:
+        raise HTTPException(status_code=400, detail="Provide zone_id or request_ids")
+    query = {"status": RequestStatus.TRIAGED}
+    if zone_id:
+        query["location.zone_id"] = zone_id
+    if request_ids:
+        query["request_id"] = {"$in": request_ids}
+    reqs = await db.service_requests.find(
+        query, {"request_id": 1, "category": 1, "location.coordinates": 1, "sla_breach_at": 1}
+    ).to_list()
+    reqs = [r for r in reqs if (r.get("location") or {}).get("coordinates")]
+
+    now = datetime.utcnow()
+    lons = [r["location"]["coordinates"][0] for r in reqs]
+    lats = [r["location"]["coordinates"][1] for r in reqs]
+    skills = [CATEGORY_SKILLS.get(r.get("category"), "general") for r in reqs]
+    hours_left = [(r["sla_breach_at"] - now).total_seconds() / 3600 if r.get("sla_breach_at") else float("nan") for r in reqs]
+    # Fence lookups and the solve take seconds on a big backlog; keep them off the event loop
+    view = await asyncio.to_thread(agent_index.batch_view, lons, lats, skills, datetime.now())
+    plan = await asyncio.to_thread(plan_dispatch, lons, lats, hours_left, view, max_workload)
+
+    assignments = []
+    if plan:
+        update = {
+            "status": RequestStatus.ASSIGNED,
+            "workflow.current_state": RequestStatus.ASSIGNED,
+            "workflow.allowed_next": get_allowed_transitions(RequestStatus.ASSIGNED),
+            "timestamps.assigned_at": now,
+            "timestamps.updated_at": now
+        }
+        await db.service_requests.bulk_write([
+            UpdateOne(
+                {"request_id": reqs[i]["request_id"], "status": RequestStatus.TRIAGED},
+                {"$set": {**update, "assigned_agent_id": view["ids"][agent]}}
+            )
+            for i, agent, _ in plan
+        ], ordered=False)
+        planned_ids = [reqs[i]["request_id"] for i, _, _ in plan]
+        await sync_rollups({"request_id": {"$in": planned_ids}})
+
+        # A request may have left triage while we planned; report only the writes that landed
+        landed = {
+            r["request_id"]: r.get("assigned_agent_id")
+            for r in await db.service_requests.find({"request_id": {"$in": planned_ids}}, {"request_id": 1, "assigned_agent_id": 1}).to_list()
+        }
+        # Every landed write took a triaged request, which counts against no one
+        await move_workloads([
+            (None, {"status": RequestStatus.ASSIGNED.value, "assigned_agent_id": view["ids"][agent]})
+            for i, agent, _ in plan if landed.get(reqs[i]["request_id"]) == view["ids"][agent]
+        ])
+        for i, agent, km in plan:
+            request_id, agent_id = reqs[i]["request_id"], view["ids"][agent]
+            if landed.get(request_id) != agent_id:
+                continue
+            assignments.append({"request_id": request_id, "agent_id": agent_id, "agent_name": view["names"][agent], "distance_km": round(km, 2)})
+            log_event(request_id, {
+                "type": "assigned",
+                "by": {"actor_type": "system", "actor_id": "batch_dispatch"},
+                "at": now,
+                "meta": {"agent_id": agent_id, "agent_name": view["names"][agent]}
+            })
+
+    assigned = {a["request_id"] for a in assignments}
+    return {
+        "requested": len(reqs),
+        "assigned": len(assignments),
+        "unassigned": [r["request_id"] for r in reqs if r["request_id"] not in assigned],
+        "assignments": assignments
+    }
+
+# Fields listed for each assigned request by GET /agents/{agent_id}; heavier ones only via ?include=
+AGENT_REQUEST_FIELDS = ["request_id", "status", "category", "priority", "location"]
+AGENT_REQUEST_INCLUDES = [
+    "description", "sub_category", "comments", "evidence", "milestones", "triage_metadata",
+    "resolution", "rating", "timestamps", "sla_breach_at", "sla_policy"
+]
+
 @router.get("/{agent_id}")
-async def get_agent(agent_id: str):
+async def get_agent(agent_id: str, response: Response, limit: int = 50, cursor: Optional[str] = None, include: Optional[str] = None):
+    """
+    Agent profile with status counts over every request ever assigned, and the
+    assigned requests newest first (cursor-paginated via X-Next-Cursor).
+    include: comma-separated extra request fields (see AGENT_REQUEST_INCLUDES)
+    """
     if not ObjectId.is_valid(agent_id):
         raise HTTPException(status_code=400, detail="Invalid ID format")
+    extra = [field.strip() for field in (include or "").split(",") if field.strip()]
+    unknown = [field for field in extra if field not in AGENT_REQUEST_INCLUDES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include fields {unknown}. Use: {AGENT_REQUEST_INCLUDES}")
     
-    agent = db.service_agents.find_one({"_id": ObjectId(agent_id)})
+    agent = await db.service_agents.find_one({"_id": ObjectId(agent_id)})
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
     agent["_id"] = str(agent["_id"])
     
-    # Get assigned requests
-    requests = list(db.service_requests.find({"assigned_agent_id": agent_id}))
+    # Status counts from one $group over the agent's requests
+    pipeline = [
+        {"$match": {"assigned_agent_id": agent_id}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]
+    counts = {row["_id"]: row["count"] for row in await (await db.service_requests.aggregate(pipeline)).to_list()}
+    agent["status_counts"] = counts
+    agent["current_workload"] = sum(counts.get(s, 0) for s in ["assigned", "in_progress"])
+    agent["completed_count"] = sum(counts.get(s, 0) for s in ["resolved", "closed"])
+    
+    # Assigned requests, one projected page at a time
+    projection = {field: 1 for field in AGENT_REQUEST_FIELDS + extra}
+    if "timestamps" not in projection:
+        projection["timestamps.created_at"] = 1     # cursor position
+    query = apply_cursor({"assigned_agent_id": agent_id}, "timestamps.created_at", cursor)
+    requests = await db.service_requests.find(query, projection).sort(keyset_sort("timestamps.created_at")).limit(limit).to_list()
+    set_next_cursor(response, requests, "timestamps.created_at", limit)
     agent["assigned_requests"] = [{
         "request_id": r["request_id"],
         "status": r["status"],
         "category": r["category"],
         "priority": r.get("priority"),
-        "location": r.get("location")
+        "location": r.get("location"),
+        **{field: r.get(field) for field in extra}
     } for r in requests]
     
-    agent["current_workload"] = len([r for r in requests if r["status"] in ["assigned", "in_progress"]])
-    agent["completed_count"] = len([r for r in requests if r["status"] in ["resolved", "closed"]])
-    
     return agent
 
 @router.get("/{agent_id}/tasks")
-async def get_agent_tasks(agent_id: str):
-    """Get active tasks for an agent"""
-    tasks = list(db.service_requests.find({
+async def get_agent_tasks(agent_id: str, response: Response, limit: int = 100, cursor: Optional[str] = None):
+    """Get active tasks for an agent, most recently assigned first (cursor-paginated via X-Next-Cursor)"""
+    query = apply_cursor({
         "assigned_agent_id": agent_id,
         "status": {"$in": ["assigned", "in_progress"]}
-    }).sort("timestamps.assigned_at", -1))
+    }, "timestamps.assigned_at", cursor)
+    tasks = await db.service_requests.find(query).sort(keyset_sort("timestamps.assigned_at")).limit(limit).to_list()
+    set_next_cursor(response, tasks, "timestamps.assigned_at", limit)
     
     for t in tasks:
         t["_id"] = str(t["_id"])
     
     return tasks
 
+@router.get("/{agent_id}/route")
+async def get_agent_route(agent_id: str, lon: Optional[float] = None, lat: Optional[float] = None):
+    """
+    Active tasks in visiting order: shortest route from (lon, lat), or the agent's
+    fence centroid, with overdue and nearly-due stops pulled forward
+    """
+    if (lon is None) != (lat is None):
+        raise HTTPException(status_code=400, detail="Provide both lon and lat, or neither")
+    tasks = await db.service_requests.find(
+        {"assigned_agent_id": agent_id, "status": {"$in": ["assigned", "in_progress"]}},
+        {"request_id": 1, "status": 1, "category": 1, "priority": 1, "location.coordinates": 1, "sla_breach_at": 1}
+    ).to_list()
+    located = [t for t in tasks if (t.get("location") or {}).get("coordinates")]
+    start = (lon, lat) if lon is not None else agent_index.center(agent_id)
+
+    now = datetime.utcnow()
+    order, legs = plan_route(
+        [t["location"]["coordinates"][0] for t in located],
+        [t["location"]["coordinates"][1] for t in located],
+        [(t["sla_breach_at"] - now).total_seconds() / 3600 if t.get("sla_breach_at") else float("nan") for t in located],
+        start
+    )
+    stops, total_km = [], 0.0
+    for i, leg in zip(order, legs):
+        t = located[i]
+        total_km += leg
+        stops.append({
+            "request_id": t["request_id"],
+            "status": t["status"],
+            "category": t.get("category"),
+            "priority": t.get("priority"),
+            "coordinates": t["location"]["coordinates"],
+            "sla_breach_at": t.get("sla_breach_at"),
+            "leg_km": round(leg, 2),
+            "cumulative_km": round(total_km, 2)
+        })
+    return {
+        "agent_id": agent_id,
+        "start": list(start) if start else None,
+        "total_km": round(total_km, 2),
+        "stops": stops,
+        # Tasks without coordinates cannot be routed; listed so none go missing
+        "unrouted": [t["request_id"] for t in tasks if not (t.get("location") or {}).get("coordinates")]
+    }
+
+@router.post("/{agent_id}/next")
+async def claim_next_task(agent_id: str):
+    """
+    Start the agent's most urgent assigned task (SLA breach time, priority and
+    high-impact flag combined). The queue lives in this process; when it has
+    nothing for the agent (cold after a restart, or the assignments went through
+    another worker) the earliest stored effective deadline (queue_due_at, the
+    same key the queue sorts on) is claimed from the database.
+    """
+    now = datetime.utcnow()
+    start_work = {"$set": {
+        "status": RequestStatus.IN_PROGRESS,
+        "workflow.current_state": RequestStatus.IN_PROGRESS,
+        "workflow.allowed_next": get_allowed_transitions(RequestStatus.IN_PROGRESS),
+        "timestamps.updated_at": now
+    }}
+    claimed = None
+    while claimed is None:
+        popped = work_queues.pop(agent_id)
+        if popped is None:
+            break
+        request_id, key = popped
+        try:
+            claimed = await db.service_requests.find_one_and_update(
+                {"request_id": request_id, "assigned_agent_id": agent_id, "status": QUEUED_STATUS},
+                start_work,
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception:
+            work_queues.requeue(agent_id, request_id, key)
+            raise
+        if claimed is None:
+            # The queue was behind a write that has not been synced yet; sync it and take the next task
+            await sync_rollups({"request_id": request_id})
+
+    if claimed is None:
+        queued = {"assigned_agent_id": agent_id, "status": QUEUED_STATUS}
+        # Deadlines first: an ascending sort would put requests without one (null) ahead of them
+        claimed = await db.service_requests.find_one_and_update(
+            {**queued, "queue_due_at": {"$ne": None}}, start_work,
+            sort=[("queue_due_at", 1), ("_id", 1)], return_document=ReturnDocument.AFTER
+        ) or await db.service_requests.find_one_and_update(
+            queued, start_work, sort=[("_id", 1)], return_document=ReturnDocument.AFTER
+        )
+        if claimed is None:
+            raise HTTPException(status_code=404, detail="No assigned tasks waiting")
+
+    await sync_rollups({"_id": claimed["_id"]})
+    log_event(claimed["request_id"], {
+        "type": "in_progress",
+        "by": {"actor_type": "agent", "actor_id": agent_id},
+        "at": now,
+        "meta": {"claimed_from_queue": True}
+    })
+    claimed["_id"] = str(claimed["_id"])
+    # From this process's queue, so no count query per claim; assignments made through
+    # other workers show up once synced here
+    return {"task": claimed, "remaining": work_queues.queued(agent_id)}
+
 @router.patch("/{agent_id}")
 async def update_agent(agent_id: str, active: Optional[bool] = Body(None)):
     """Update agent status"""
@@ -244,6 +549,10 @@ async def update_agent(agent_id: str, active: Optional[bool] = Body(None)):
     if active is not None:
         update["$set"]["active"] = active
     
-    db.service_agents.update_one({"_id": ObjectId(agent_id)}, update)
+    updated = await db.service_agents.find_one_and_update(
+        {"_id": ObjectId(agent_id)}, update, return_document=ReturnDocument.AFTER
+    )
+    if updated:
+        agent_index.upsert(updated)
     
     return {"message": "Agent updated"}
@@ -1,30 +1,34 @@
-from fastapi import APIRouter, Query, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, Query, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import io
+import os
+import math
 import csv
-import time
+import zlib
+import json
+import hashlib
+import numpy as np
 from bson import ObjectId
 from app.database import get_database
+from app.utils.common import OPEN_STATUSES
+from app.utils.sla import refresh_sla_deadlines
+from app.utils.cache import AsyncLRUCache, analytics_cache
+from app.utils import rollups
+from app.utils.sketches import DDSketch
+from app.utils.forecast import forecast
+from app.utils.clusters import request_clusters
+from app.utils.hotspots import request_hotspots, HOTSPOT_MAX_WINDOW_DAYS
+from app.utils.zones import ZONE_SIMPLIFY_TOLERANCES, pick_boundary, zoom_tolerance
+from app.utils.tiles import (
+    TILE_EXTENT, TILE_MAX_ZOOM, tile_bounds, valid_tile, project_to_tile, zone_tile_rings, encode_points, encode_tile,
+    tile_versions
+)
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 db = get_database()
 
-# Simple Cache
-CACHE = {}
-CACHE_TTL = 300 # 5 minutes
-
-def get_cached(key: str):
-    if key in CACHE:
-        val, ts = CACHE[key]
-        if time.time() - ts < CACHE_TTL:
-            return val
-    return None
-
-def set_cache(key: str, value: Any):
-    CACHE[key] = (value, time.time())
-
 def get_base_filters(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
@@ -67,12 +71,56 @@ async def get_kpis(
     priority: Optional[str] = None,
     agent_id: Optional[str] = None
 ):
+    cache_key = ("kpis", start_date, end_date, zone, category, priority, agent_id)
     match_query = get_base_filters(start_date, end_date, zone, category, priority, agent_id)
-    cache_key = f"kpis_{str(match_query)}"
-    
-    cached = get_cached(cache_key)
-    if cached: return cached
+    if not rollups.rollups_ready:
+        return await analytics_cache.get_or_compute(cache_key, lambda: compute_kpis(match_query))
+    return await analytics_cache.get_or_compute(
+        cache_key, lambda: compute_rollup_kpis(start_date, end_date, zone, category, priority, agent_id)
+    )
+
+async def compute_rollup_kpis(start_date=None, end_date=None, zone=None, category=None, priority=None, agent_id=None):
+    """Same response as compute_kpis(), with the counts read from kpi_rollups"""
+    totals = await rollups.kpi_totals(start_date, end_date, zone, category, priority, agent_id)
+    match_query = get_base_filters(start_date, end_date, zone, category, priority, agent_id)
+    return kpis_response(totals, await sla_counts(match_query))
+
+async def sla_counts(match_query: dict) -> dict:
+    """At-risk/breached open requests right now; time-dependent, so never rolled up"""
+    now = datetime.utcnow()
+    pipeline = [
+        {"$match": {**match_query, "status": {"$in": OPEN_STATUSES}, "sla_target_at": {"$lte": now}}},
+        {"$group": {
+            "_id": None,
+            "at_risk": {"$sum": {"$cond": [{"$gt": ["$sla_breach_at", now]}, 1, 0]}},
+            "breached": {"$sum": {"$cond": [{"$lte": ["$sla_breach_at", now]}, 1, 0]}},
+            "critical_breached": {"$sum": {"$cond": [{"$and": [{"$eq": ["$priority", "critical"]}, {"$lte": ["$sla_breach_at", now]}]}, 1, 0]}}
+        }}
+    ]
+    result = await (await db.service_requests.aggregate(pipeline)).to_list()
+    return result[0] if result else {"at_risk": 0, "breached": 0, "critical_breached": 0}
+
+def kpis_response(totals: dict, sla: dict) -> dict:
+    """Shape rollup totals like compute_kpis()"""
+    open_count = rollups.open_count(totals)
+    avg_rating = totals["rating_sum"] / totals["rating_count"] if totals["rating_count"] else 0
+    return {
+        "total_requests": totals["count"],
+        "open_requests": open_count,
+        "resolved_requests": totals["status"].get("resolved", 0) + totals["status"].get("closed", 0),
+        "at_risk_count": sla["at_risk"],
+        "breached_count": sla["breached"],
+        "critical_breach_count": sla["critical_breached"],
+        "sla_breach_percentage": round((sla["breached"] / open_count * 100) if open_count > 0 else 0, 1),
+        "avg_rating": round(avg_rating, 1),
+        "by_status": totals["status"],
+        "by_category": totals["category"],
+        "by_zone": {zone or "Unknown": count for zone, count in totals["zone"].items()},
+        "rating_distribution": {str(stars): count for stars, count in sorted(totals["rating"].items())}
+    }
 
+async def compute_kpis(match_query: dict):
+    """KPIs straight from service_requests; used until rollups are built and as their reference"""
     now = datetime.utcnow()
     pipeline = [
         {"$match": match_query},
@@ -95,24 +143,18 @@ async def get_kpis(
                 {"$sort": {"_id": 1}}
             ],
             "sla_data": [
-                {"$match": {"status": {"$in": ["new", "triaged", "assigned", "in_progress"]}}},
-                {"$project": {
-                    "priority": 1,
-                    "age_hours": {"$divide": [{"$subtract": [now, "$timestamps.created_at"]}, 3600000]},
-                    "target": {"$ifNull": ["$sla_policy.target_hours", 72]},
-                    "breach": {"$ifNull": ["$sla_policy.breach_threshold_hours", 120]}
-                }},
+                {"$match": {"status": {"$in": OPEN_STATUSES}, "sla_target_at": {"$lte": now}}},
                 {"$group": {
                     "_id": None,
-                    "at_risk": {"$sum": {"$cond": [{"$and": [{"$gte": ["$age_hours", "$target"]}, {"$lt": ["$age_hours", "$breach"]}]}, 1, 0]}},
-                    "breached": {"$sum": {"$cond": [{"$gte": ["$age_hours", "$breach"]}, 1, 0]}},
-                    "critical_breached": {"$sum": {"$cond": [{"$and": [{"$eq": ["$priority", "critical"]}, {"$gte": ["$age_hours", "$breach"]}]}, 1, 0]}}
+                    "at_risk": {"$sum": {"$cond": [{"$gt": ["$sla_breach_at", now]}, 1, 0]}},
+                    "breached": {"$sum": {"$cond": [{"$lte": ["$sla_breach_at", now]}, 1, 0]}},
+                    "critical_breached": {"$sum": {"$cond": [{"$and": [{"$eq": ["$priority", "critical"]}, {"$lte": ["$sla_breach_at", now]}]}, 1, 0]}}
                 }}
             ]
         }}
     ]
     
-    aggr_results = list(db.service_requests.aggregate(pipeline))[0]
+    aggr_results = (await (await db.service_requests.aggregate(pipeline)).to_list())[0]
     overall = aggr_results["overall"][0] if aggr_results["overall"] else {"total": 0, "open": 0, "resolved": 0, "avg_rating": 0}
     sla = aggr_results["sla_data"][0] if aggr_results["sla_data"] else {"at_risk": 0, "breached": 0, "critical_breached": 0}
     
@@ -130,9 +172,144 @@ async def get_kpis(
         "by_zone": {r["_id"] or "Unknown": r["count"] for r in aggr_results["by_zone"]},
         "rating_distribution": {str(int(r["_id"])): r["count"] for r in aggr_results["rating_dist"]}
     }
-    set_cache(cache_key, res)
     return res
 
+# Trends: per-bucket event counts from trend_rollups (kpi_rollups when the
+# filters need more dimensions than one), plus a short forecast
+TRENDS_METRICS = ["created", "resolved", "breached"]
+TRENDS_GROUPS = {"none": None, "zone": "zone_id", "category": "category"}
+TRENDS_DIMENSION_OF = {field: group for group, field in TRENDS_GROUPS.items() if field}
+KPI_ROLLUP_EVENT_FIELDS = {"created": "$count", "resolved": "$resolved", "breached": "$breached"}
+TRENDS_SEASON = {"hour": 168, "day": 7}                  # weekly cycle
+TRENDS_DEFAULT_SPAN = {"hour": timedelta(days=7), "day": timedelta(days=90)}
+TRENDS_DEFAULT_HORIZON = {"hour": 24, "day": 14}
+TRENDS_MAX_BUCKETS = 1000                                # ~2.7 years daily, ~6 weeks hourly
+TRENDS_MAX_HORIZON = 336
+
+def naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    if moment and moment.tzinfo:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+@router.get("/trends")
+async def get_trends(
+    granularity: str = "day",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    group_by: str = "none",
+    zone: Optional[str] = None,
+    category: Optional[str] = None,
+    priority: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    horizon: Optional[int] = Query(None, ge=0, le=TRENDS_MAX_HORIZON)
+):
+    """
+    Created/resolved/breached counts per hour or day, optionally one series
+    per zone or category, with a forecast of the next `horizon` buckets.
+    Only whole buckets are returned: the series end where the current one starts.
+    """
+    if granularity not in rollups.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {list(rollups.GRANULARITIES)}")
+    if group_by not in TRENDS_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {list(TRENDS_GROUPS)}")
+    if not rollups.rollups_ready:
+        raise HTTPException(status_code=503, detail="KPI rollups are still being built, try again shortly")
+
+    step = rollups.GRANULARITIES[granularity]
+    current = rollups.truncate(datetime.utcnow(), granularity)
+    end = min(rollups.truncate(naive_utc(end_date), granularity) + step, current) if end_date else current
+    start = rollups.truncate(naive_utc(start_date), granularity) if start_date else end - TRENDS_DEFAULT_SPAN[granularity]
+    buckets = (end - start) // step
+    if buckets <= 0:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date and the current bucket")
+    if buckets > TRENDS_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"At most {TRENDS_MAX_BUCKETS} buckets per query; use a coarser granularity")
+    horizon = TRENDS_DEFAULT_HORIZON[granularity] if horizon is None else horizon
+
+    dims = {"zone_id": zone, "category": category, "priority": priority, "agent_id": agent_id}
+    dims = {field: value for field, value in dims.items() if value}
+    cache_key = ("trends", granularity, start, end, group_by, tuple(sorted(dims.items())), horizon)
+    return await analytics_cache.get_or_compute(
+        cache_key, lambda: compute_trends(granularity, start, buckets, group_by, dims, horizon)
+    )
+
+def trend_source(granularity: str, group_by: str, dims: dict) -> tuple:
+    """(collection, $match filter, series key expression, {metric: field}) able to answer a trends query"""
+    group_field = TRENDS_GROUPS[group_by]
+    # Series over one dimension, optionally narrowed to one of its keys, are in trend_rollups
+    if group_field and set(dims) <= {group_field}:
+        match = {"granularity": granularity, "dimension": group_by}
+        if dims:
+            match["key"] = dims[group_field]
+        return db.trend_rollups, match, "$key", None
+    if not group_field and len(dims) <= 1 and set(dims) <= {"zone_id", "category"}:
+        match = {"granularity": granularity, "dimension": "all"}
+        if dims:
+            (field, value), = dims.items()
+            match = {"granularity": granularity, "dimension": TRENDS_DIMENSION_OF[field], "key": value}
+        return db.trend_rollups, match, None, None
+    group_key = f"${group_field}" if group_field else None
+    return db.kpi_rollups, {"granularity": granularity, **dims}, group_key, KPI_ROLLUP_EVENT_FIELDS
+
+async def compute_trends(granularity: str, start: datetime, buckets: int, group_by: str, dims: dict, horizon: int) -> dict:
+    step = rollups.GRANULARITIES[granularity]
+    step_ms = int(step.total_seconds() * 1000)
+    collection, match, group_key, fields = trend_source(granularity, group_by, dims)
+    fields = fields or {metric: f"${metric}" for metric in TRENDS_METRICS}
+    pipeline = [
+        {"$match": {**match, "bucket": {"$gte": start, "$lt": start + buckets * step}}},
+        # Per (series, bucket index) sums, then one document of parallel arrays per series
+        {"$group": {
+            "_id": {"key": group_key, "i": {"$toLong": {"$divide": [{"$subtract": ["$bucket", start]}, step_ms]}}},
+            **{metric: {"$sum": field} for metric, field in fields.items()}
+        }},
+        {"$group": {
+            "_id": "$_id.key",
+            "i": {"$push": "$_id.i"},
+            **{metric: {"$push": f"${metric}"} for metric in TRENDS_METRICS}
+        }}
+    ]
+    groups = await (await collection.aggregate(pipeline)).to_list()
+    if not groups and group_by == "none":
+        groups = [{"_id": None, "i": [], **{metric: [] for metric in TRENDS_METRICS}}]
+
+    # counts[series, metric, bucket]
+    counts = np.zeros((len(groups), len(TRENDS_METRICS), buckets), dtype=np.int64)
+    for row, group in enumerate(groups):
+        index = np.asarray(group["i"], dtype=np.int64)
+        for m, metric in enumerate(TRENDS_METRICS):
+            counts[row, m, index] = group[metric]
+    predicted = forecast(counts.reshape(-1, buckets), horizon, TRENDS_SEASON[granularity]).reshape(len(groups), len(TRENDS_METRICS), horizon)
+    predicted = np.round(predicted, 1)
+
+    order = np.argsort(-counts[:, 0, :].sum(axis=1), kind="stable")
+    series = []
+    for row in order:
+        key = groups[row]["_id"]
+        series.append({
+            "key": "all" if group_by == "none" else (key or "Unknown"),
+            **{metric: counts[row, m].tolist() for m, metric in enumerate(TRENDS_METRICS)},
+            "forecast": {metric: predicted[row, m].tolist() for m, metric in enumerate(TRENDS_METRICS)}
+        })
+    return {
+        "granularity": granularity,
+        "group_by": group_by,
+        "buckets": [(start + i * step).isoformat() for i in range(buckets)],
+        "forecast_buckets": [(start + (buckets + i) * step).isoformat() for i in range(horizon)],
+        "series": series
+    }
+
+@router.post("/rollups/rebuild")
+async def rebuild_rollups():
+    """Recompute kpi_rollups from service_requests (e.g. after bulk imports that bypass the API)"""
+    await rollups.rebuild_kpi_rollups()
+    return {"message": "KPI rollups rebuilt"}
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss/eviction counters for sizing the analytics cache"""
+    return analytics_cache.stats()
+
 @router.get("/stats")
 async def get_basic_stats():
     """Basic aggregations for legacy dashboard compatibility"""
@@ -142,46 +319,66 @@ async def get_basic_stats():
             "by_category": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}]
         }}
     ]
-    results = list(db.service_requests.aggregate(pipeline))[0]
+    results = (await (await db.service_requests.aggregate(pipeline)).to_list())[0]
     return {
         "by_status": {r["_id"]: r["count"] for r in results["by_status"]},
         "by_category": {r["_id"]: r["count"] for r in results["by_category"]}
     }
 
-@router.get("/heatmap")
-async def get_heatmap_feed(category: Optional[str] = None, priority: Optional[str] = None, include_closed: bool = False):
-    """GeoJSON FeatureCollection with normalized weights and priority info"""
-    # Note: cache disabled for debugging - can re-enable later
-    # cache_key = f"heatmap_{category}_{priority}_{include_closed}"
-    # cached = get_cached(cache_key)
-    # if cached: return cached
+# Heatmap weights: priority factor scaled up by age, capped at 3x after two weeks
+HEATMAP_PRIORITY_WEIGHTS = {"critical": 1.5, "high": 1.2, "medium": 0.8, "low": 0.5}
+HEATMAP_DEFAULT_WEIGHT = 0.8
+HEATMAP_AGE_SCALE_HOURS = 168
+HEATMAP_MAX_AGE_FACTOR = 2.0
+PRIORITY_RANK = ["low", "medium", "high", "critical"]
+
+# Grid mode bins requests into square lon/lat cells aligned to the map's zoom
+# level: a 256px slippy-map tile is split into this many cells per side
+GRID_CELLS_PER_TILE = 8
+GRID_MAX_ZOOM = 20
+
+def heatmap_weight(priority: str, age_hours: float) -> float:
+    prio_weight = HEATMAP_PRIORITY_WEIGHTS.get(priority, HEATMAP_DEFAULT_WEIGHT)
+    return prio_weight * (1 + min(age_hours / HEATMAP_AGE_SCALE_HOURS, HEATMAP_MAX_AGE_FACTOR))
 
+def grid_cell_degrees(zoom: int) -> float:
+    return 360 / (2 ** zoom) / GRID_CELLS_PER_TILE
+
+def parse_bbox(bbox: Optional[str]):
+    """'min_lon,min_lat,max_lon,max_lat' -> tuple of floats, or None"""
+    if not bbox:
+        return None
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(v) for v in bbox.split(",")]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    if min_lon >= max_lon or min_lat >= max_lat:
+        raise HTTPException(status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    return max(min_lon, -180.0), max(min_lat, -90.0), min(max_lon, 180.0), min(max_lat, 90.0)
+
+def heatmap_query(category, priority, include_closed, bbox=None) -> dict:
     # By default, only show open requests. If include_closed is True, show all.
-    if include_closed:
-        query = {}  # No status filter - show all requests
-        print(f"Heatmap query: ALL requests (include_closed={include_closed})")
-    else:
-        query = {"status": {"$in": ["new", "triaged", "assigned", "in_progress"]}}
-        print(f"Heatmap query: OPEN requests only (include_closed={include_closed})")
-    
-    if category: 
+    query = {} if include_closed else {"status": {"$in": OPEN_STATUSES}}
+    if category:
         query["category"] = category
-        print(f"  - Filtering by category: {category}")
-    if priority: 
+    if priority:
         query["priority"] = priority
-        print(f"  - Filtering by priority: {priority}")
-    
-    requests = list(db.service_requests.find(query))
-    print(f"  - Found {len(requests)} requests matching query")
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        query["location"] = {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [[
+            [min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat], [min_lon, min_lat]
+        ]]}}}
+    return query
+
+async def heatmap_points(query: dict) -> dict:
+    """One Feature per request"""
+    projection = {"_id": 0, "request_id": 1, "category": 1, "status": 1, "priority": 1, "location": 1, "timestamps.created_at": 1}
     now = datetime.utcnow()
     features = []
-    
-    for req in requests:
+    async for req in db.service_requests.find(query, projection):
         created = req["timestamps"].get("created_at", now)
         age_hours = (now - created).total_seconds() / 3600
         prio = req.get("priority", "medium")
-        prio_weight = {"critical": 1.5, "high": 1.2, "medium": 0.8, "low": 0.5}.get(prio, 0.8)
-        weight = prio_weight * (1 + min(age_hours / 168, 2.0))
         
         features.append({
             "type": "Feature",
@@ -190,30 +387,127 @@ async def get_heatmap_feed(category: Optional[str] = None, priority: Optional[st
                 "category": req["category"],
                 "status": req["status"],
                 "priority": prio,
-                "weight": round(weight, 2),
+                "weight": round(heatmap_weight(prio, age_hours), 2),
                 "age_hours": round(age_hours, 1)
             },
             "geometry": req["location"]
         })
     
-    res = {"type": "FeatureCollection", "features": features}
-    print(f"  - Returning {len(features)} features in GeoJSON")
-    # Cache disabled for debugging
-    # set_cache(cache_key, res)
-    return res
+    return {"type": "FeatureCollection", "features": features}
+
+async def heatmap_grid(query: dict, zoom: int) -> dict:
+    """
+    One Feature per occupied grid cell, binned by the database: summed weight,
+    request count and per-priority counts, placed at the cell's centroid
+    """
+    now = datetime.utcnow()
+    cell_deg = grid_cell_degrees(zoom)
+    lon = {"$arrayElemAt": ["$location.coordinates", 0]}
+    lat = {"$arrayElemAt": ["$location.coordinates", 1]}
+    age_hours = {"$divide": [{"$subtract": [now, {"$ifNull": ["$timestamps.created_at", now]}]}, 3600000]}
+    prio_weight = {"$switch": {
+        "branches": [{"case": {"$eq": ["$priority", p]}, "then": w} for p, w in HEATMAP_PRIORITY_WEIGHTS.items()],
+        "default": HEATMAP_DEFAULT_WEIGHT
+    }}
+    pipeline = [
+        {"$match": {**query, "location.coordinates": {"$exists": True}}},
+        {"$project": {
+            "_id": 0,
+            "priority": 1,
+            "lon": lon,
+            "lat": lat,
+            "weight": {"$multiply": [prio_weight, {"$add": [1, {"$min": [{"$divide": [age_hours, HEATMAP_AGE_SCALE_HOURS]}, HEATMAP_MAX_AGE_FACTOR]}]}]}
+        }},
+        {"$group": {
+            "_id": {"x": {"$floor": {"$divide": ["$lon", cell_deg]}}, "y": {"$floor": {"$divide": ["$lat", cell_deg]}}},
+            "count": {"$sum": 1},
+            "weight": {"$sum": "$weight"},
+            "lon": {"$avg": "$lon"},
+            "lat": {"$avg": "$lat"},
+            **{p: {"$sum": {"$cond": [{"$eq": ["$priority", p]}, 1, 0]}} for p in PRIORITY_RANK}
+        }}
+    ]
+    features = []
+    async for cell in await db.service_requests.aggregate(pipeline):
+        priorities = {p: cell[p] for p in PRIORITY_RANK if cell[p]}
+        top = max(priorities, key=PRIORITY_RANK.index) if priorities else "medium"
+        features.append({
+            "type": "Feature",
+            "properties": {
+                "cell": f"{zoom}/{int(cell['_id']['x'])}/{int(cell['_id']['y'])}",
+                "count": cell["count"],
+                "weight": round(cell["weight"], 2),
+                "priority": top,
+                "priorities": priorities
+            },
+            "geometry": {"type": "Point", "coordinates": [round(cell["lon"], 6), round(cell["lat"], 6)]}
+        })
+    
+    return {"type": "FeatureCollection", "mode": "grid", "zoom": zoom, "cell_deg": cell_deg, "features": features}
+
+@router.get("/heatmap")
+async def get_heatmap_feed(
+    category: Optional[str] = None,
+    priority: Optional[str] = None,
+    include_closed: bool = False,
+    mode: str = Query("points", pattern="^(points|grid)$"),
+    zoom: int = Query(13, ge=0, le=GRID_MAX_ZOOM),
+    bbox: Optional[str] = None
+):
+    """
+    GeoJSON FeatureCollection with normalized weights and priority info.
+    mode=grid aggregates requests into zoom-sized cells so the payload tracks
+    the number of visible cells instead of the number of requests.
+    """
+    bounds = parse_bbox(bbox)
+    if bounds and mode == "grid":
+        # Snap the viewport outward to whole cells so edge cells are complete
+        # and small pans reuse the cached result
+        tile_deg = grid_cell_degrees(zoom) * GRID_CELLS_PER_TILE
+        bounds = (
+            max(math.floor(bounds[0] / tile_deg) * tile_deg, -180.0),
+            max(math.floor(bounds[1] / tile_deg) * tile_deg, -90.0),
+            min(math.ceil(bounds[2] / tile_deg) * tile_deg, 180.0),
+            min(math.ceil(bounds[3] / tile_deg) * tile_deg, 90.0)
+        )
+    query = heatmap_query(category, priority, include_closed, bounds)
+    if mode == "points":
+        return await heatmap_points(query)
+    cache_key = ("heatmap_grid", category, priority, include_closed, zoom, bounds)
+    return await analytics_cache.get_or_compute(cache_key, lambda: heatmap_grid(query, zoom))
+
+def json_etag(payload) -> tuple:
+    """Compact JSON body plus a strong ETag over exactly those bytes"""
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    return body, '"' + hashlib.sha1(body).hexdigest() + '"'
 
 @router.get("/zones/geojson")
-async def get_zone_summaries():
-    """Return zones as GeoJSON with aggregated request counts for choropleth mapping"""
+async def get_zone_summaries(
+    request: Request,
+    tolerance: Optional[float] = Query(None, ge=0),
+    zoom: Optional[int] = Query(None, ge=0, le=TILE_MAX_ZOOM)
+):
+    """
+    Return zones as GeoJSON with aggregated request counts for choropleth mapping.
+    Pass tolerance (degrees) or the map zoom to get pre-simplified boundaries;
+    unchanged responses revalidate with If-None-Match -> 304.
+    """
+    if tolerance is None:
+        tolerance = zoom_tolerance(zoom) if zoom is not None else 0
+    # Snap to the stored level that will be served so equivalent requests share a cache entry
+    level = max([t for t in ZONE_SIMPLIFY_TOLERANCES if t <= tolerance], default=0)
+    body, etag = await analytics_cache.get_or_compute(("zones_geojson", level), lambda: zone_summaries(level))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def zone_summaries(tolerance: float) -> tuple:
     # Fetch all defined zones
-    zones = list(db.zones.find({}))
+    zones = await load_zones()
     
     # Aggregate requests by zone
-    pipeline = [
-        {"$match": {"status": {"$in": ["new", "triaged", "assigned", "in_progress"]}}},
-        {"$group": {"_id": "$location.zone_id", "count": {"$sum": 1}}}
-    ]
-    zone_counts = {r["_id"]: r["count"] for r in db.service_requests.aggregate(pipeline)}
+    zone_counts = await open_request_counts_by_zone()
     
     features = []
     for zone in zones:
@@ -226,33 +520,189 @@ async def get_zone_summaries():
                 "request_count": zone_counts.get(zone_id, 0),
                 "density": "high" if zone_counts.get(zone_id, 0) > 10 else "medium" if zone_counts.get(zone_id, 0) > 3 else "low"
             },
-            "geometry": zone.get("boundary")
+            "geometry": pick_boundary(zone, tolerance)
         })
     
-    return {"type": "FeatureCollection", "features": features}
+    return json_etag({"type": "FeatureCollection", "features": features})
+
+# Tiles are keyed by their own version (see TileVersions), so a write only
+# makes the tiles showing it unreachable and they simply age out of the LRU
+TILE_CACHE_MAX_ENTRIES = int(os.getenv("TILE_CACHE_MAX_ENTRIES", "4096"))
+tile_cache = AsyncLRUCache(max_entries=TILE_CACHE_MAX_ENTRIES)
+TILE_MEDIA_TYPE = "application/x-cst-tile"
+# Below this zoom a tile spans too much of the globe for a $geoWithin box
+# (its geodesic edges sag away from the tile's latitude lines); scan instead
+TILE_GEO_FILTER_MIN_ZOOM = 4
+
+async def load_zones() -> list:
+    return await analytics_cache.get_or_compute(
+        ("zones",),
+        lambda: db.zones.find({}, {"_id": 0, "zone_id": 1, "name": 1, "boundary": 1, "simplified_boundaries": 1}).to_list()
+    )
+
+async def open_request_counts_by_zone() -> dict:
+    async def compute():
+        pipeline = [
+            {"$match": {"status": {"$in": OPEN_STATUSES}}},
+            {"$group": {"_id": "$location.zone_id", "count": {"$sum": 1}}}
+        ]
+        return {r["_id"]: r["count"] async for r in await db.service_requests.aggregate(pipeline)}
+    return await analytics_cache.get_or_compute(("zone_counts",), compute)
+
+async def build_tile(z: int, x: int, y: int, category, priority, include_closed) -> tuple:
+    """(encoded tile, ids of the zones it outlines)"""
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+    bounds = None
+    if z >= TILE_GEO_FILTER_MIN_ZOOM:
+        # Pad the query box; points outside the tile are dropped after projection
+        pad = (max_lat - min_lat) / 4
+        bounds = (min_lon - pad, max(min_lat - pad, -90.0), max_lon + pad, min(max_lat + pad, 90.0))
+    query = heatmap_query(category, priority, include_closed, bounds)
+    projection = {"_id": 0, "priority": 1, "location.coordinates": 1, "timestamps.created_at": 1}
+
+    now = datetime.utcnow()
+    lons, lats, priorities, weights = [], [], [], []
+    async for req in db.service_requests.find(query, projection):
+        coords = (req.get("location") or {}).get("coordinates")
+        if not coords:
+            continue
+        created = req.get("timestamps", {}).get("created_at") or now
+        prio = req.get("priority", "medium")
+        lons.append(coords[0])
+        lats.append(coords[1])
+        priorities.append(prio)
+        weights.append(heatmap_weight(prio, (now - created).total_seconds() / 3600))
+
+    pixels = project_to_tile(lons, lats, z, x, y)
+    inside = np.all((pixels >= 0) & (pixels < TILE_EXTENT), axis=1) if len(pixels) else np.zeros(0, dtype=bool)
+    points = encode_points(pixels[inside], [p for p, keep in zip(priorities, inside) if keep], np.asarray(weights)[inside])
+
+    zones = []
+    counts = await open_request_counts_by_zone()
+    for zone in await load_zones():
+        rings = zone_tile_rings(pick_boundary(zone, zoom_tolerance(z)), z, x, y)
+        if rings:
+            zones.append((zone.get("zone_id"), zone.get("name"), counts.get(zone.get("zone_id"), 0), rings))
+
+    return encode_tile(z, x, y, points, zones), [zone[0] for zone in zones]
+
+@router.get("/tiles/{z}/{x}/{y}")
+async def get_tile(
+    z: int, x: int, y: int,
+    request: Request,
+    category: Optional[str] = None,
+    priority: Optional[str] = None,
+    include_closed: bool = False
+):
+    """
+    Request points and zone outlines for one XYZ map tile in the compact
+    binary layout documented in app/utils/tiles.py. Tiles carry an ETag
+    derived from their own data version (points in the tile, counts of the
+    zones it outlines), so tiles no write touched revalidate with a 304.
+    """
+    if not valid_tile(z, x, y):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+    async def build():
+        # Snapshot first: a zone count moving while the tile is built must not be marked as included
+        zone_versions = dict(tile_versions.zones)
+        body, zone_ids = await build_tile(z, x, y, category, priority, include_closed)
+        return body, zone_ids, tile_versions.zone_version(zone_ids, zone_versions)
+
+    cache_key = (tile_versions.cell(z, x, y), z, x, y, category, priority, include_closed)
+    body, zone_ids, zones_version = await tile_cache.get_or_compute(cache_key, build)
+    if zones_version != tile_versions.zone_version(zone_ids):
+        # The points are current but an outlined zone's count moved since the tile was built
+        tile_cache.discard(cache_key)
+        body, zone_ids, zones_version = await tile_cache.get_or_compute(cache_key, build)
+
+    version = f"{cache_key[0]}.{zones_version}"
+    etag = f'"{version}-{z}-{x}-{y}-{category or ""}-{priority or ""}-{int(include_closed)}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Data-Version": version}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=TILE_MEDIA_TYPE, headers=headers)
+
+async def load_request_clusters():
+    """(Re)build the staff-map cluster index from every open request"""
+    cursor = db.service_requests.find(
+        {"status": {"$in": OPEN_STATUSES}},
+        {"_id": 0, "request_id": 1, "location.coordinates": 1, "priority": 1, "category": 1}
+    )
+    request_clusters.load([
+        (r["request_id"], (r.get("location") or {}).get("coordinates"), r.get("priority"), r.get("category"))
+        async for r in cursor
+    ])
+    print(f"Cluster index loaded with {len(request_clusters)} open requests.")
+
+@router.get("/clusters")
+async def get_clusters(
+    zoom: int = Query(..., ge=0, le=TILE_MAX_ZOOM),
+    bbox: Optional[str] = None,
+    category: Optional[str] = None,
+    priority: Optional[str] = None
+):
+    """Open requests clustered for the given map zoom; single requests come back as points"""
+    features = request_clusters.clusters(parse_bbox(bbox), zoom, priority, category)
+    return {"type": "FeatureCollection", "zoom": zoom, "features": features}
+
+@router.get("/clusters/expand")
+async def expand_cluster(cluster_id: str, category: Optional[str] = None, priority: Optional[str] = None):
+    """Children of a cluster at the zoom where it first splits, for click-to-zoom"""
+    expansion_zoom, features = request_clusters.expand(cluster_id, priority, category)
+    if features is None:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    return {"type": "FeatureCollection", "cluster_id": cluster_id, "expansion_zoom": expansion_zoom, "features": features}
+
+async def load_hotspot_index():
+    """(Re)build the hotspot index from requests created within the longest hotspot window"""
+    cursor = db.service_requests.find(
+        {"timestamps.created_at": {"$gte": datetime.utcnow() - timedelta(days=HOTSPOT_MAX_WINDOW_DAYS)}},
+        {"_id": 0, "request_id": 1, "category": 1, "location.coordinates": 1, "location.address_hint": 1,
+         "timestamps.created_at": 1, "rating.stars": 1}
+    )
+    request_hotspots.load(await cursor.to_list())
+    print(f"Hotspot index loaded with {len(request_hotspots)} requests.")
 
 @router.get("/cohorts")
-async def get_cohorts():
-    """Identifies recurring issues and hotspots"""
-    pipeline = [
-        {"$group": {
-            "_id": "$location.address_hint",
-            "count": {"$sum": 1},
-            "categories": {"$addToSet": "$category"},
-            "avg_rating": {"$avg": "$rating.stars"},
-            "last_incident": {"$max": "$timestamps.created_at"}
-        }},
-        {"$match": {"count": {"$gt": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 15}
-    ]
-    return list(db.service_requests.aggregate(pipeline))
+async def get_cohorts(
+    window_days: int = Query(90, ge=1, le=HOTSPOT_MAX_WINDOW_DAYS),
+    category: Optional[str] = None,
+    radius_m: float = Query(50, ge=10, le=1000),
+    min_reports: int = Query(3, ge=2),
+    limit: int = Query(15, ge=1, le=100)
+):
+    """
+    Recurring-issue hotspots: places with at least min_reports requests within
+    about radius_m of each other in the last window_days, largest first
+    """
+    return request_hotspots.hotspots(window_days, category, radius_m, min_reports, limit)
+
+PERCENTILE_KEYS = ["p50", "p90", "p99"]
+
+@router.get("/percentiles")
+async def get_latency_percentiles(group_by: str = "all"):
+    """
+    p50/p90/p99 resolution and first-response hours per zone, category or
+    agent, read from the latency sketches (values within 1% of exact)
+    """
+    if group_by not in rollups.SKETCH_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {list(rollups.SKETCH_DIMENSIONS)}")
+    sketches = await rollups.load_sketches(group_by)
+    result = []
+    for key, metrics in sketches.items():
+        row = {group_by: key} if group_by != "all" else {}
+        for metric in rollups.SKETCH_METRICS:
+            row[metric] = metrics.get(metric, DDSketch()).summary()
+        if any(row[metric]["count"] for metric in rollups.SKETCH_METRICS):
+            result.append(row)
+    return sorted(result, key=lambda row: row["resolution"]["count"], reverse=True)
 
 @router.get("/agents")
 async def get_agent_analytics():
     """Fixed agent productivity with name lookup and ObjectId conversion"""
     # 1. Get all active agents
-    agents = list(db.service_agents.find({"active": True}))
+    agents = await db.service_agents.find({"active": True}).to_list()
     agent_map = {str(a["_id"]): a["name"] for a in agents}
     
     # 2. Aggregate stats
@@ -274,17 +724,22 @@ async def get_agent_analytics():
             }}
         }}
     ]
-    stats = {r["_id"]: r for r in db.service_requests.aggregate(pipeline)}
+    stats = {r["_id"]: r async for r in await db.service_requests.aggregate(pipeline)}
+    sketches = await rollups.load_sketches("agent", list(agent_map))
     
     result = []
     for aid, name in agent_map.items():
         s = stats.get(aid, {"active_tasks": 0, "completed_tasks": 0, "avg_resolution_hours": 0})
+        resolution = sketches.get(aid, {}).get("resolution", DDSketch()).summary()
+        first_response = sketches.get(aid, {}).get("first_response", DDSketch()).summary()
         result.append({
             "agent_id": aid,
             "agent_name": name,
             "active_tasks": s["active_tasks"],
             "completed_tasks": s["completed_tasks"],
             "avg_resolution_hours": round(s["avg_resolution_hours"] or 0, 1),
+            **{f"resolution_{p}_hours": resolution[p] for p in PERCENTILE_KEYS},
+            **{f"first_response_{p}_hours": first_response[p] for p in PERCENTILE_KEYS},
             "score": round((s["completed_tasks"] / (s["active_tasks"] + 1)), 1)
         })
     
@@ -294,54 +749,94 @@ async def get_agent_analytics():
 async def simulate_breach_rate():
     """Dev tool to artificially age requests to show non-zero breach rates"""
     # Target ANY open requests to ensure non-zero metrics
-    db.service_requests.update_many(
-        {"status": {"$in": ["new", "triaged", "assigned", "in_progress"]}},
+    await db.service_requests.update_many(
+        {"status": {"$in": OPEN_STATUSES}},
         {"$set": {"timestamps.created_at": datetime.utcnow() - timedelta(days=15)}}
     )
+    await refresh_sla_deadlines({"status": {"$in": OPEN_STATUSES}})
+    # Creation times moved, so the requests move to older rollup buckets and hotspot windows
+    await rollups.sync_rollups({"status": {"$in": OPEN_STATUSES}})
+    await load_hotspot_index()
     # Clear Cache to show results immediately
-    CACHE.clear()
+    analytics_cache.invalidate()
+    tile_versions.reset()
     return {"message": "Simulated breaches created for all open requests"}
 
+# Only the fields the CSV needs, read in cursor batches so memory stays flat
+EXPORT_PROJECTION = {
+    "_id": 0, "request_id": 1, "category": 1, "status": 1, "priority": 1,
+    "timestamps.created_at": 1, "timestamps.resolved_at": 1,
+    "sla_policy.breach_threshold_hours": 1, "rating.stars": 1
+}
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ["Request ID", "Category", "Status", "Priority", "Created At", "SLA State", "Rating"]
+
+def export_row(req: dict, now: datetime) -> list:
+    ts = req.get("timestamps", {})
+    sla_state = "Compliant"
+    breach_hrs = req.get("sla_policy", {}).get("breach_threshold_hours", 120)
+    
+    created = ts.get("created_at")
+    resolved = ts.get("resolved_at") or now
+    
+    if created:
+        if (resolved - created).total_seconds() / 3600 > breach_hrs:
+            sla_state = "Breached"
+            
+    rating_stars = ""
+    if req.get("rating") and isinstance(req.get("rating"), dict):
+        rating_stars = req.get("rating").get("stars", "")
+
+    return [
+        req.get("request_id"),
+        req.get("category"),
+        req.get("status"),
+        req.get("priority"),
+        created.isoformat() if created else "",
+        sla_state,
+        rating_stars
+    ]
+
+async def stream_export_csv(query: dict, compress: bool):
+    """Yield the CSV one cursor batch at a time, optionally gzip-compressed on the fly"""
+    now = datetime.utcnow()
+    gzipper = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_COLUMNS)
+    rows = 0
+
+    def drain() -> bytes:
+        data = output.getvalue().encode()
+        output.seek(0)
+        output.truncate()
+        return gzipper.compress(data) if gzipper else data
+
+    cursor = db.service_requests.find(query, EXPORT_PROJECTION).sort("timestamps.created_at", -1).batch_size(EXPORT_BATCH_SIZE)
+    async for req in cursor:
+        writer.writerow(export_row(req, now))
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            chunk = drain()
+            if chunk:
+                yield chunk
+
+    chunk = drain()
+    if gzipper:
+        chunk += gzipper.flush()
+    if chunk:
+        yield chunk
+
 @router.get("/export/csv")
 async def export_analytics_csv(
     start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None,
+    gzip: bool = False
 ):
     query = get_base_filters(start_date, end_date)
-    requests = list(db.service_requests.find(query).sort("timestamps.created_at", -1))
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Request ID", "Category", "Status", "Priority", "Created At", "SLA State", "Rating"])
-    
-    for req in requests:
-        ts = req.get("timestamps", {})
-        sla_state = "Compliant"
-        breach_hrs = req.get("sla_policy", {}).get("breach_threshold_hours", 120)
-        
-        created = ts.get("created_at")
-        resolved = ts.get("resolved_at") or datetime.utcnow()
-        
-        if created:
-            if (resolved - created).total_seconds() / 3600 > breach_hrs:
-                sla_state = "Breached"
-                
-        rating_stars = ""
-        if req.get("rating") and isinstance(req.get("rating"), dict):
-            rating_stars = req.get("rating").get("stars", "")
-
-        writer.writerow([
-            req.get("request_id"),
-            req.get("category"),
-            req.get("status"),
-            req.get("priority"),
-            created.isoformat() if created else "",
-            sla_state,
-            rating_stars
-        ])
-    
-    return Response(
-        content=output.getvalue(),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=cst_report_{datetime.now().strftime('%Y%m%d')}.csv"}
+    filename = f"cst_report_{datetime.now().strftime('%Y%m%d')}.csv" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_export_csv(query, gzip),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Response
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
 from app.database import get_database
 from app.models.schemas import CitizenCreate, CitizenVerificationState
+from app.utils.pagination import apply_cursor, keyset_sort, set_next_cursor
 
 router = APIRouter(prefix="/citizens", tags=["Citizens"])
 db = get_database()
@@ -23,7 +24,7 @@ async def create_citizen(citizen: CitizenCreate):
     """Create a new citizen profile with verification state and preferences"""
     # Check if email exists
     if citizen.contacts.email:
-        existing = db.citizens.find_one({"contacts.email": citizen.contacts.email})
+        existing = await db.citizens.find_one({"contacts.email": citizen.contacts.email})
         if existing:
             raise HTTPException(status_code=400, detail="Email already registered")
             
@@ -49,16 +50,18 @@ async def create_citizen(citizen: CitizenCreate):
         }
     
     try:
-        result = db.citizens.insert_one(new_citizen)
-        created = db.citizens.find_one({"_id": result.inserted_id})
+        result = await db.citizens.insert_one(new_citizen)
+        created = await db.citizens.find_one({"_id": result.inserted_id})
         return serialize_doc(created)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Could not create citizen: {str(e)}")
 
 @router.get("/")
-async def list_citizens(limit: int = 20, skip: int = 0):
-    """List all citizens"""
-    citizens = list(db.citizens.find().skip(skip).limit(limit))
+async def list_citizens(response: Response, limit: int = 20, cursor: Optional[str] = None):
+    """List all citizens, newest first (cursor-only paging via X-Next-Cursor, no offset)"""
+    query = apply_cursor({}, "created_at", cursor)
+    citizens = await db.citizens.find(query).sort(keyset_sort("created_at")).limit(limit).to_list()
+    set_next_cursor(response, citizens, "created_at", limit)
     return [serialize_doc(c) for c in citizens]
 
 @router.get("/{citizen_id}")
@@ -67,12 +70,12 @@ async def get_citizen(citizen_id: str):
     if not ObjectId.is_valid(citizen_id):
         raise HTTPException(status_code=400, detail="Invalid ID format")
         
-    citizen = db.citizens.find_one({"_id": ObjectId(citizen_id)})
+    citizen = await db.citizens.find_one({"_id": ObjectId(citizen_id)})
     if not citizen:
         raise HTTPException(status_code=404, detail="Citizen not found")
     
     # Get citizen's requests for KPIs
-    requests = list(db.service_requests.find({"citizen_id": citizen_id}))
+    requests = await db.service_requests.find({"citizen_id": citizen_id}).to_list()
     
     # Calculate stats
     total_requests = len(requests)
@@ -106,13 +109,13 @@ async def verify_citizen(citizen_id: str, otp_code: str = Body(..., embed=True))
     if not ObjectId.is_valid(citizen_id):
         raise HTTPException(status_code=400, detail="Invalid ID format")
     
-    citizen = db.citizens.find_one({"_id": ObjectId(citizen_id)})
+    citizen = await db.citizens.find_one({"_id": ObjectId(citizen_id)})
     if not citizen:
         raise HTTPException(status_code=404, detail="Citizen not found")
     
     # Stub: Accept any 6-digit code
     if len(otp_code) == 6 and otp_code.isdigit():
-        db.citizens.update_one(
+        await db.citizens.update_one(
             {"_id": ObjectId(citizen_id)},
             {"$set": {
                 "verification_state": CitizenVerificationState.VERIFIED.value,
@@ -126,7 +129,7 @@ async def verify_citizen(citizen_id: str, otp_code: str = Body(..., embed=True))
 @router.post("/login")
 async def login_citizen(email: str = Body(...), password: str = Body(...)):
     """Login citizen - returns citizen data if credentials match"""
-    citizen = db.citizens.find_one({"contacts.email": email})
+    citizen = await db.citizens.find_one({"contacts.email": email})
     if not citizen:
         raise HTTPException(status_code=404, detail="Citizen not found")
     
@@ -147,7 +150,7 @@ async def update_preferences(
     if not ObjectId.is_valid(citizen_id):
         raise HTTPException(status_code=400, detail="Invalid ID format")
     
-    citizen = db.citizens.find_one({"_id": ObjectId(citizen_id)})
+    citizen = await db.citizens.find_one({"_id": ObjectId(citizen_id)})
     if not citizen:
         raise HTTPException(status_code=404, detail="Citizen not found")
     
@@ -162,21 +165,29 @@ async def update_preferences(
         update["preferences.language"] = language
     
     if update:
-        db.citizens.update_one({"_id": ObjectId(citizen_id)}, {"$set": update})
+        await db.citizens.update_one({"_id": ObjectId(citizen_id)}, {"$set": update})
     
     return {"message": "Preferences updated"}
 
 @router.get("/{citizen_id}/requests")
-async def get_citizen_requests(citizen_id: str, status: Optional[str] = None):
-    """Get all requests submitted by a citizen"""
+async def get_citizen_requests(
+    citizen_id: str,
+    response: Response,
+    status: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+):
+    """Get requests submitted by a citizen, newest first (cursor-paginated via X-Next-Cursor)"""
     if not ObjectId.is_valid(citizen_id):
         raise HTTPException(status_code=400, detail="Invalid ID format")
     
     query = {"citizen_id": citizen_id}
     if status:
         query["status"] = status
+    apply_cursor(query, "timestamps.created_at", cursor)
     
-    requests = list(db.service_requests.find(query).sort("timestamps.created_at", -1))
+    requests = await db.service_requests.find(query).sort(keyset_sort("timestamps.created_at")).limit(limit).to_list()
+    set_next_cursor(response, requests, "timestamps.created_at", limit)
     
     # Serialize each request
     result = []
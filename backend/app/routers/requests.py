@@ -1,11 +1,25 @@
-from fastapi import APIRouter, HTTPException, Body, Query
+from fastapi import APIRouter, HTTPException, Body, Query, Response
 from typing import List, Optional, Dict
 from datetime import datetime
+import asyncio
+import time
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
 from app.database import get_database
 from app.models.schemas import ServiceRequestCreate, RequestStatus, Priority
-from app.utils.common import generate_request_id, get_allowed_transitions
-import math
+from app.utils.common import generate_request_id, get_allowed_transitions, get_source_states, with_fields, OPEN_STATUSES
+from app.utils.event_log import log_event
+from app.utils.pagination import apply_cursor, keyset_sort, set_next_cursor
+from app.utils.geo import PointGridIndex
+from app.utils.sequences import request_sequence
+from app.utils.sla import sla_deadlines, deadline_stages
+from app.utils.cache import analytics_cache, REQUEST_MAP_SCOPES
+from app.utils.tiles import tile_versions
+from app.utils.clusters import request_clusters, track_request
+from app.utils.hotspots import request_hotspots
+from app.utils.zones import zone_index
+from app.utils.rollups import sync_rollups, queue_rollup_sync
+from app.utils.workload import move_workloads
 
 router = APIRouter(prefix="/requests", tags=["Service Requests"])
 db = get_database()
@@ -24,6 +38,9 @@ SLA_POLICIES = {
     "low": {"target_hours": 168, "breach_threshold_hours": 240}
 }
 
+# Statuses in which field milestones and resolution are accepted
+MILESTONE_STATES = ["assigned", "in_progress"]
+
 # High-impact locations (schools, hospitals, etc.)
 # Format: [longitude, latitude, name, type]
 SENSITIVE_LOCATIONS = [
@@ -34,39 +51,36 @@ SENSITIVE_LOCATIONS = [
     {"coordinates": [35.2167, 31.7778], "name": "Bezalel Academy", "type": "school"},
 ]
 
-def calculate_distance(lon1, lat1, lon2, lat2):
-    """Calculate distance in km between two coordinates using Haversine formula"""
-    R = 6371  # Earth's radius in km
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
+SENSITIVE_RADIUS_KM = 0.5  # 500 meters
+
+# Grid index over the sensitive-location registry; rebuilt by load_sensitive_locations()
+sensitive_index = PointGridIndex(SENSITIVE_LOCATIONS, cell_km=SENSITIVE_RADIUS_KM)
+
+async def load_sensitive_locations():
+    """Index the sensitive_locations collection when populated, else the built-in list"""
+    global sensitive_index
+    registry = await db.sensitive_locations.find({}, {"_id": 0, "coordinates": 1, "name": 1, "type": 1}).to_list()
+    if registry:
+        sensitive_index = PointGridIndex(registry, cell_km=SENSITIVE_RADIUS_KM)
+        print(f"Loaded {len(registry)} sensitive locations.")
 
 def check_high_impact_location(coordinates):
     """Check if location is near sensitive areas (schools, hospitals)"""
     lon, lat = coordinates
-    proximity_threshold_km = 0.5  # 500 meters
     
     nearby_sensitive = []
-    for loc in SENSITIVE_LOCATIONS:
-        distance = calculate_distance(lon, lat, loc["coordinates"][0], loc["coordinates"][1])
-        if distance <= proximity_threshold_km:
-            nearby_sensitive.append({
-                "name": loc["name"],
-                "type": loc["type"],
-                "distance_km": round(distance, 3)
-            })
+    for loc, distance in sensitive_index.within(lon, lat, SENSITIVE_RADIUS_KM):
+        nearby_sensitive.append({
+            "name": loc["name"],
+            "type": loc["type"],
+            "distance_km": round(distance, 3)
+        })
     
     return nearby_sensitive
 
-def compute_triage(request_data):
+def compute_triage(request_data, nearby_sensitive=None):
     # Advanced triage logic: validate category, check high-impact, adjust priority
+    # nearby_sensitive may be precomputed by batch callers (see run_retriage_job)
     category = request_data.get("category", "").lower()
     priority = request_data.get("priority", "medium").lower()
     location = request_data.get("location", {})
@@ -80,23 +94,24 @@ def compute_triage(request_data):
     
     # 2. Check for high-impact location
     high_impact_flag = False
-    nearby_sensitive = []
     escalation_reason = None
     
-    if location and location.get("coordinates"):
-        nearby_sensitive = check_high_impact_location(location["coordinates"])
-        
-        if nearby_sensitive:
-            high_impact_flag = True
-            # Auto-escalate priority if near sensitive locations
-            if priority in ["low", "medium"]:
-                escalation_reason = f"Near {nearby_sensitive[0]['type']}: {nearby_sensitive[0]['name']}"
-                priority = "high"  # Escalate to high
-            elif priority == "high":
-                # Already high, escalate to critical if near hospital
-                if any(loc["type"] == "hospital" for loc in nearby_sensitive):
-                    escalation_reason = f"Near hospital: {nearby_sensitive[0]['name']}"
-                    priority = "critical"
+    if nearby_sensitive is None:
+        nearby_sensitive = []
+        if location and location.get("coordinates"):
+            nearby_sensitive = check_high_impact_location(location["coordinates"])
+    
+    if nearby_sensitive:
+        high_impact_flag = True
+        # Auto-escalate priority if near sensitive locations
+        if priority in ["low", "medium"]:
+            escalation_reason = f"Near {nearby_sensitive[0]['type']}: {nearby_sensitive[0]['name']}"
+            priority = "high"  # Escalate to high
+        elif priority == "high":
+            # Already high, escalate to critical if near hospital
+            if any(loc["type"] == "hospital" for loc in nearby_sensitive):
+                escalation_reason = f"Near hospital: {nearby_sensitive[0]['name']}"
+                priority = "critical"
     
     # 3. Compute SLA policy based on final priority
     sla = SLA_POLICIES.get(priority, SLA_POLICIES["medium"])
@@ -125,16 +140,140 @@ def serialize_doc(doc):
     doc["_id"] = str(doc["_id"])
     return doc
 
+def map_changed(req: dict, counts_changed: bool = True):
+    """
+    Drop the cached heatmaps and tiles showing req after a write that changed
+    how it is drawn; counts_changed if it also entered or left the open counts
+    """
+    location = req.get("location") or {}
+    if counts_changed:
+        analytics_cache.invalidate(*REQUEST_MAP_SCOPES)
+        tile_versions.touch(location.get("coordinates"), [location.get("zone_id")])
+    else:
+        analytics_cache.invalidate("heatmap_grid")
+        tile_versions.touch(location.get("coordinates"))
+
+def triage_fields(original_priority, triage_result, created_at, now, manual=False):
+    """Fields written back to a request after (re-)triage; without created_at the deadlines are left to the caller"""
+    fields = {
+        "priority": triage_result["final_priority"],
+        "sla_policy": triage_result["sla_policy"],
+        "triage_metadata": {
+            "original_priority": original_priority,
+            "priority_escalated": triage_result["priority_escalated"],
+            "escalation_reason": triage_result["escalation_reason"],
+            "high_impact_flag": triage_result["high_impact_flag"],
+            "nearby_sensitive_locations": triage_result["nearby_sensitive_locations"],
+            "triaged_at": now,
+            "manual_triage": manual
+        }
+    }
+    if created_at is not None:
+        fields.update(sla_deadlines(created_at, triage_result["sla_policy"], triage_result["final_priority"], triage_result["high_impact_flag"]))
+    return fields
+
+# --- Batch re-triage (after SLA_POLICIES / sensitive location changes) ---
+
+RETRIAGE_CHUNK_SIZE = 1000
+RETRIAGE_JOBS = {}
+_retriage_tasks = set()
+
+async def _retriage_chunk(chunk, job):
+    """Re-triage one chunk: vectorized proximity check, then a single bulk_write"""
+    located = [i for i, r in enumerate(chunk) if (r.get("location") or {}).get("coordinates")]
+    matches = sensitive_index.within_many(
+        [chunk[i]["location"]["coordinates"][0] for i in located],
+        [chunk[i]["location"]["coordinates"][1] for i in located],
+        SENSITIVE_RADIUS_KM
+    )
+    nearby_by_row = {
+        i: [{"name": loc["name"], "type": loc["type"], "distance_km": round(distance, 3)} for loc, distance in found]
+        for i, found in zip(located, matches)
+    }
+    
+    now = datetime.utcnow()
+    ops = []
+    changed_ids = []
+    reprioritized = []
+    for i, req in enumerate(chunk):
+        metadata = req.get("triage_metadata") or {}
+        # Always triage from the citizen's original priority so repeated runs don't compound escalations
+        original_priority = metadata.get("original_priority") or req.get("priority", "medium")
+        try:
+            triage_result = compute_triage({**req, "priority": original_priority}, nearby_by_row.get(i, []))
+        except HTTPException:
+            job["skipped"] += 1
+            continue
+        
+        unchanged = (
+            triage_result["final_priority"] == req.get("priority")
+            and triage_result["sla_policy"] == req.get("sla_policy")
+            and triage_result["nearby_sensitive_locations"] == metadata.get("nearby_sensitive_locations")
+        )
+        if unchanged:
+            continue
+        
+        update_data = triage_fields(original_priority, triage_result, req["timestamps"]["created_at"], now)
+        update_data["timestamps.updated_at"] = now
+        ops.append(UpdateOne({"_id": req["_id"], "status": {"$in": OPEN_STATUSES}}, {"$set": update_data}))
+        changed_ids.append(req["_id"])
+        if triage_result["final_priority"] != req.get("priority"):
+            reprioritized.append((req, triage_result["final_priority"]))
+    
+    if ops:
+        result = await db.service_requests.bulk_write(ops, ordered=False)
+        job["updated"] += result.modified_count
+        # Deadlines moved too, which moves the requests' SLA breach buckets
+        await sync_rollups({"_id": {"$in": changed_ids}})
+        analytics_cache.invalidate("heatmap_grid")
+        for req, priority in reprioritized:
+            tile_versions.touch((req.get("location") or {}).get("coordinates"))
+            request_clusters.upsert(req["request_id"], (req.get("location") or {}).get("coordinates"), priority, req.get("category"))
+    job["processed"] += len(chunk)
+
+async def run_retriage_job(job):
+    """Stream open requests in chunks and re-triage each chunk in bulk"""
+    query = {"status": {"$in": OPEN_STATUSES}, "triage_metadata.manual_triage": {"$ne": True}}
+    projection = {"request_id": 1, "category": 1, "priority": 1, "location": 1, "sla_policy": 1, "triage_metadata": 1, "timestamps.created_at": 1}
+    started = time.perf_counter()
+    try:
+        if job["reload_registry"]:
+            await load_sensitive_locations()
+        job["total"] = await db.service_requests.count_documents(query)
+        chunk = []
+        async for req in db.service_requests.find(query, projection).batch_size(job["chunk_size"]):
+            chunk.append(req)
+            if len(chunk) >= job["chunk_size"]:
+                await _retriage_chunk(chunk, job)
+                chunk = []
+                job["requests_per_second"] = round(job["processed"] / (time.perf_counter() - started), 1)
+        if chunk:
+            await _retriage_chunk(chunk, job)
+        job["status"] = "completed"
+    except Exception as e:
+        print(f"Re-triage job {job['job_id']} failed: {e}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    elapsed = time.perf_counter() - started
+    job["elapsed_seconds"] = round(elapsed, 2)
+    job["requests_per_second"] = round(job["processed"] / elapsed, 1) if elapsed > 0 else None
+    job["finished_at"] = datetime.utcnow()
+
 @router.post("/")
 async def create_request(request: ServiceRequestCreate):
-    count = db.service_requests.count_documents({}) + 1
-    req_id = generate_request_id(count)
+    year, seq = await request_sequence.next()
+    req_id = generate_request_id(seq, year)
     
     new_request = request.dict()
     
     # advanced triage logic
     triage_result = compute_triage(new_request)
     
+    # Tag the zone from the point; keep a citizen-supplied zone only if no boundary matches
+    coordinates = (new_request.get("location") or {}).get("coordinates")
+    if coordinates:
+        new_request["location"]["zone_id"] = zone_index.locate(coordinates[0], coordinates[1]) or new_request["location"].get("zone_id")
+    
     # triaged priority and SLA policy
     new_request["request_id"] = req_id
     new_request["status"] = RequestStatus.NEW.value
@@ -160,24 +299,30 @@ async def create_request(request: ServiceRequestCreate):
     # Use computed SLA policy
     new_request["sla_policy"] = triage_result["sla_policy"]
     
+    now = datetime.utcnow()
     new_request["timestamps"] = {
-        "created_at": datetime.utcnow(),
+        "created_at": now,
         "triaged_at": None,
         "assigned_at": None,
         "resolved_at": None,
         "closed_at": None,
-        "updated_at": datetime.utcnow()
+        "updated_at": now
     }
+    new_request.update(sla_deadlines(now, new_request["sla_policy"], new_request["priority"], triage_result["high_impact_flag"]))
     new_request["comments"] = []
     new_request["rating"] = None
     new_request["milestones"] = []
     
-    result = db.service_requests.insert_one(new_request)
-    created_request = db.service_requests.find_one({"_id": result.inserted_id})
+    result = await db.service_requests.insert_one(new_request)
+    queue_rollup_sync(req_id)
+    map_changed(new_request)
+    created_request = await db.service_requests.find_one({"_id": result.inserted_id})
+    track_request(created_request)
+    request_hotspots.add(created_request)
     
     # Log to performance_logs
     try:
-        db.performance_logs.insert_one({
+        await db.performance_logs.insert_one({
             "request_id": req_id,
             "event_stream": [{
                 "type": "created",
@@ -205,14 +350,19 @@ async def create_request(request: ServiceRequestCreate):
 
 @router.get("/")
 async def list_requests(
+    response: Response,
     status: Optional[str] = None,
     category: Optional[str] = None,
     priority: Optional[str] = None,
     agent_id: Optional[str] = None,
     citizen_id: Optional[str] = None,
     limit: int = 50,
-    skip: int = 0
+    cursor: Optional[str] = None
 ):
+    """
+    List requests newest first. Paging is cursor-only: pass the X-Next-Cursor
+    response header back as `cursor` for the next page (there is no offset).
+    """
     query = {}
     if status:
         query["status"] = status
@@ -224,31 +374,53 @@ async def list_requests(
         query["assigned_agent_id"] = agent_id
     if citizen_id:
         query["citizen_id"] = citizen_id
+    apply_cursor(query, "timestamps.created_at", cursor)
         
-    requests = list(db.service_requests.find(query).sort("timestamps.created_at", -1).skip(skip).limit(limit))
+    requests = await db.service_requests.find(query).sort(keyset_sort("timestamps.created_at")).limit(limit).to_list()
+    set_next_cursor(response, requests, "timestamps.created_at", limit)
     return [serialize_doc(r) for r in requests]
 
 @router.get("/{request_id}")
 async def get_request(request_id: str):
-    req = db.service_requests.find_one({"request_id": request_id})
+    req = await db.service_requests.find_one({"request_id": request_id})
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     return serialize_doc(req)
 
 @router.post("/{request_id}/triage")
-async def manual_triage_request(request_id: str, override_priority: Optional[str] = Body(None)):
-    """Manually re-triage a request with advanced logic"""
-    req = db.service_requests.find_one({"request_id": request_id})
-    if not req:
-        raise HTTPException(status_code=404, detail="Request not found")
+async def manual_triage_request(
+    request_id: str,
+    override_priority: Optional[str] = Body(None),
+    priority: Optional[str] = Body(None),
+    category: Optional[str] = Body(None),
+    coordinates: Optional[List[float]] = Body(None)
+):
+    """
+    Manually re-triage an open request with advanced logic.
+
+    Triage only depends on the request's priority, category and location, so
+    a client that sends them as it shows them (priority, category, coordinates)
+    gets the triage computed from those and written in one conditional update;
+    409 if the request no longer has them. Without them the request is read first.
+    """
+    if override_priority and override_priority.lower() not in ["low", "medium", "high", "critical"]:
+        raise HTTPException(status_code=400, detail="Invalid priority override")
+    if priority is None or category is None:
+        req = await db.service_requests.find_one(
+            {"request_id": request_id}, {"priority": 1, "category": 1, "location.coordinates": 1}
+        )
+        if not req:
+            raise HTTPException(status_code=404, detail="Request not found")
+        priority, category = req.get("priority"), req.get("category")
+        coordinates = (req.get("location") or {}).get("coordinates")
     
     # Run triage logic
-    triage_result = compute_triage(req)
+    triage_result = compute_triage({
+        "priority": priority or "medium", "category": category or "", "location": {"coordinates": coordinates}
+    })
     
     # If staff overrides priority, use that instead
     if override_priority:
-        if override_priority.lower() not in ["low", "medium", "high", "critical"]:
-            raise HTTPException(status_code=400, detail="Invalid priority override")
         triage_result["final_priority"] = override_priority.lower()
         triage_result["priority_escalated"] = True
         triage_result["escalation_reason"] = "Manual override by staff"
@@ -260,80 +432,116 @@ async def manual_triage_request(request_id: str, override_priority: Optional[str
             "breach_threshold_hours": sla["breach_threshold_hours"]
         }
     
-    # Update request
-    update_data = {
-        "priority": triage_result["final_priority"],
-        "sla_policy": triage_result["sla_policy"],
-        "triage_metadata": {
-            "original_priority": req.get("priority", "medium"),
-            "priority_escalated": triage_result["priority_escalated"],
-            "escalation_reason": triage_result["escalation_reason"],
-            "high_impact_flag": triage_result["high_impact_flag"],
-            "nearby_sensitive_locations": triage_result["nearby_sensitive_locations"],
-            "triaged_at": datetime.utcnow(),
-            "manual_triage": override_priority is not None
-        },
-        "timestamps.triaged_at": datetime.utcnow(),
-        "timestamps.updated_at": datetime.utcnow()
-    }
+    # Update request; deadlines are recomputed from the stored created_at by the pipeline
+    now = datetime.utcnow()
+    update_data = triage_fields(priority or "medium", triage_result, None, now, manual=override_priority is not None)
+    update_data["timestamps.triaged_at"] = now
+    update_data["timestamps.updated_at"] = now
     
-    db.service_requests.update_one(
-        {"request_id": request_id},
-        {"$set": update_data}
+    # Only apply while the request still has the inputs triage was computed from;
+    # unrelated writes (comments, evidence) don't conflict
+    updated_req = await db.service_requests.find_one_and_update(
+        {
+            "request_id": request_id, "status": {"$in": OPEN_STATUSES},
+            "priority": priority, "category": category, "location.coordinates": coordinates
+        },
+        [{"$set": {field: {"$literal": value} for field, value in update_data.items()}}, *deadline_stages()],
+        return_document=ReturnDocument.AFTER
     )
+    if not updated_req:
+        req = await db.service_requests.find_one({"request_id": request_id}, {"status": 1})
+        if not req:
+            raise HTTPException(status_code=404, detail="Request not found")
+        if req["status"] not in OPEN_STATUSES:
+            raise HTTPException(status_code=400, detail=f"Cannot triage a request in '{req['status']}' status")
+        raise HTTPException(status_code=409, detail="Request priority, category or location changed, please retry")
+    queue_rollup_sync(request_id)
+    map_changed(updated_req, counts_changed=False)
+    track_request(updated_req)
     
-    updated_req = db.service_requests.find_one({"request_id": request_id})
     return {
         "message": "Request triaged successfully",
         "triage_result": triage_result,
         "request": serialize_doc(updated_req)
     }
 
+@router.post("/retriage")
+async def start_retriage(chunk_size: int = Body(RETRIAGE_CHUNK_SIZE), reload_registry: bool = Body(True)):
+    """Re-triage every open request in the background; poll GET /requests/retriage/{job_id} for progress"""
+    job = {
+        "job_id": str(ObjectId()),
+        "status": "running",
+        "chunk_size": max(1, chunk_size),
+        "reload_registry": reload_registry,
+        "total": None,
+        "processed": 0,
+        "updated": 0,
+        "skipped": 0,
+        "requests_per_second": None,
+        "started_at": datetime.utcnow(),
+        "finished_at": None
+    }
+    RETRIAGE_JOBS[job["job_id"]] = job
+    task = asyncio.create_task(run_retriage_job(job))
+    _retriage_tasks.add(task)
+    task.add_done_callback(_retriage_tasks.discard)
+    return job
+
+@router.get("/retriage/{job_id}")
+async def get_retriage_job(job_id: str):
+    job = RETRIAGE_JOBS.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Re-triage job not found")
+    return job
+
 @router.patch("/{request_id}/transition")
 async def transition_request(request_id: str, new_status: str = Body(..., embed=True)):
-    req = db.service_requests.find_one({"request_id": request_id})
-    if not req:
-        raise HTTPException(status_code=404, detail="Request not found")
-    
-    current_status = req["status"]
-    allowed = get_allowed_transitions(current_status)
-    
-    if new_status not in allowed:
-        raise HTTPException(status_code=400, detail=f"Invalid transition from {current_status} to {new_status}. Allowed: {allowed}")
-    
+    now = datetime.utcnow()
     update_data = {
         "status": new_status,
         "workflow.current_state": new_status,
         "workflow.allowed_next": get_allowed_transitions(new_status),
-        "timestamps.updated_at": datetime.utcnow()
+        "timestamps.updated_at": now
     }
     
     if new_status == "triaged":
-        update_data["timestamps.triaged_at"] = datetime.utcnow()
+        update_data["timestamps.triaged_at"] = now
     elif new_status == "assigned":
-        update_data["timestamps.assigned_at"] = datetime.utcnow()
+        update_data["timestamps.assigned_at"] = now
     elif new_status == "resolved":
-        update_data["timestamps.resolved_at"] = datetime.utcnow()
+        update_data["timestamps.resolved_at"] = now
     elif new_status == "closed":
-        update_data["timestamps.closed_at"] = datetime.utcnow()
+        update_data["timestamps.closed_at"] = now
 
-    db.service_requests.update_one({"request_id": request_id}, {"$set": update_data})
-    
-    # Log event
-    try:
-        db.performance_logs.update_one(
-            {"request_id": request_id},
-            {"$push": {"event_stream": {
-                "type": new_status,
-                "by": {"actor_type": "staff", "actor_id": "system"},
-                "at": datetime.utcnow(),
-                "meta": {}
-            }}}
-        )
-    except Exception as e:
-        print(f"Performance log error: {e}")
+    # State check and write happen atomically: the filter only matches valid source states.
+    # The replaced version says which source state it was, and so whether the agent's workload moves
+    before = await db.service_requests.find_one_and_update(
+        {"request_id": request_id, "status": {"$in": get_source_states(new_status)}},
+        {"$set": update_data}
+    )
     
-    return serialize_doc(db.service_requests.find_one({"request_id": request_id}))
+    if not before:
+        req = await db.service_requests.find_one({"request_id": request_id}, {"status": 1})
+        if not req:
+            raise HTTPException(status_code=404, detail="Request not found")
+        current_status = req["status"]
+        allowed = get_allowed_transitions(current_status)
+        raise HTTPException(status_code=400, detail=f"Invalid transition from {current_status} to {new_status}. Allowed: {allowed}")
+    updated_req = with_fields(before, update_data)
+    await move_workloads([(before, updated_req)])
+    queue_rollup_sync(request_id)
+    if (before["status"] in OPEN_STATUSES) != (new_status in OPEN_STATUSES):
+        map_changed(before)
+    track_request(updated_req)
+    
+    log_event(request_id, {
+        "type": new_status,
+        "by": {"actor_type": "staff", "actor_id": "system"},
+        "at": now,
+        "meta": {}
+    })
+    
+    return serialize_doc(updated_req)
 
 @router.post("/{request_id}/comment")
 async def add_comment(
@@ -343,7 +551,7 @@ async def add_comment(
     author_type: str = Body("citizen")
 ):
     """Add a comment to a request - threaded comments for citizen interaction"""
-    req = db.service_requests.find_one({"request_id": request_id})
+    req = await db.service_requests.find_one({"request_id": request_id})
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     
@@ -355,7 +563,7 @@ async def add_comment(
         "created_at": datetime.utcnow()
     }
     
-    db.service_requests.update_one(
+    await db.service_requests.update_one(
         {"request_id": request_id},
         {
             "$push": {"comments": comment},
@@ -375,7 +583,7 @@ async def rate_request(
     dispute_reason: str = Body(None)
 ):
     """Rate a resolved/closed request with optional dispute flagging"""
-    req = db.service_requests.find_one({"request_id": request_id})
+    req = await db.service_requests.find_one({"request_id": request_id})
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     
@@ -391,14 +599,16 @@ async def rate_request(
         "created_at": datetime.utcnow()
     }
     
-    db.service_requests.update_one(
+    await db.service_requests.update_one(
         {"request_id": request_id},
         {"$set": {"rating": rating, "timestamps.updated_at": datetime.utcnow()}}
     )
+    queue_rollup_sync(request_id)
+    request_hotspots.set_rating(request_id, stars)
     
     # Update performance log
     try:
-        db.performance_logs.update_one(
+        await db.performance_logs.update_one(
             {"request_id": request_id},
             {"$set": {"citizen_feedback": rating}}
         )
@@ -414,7 +624,7 @@ async def add_evidence(
     url: str = Body(...)
 ):
     """Add additional evidence to a request"""
-    req = db.service_requests.find_one({"request_id": request_id})
+    req = await db.service_requests.find_one({"request_id": request_id})
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     
@@ -424,7 +634,7 @@ async def add_evidence(
         "uploaded_at": datetime.utcnow()
     }
     
-    db.service_requests.update_one(
+    await db.service_requests.update_one(
         {"request_id": request_id},
         {
             "$push": {"evidence": evidence},
@@ -442,58 +652,70 @@ async def add_milestone(
     evidence: List[Dict[str, str]] = Body([])
 ):
     """Add milestone: arrived, work_started, resolved"""
-    req = db.service_requests.find_one({"request_id": request_id})
-    if not req:
-        raise HTTPException(status_code=404, detail="Request not found")
-    
     valid_milestones = ["arrived", "work_started", "resolved"]
     if milestone_type not in valid_milestones:
         raise HTTPException(status_code=400, detail=f"Invalid milestone. Use: {valid_milestones}")
     
+    now = datetime.utcnow()
     milestone = {
         "type": milestone_type,
-        "timestamp": datetime.utcnow(),
+        "timestamp": now,
         "notes": notes,
         "evidence": evidence
     }
     
-    update = {"$push": {"milestones": milestone}, "$set": {"timestamps.updated_at": datetime.utcnow()}}
+    update = {"$push": {"milestones": milestone}, "$set": {"timestamps.updated_at": now}}
     
     # Auto-transition status based on milestone
     if milestone_type == "arrived" or milestone_type == "work_started":
         update["$set"]["status"] = "in_progress"
         update["$set"]["workflow.current_state"] = "in_progress"
+        update["$set"]["workflow.allowed_next"] = get_allowed_transitions("in_progress")
     elif milestone_type == "resolved":
         update["$set"]["status"] = "resolved"
         update["$set"]["workflow.current_state"] = "resolved"
-        update["$set"]["timestamps.resolved_at"] = datetime.utcnow()
+        update["$set"]["workflow.allowed_next"] = get_allowed_transitions("resolved")
+        update["$set"]["timestamps.resolved_at"] = now
+    
+    # Field milestones only apply to work that is assigned or underway
+    updated_req = await db.service_requests.find_one_and_update(
+        {"request_id": request_id, "status": {"$in": MILESTONE_STATES}},
+        update,
+        projection={"request_id": 1, "status": 1, "location": 1, "priority": 1, "category": 1, "assigned_agent_id": 1},
+        return_document=ReturnDocument.AFTER
+    )
     
-    db.service_requests.update_one({"request_id": request_id}, update)
+    if not updated_req:
+        req = await db.service_requests.find_one({"request_id": request_id}, {"status": 1})
+        if not req:
+            raise HTTPException(status_code=404, detail="Request not found")
+        raise HTTPException(status_code=400, detail=f"Cannot add milestones to a request in '{req['status']}' status")
+    # Every MILESTONE_STATES status counts against the agent, so only a resolution moves the workload
+    await move_workloads([({**updated_req, "status": "in_progress"}, updated_req)])
+    queue_rollup_sync(request_id)
+    if updated_req["status"] not in OPEN_STATUSES:
+        map_changed(updated_req)
+    track_request(updated_req)
     
     return {"message": f"Milestone '{milestone_type}' added"}
 
 @router.post("/{request_id}/escalate")
 async def escalate_request(request_id: str, reason: str = Body(...)):
-    req = db.service_requests.find_one({"request_id": request_id})
+    req = await db.service_requests.find_one({"request_id": request_id})
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     
     # Log escalation event
-    try:
-        db.performance_logs.update_one(
-            {"request_id": request_id},
-            {
-                "$push": {"event_stream": {
-                    "type": "escalation",
-                    "by": {"actor_type": "system", "actor_id": "manual"},
-                    "at": datetime.utcnow(),
-                    "meta": {"reason": reason}
-                }},
-                "$inc": {"computed_kpis.escalation_count": 1}
-            }
-        )
-    except Exception as e:
-        print(f"Performance log error: {e}")
+    log_event(
+        request_id,
+        {
+            "type": "escalation",
+            "by": {"actor_type": "system", "actor_id": "manual"},
+            "at": datetime.utcnow(),
+            "meta": {"reason": reason}
+        },
+        inc_fields={"computed_kpis.escalation_count": 1}
+    )
     
     return {"message": "Request escalated", "reason": reason}
 
@@ -501,24 +723,28 @@ async def escalate_request(request_id: str, reason: str = Body(...)):
 async def get_sla_at_risk_requests():
     """Get all requests that are at risk of SLA breach or have breached SLA"""
     now = datetime.utcnow()
+    projection = {
+        "request_id": 1, "priority": 1, "category": 1, "status": 1,
+        "sla_policy": 1, "timestamps.created_at": 1, "assigned_agent_id": 1
+    }
     
-    # Find all open requests
-    requests = list(db.service_requests.find({
-        "status": {"$in": ["new", "triaged", "assigned", "in_progress"]}
-    }))
-    
-    at_risk = []
-    breached = []
+    # Deadlines are stored at creation/re-triage, so both lists are index range scans
+    breached_docs, at_risk_docs = await asyncio.gather(
+        db.service_requests.find(
+            {"status": {"$in": OPEN_STATUSES}, "sla_breach_at": {"$lte": now}}, projection
+        ).to_list(),
+        db.service_requests.find(
+            {"status": {"$in": OPEN_STATUSES}, "sla_target_at": {"$lte": now}, "sla_breach_at": {"$gt": now}}, projection
+        ).to_list()
+    )
     
-    for req in requests:
+    def summarize(req, sla_state):
         created_at = req["timestamps"]["created_at"]
         age_hours = (now - created_at).total_seconds() / 3600
-        
         sla_policy = req.get("sla_policy", {})
         target_hours = sla_policy.get("target_hours", 72)
         breach_hours = sla_policy.get("breach_threshold_hours", 120)
-        
-        req_data = {
+        return {
             "request_id": req["request_id"],
             "priority": req.get("priority", "medium"),
             "category": req.get("category"),
@@ -528,15 +754,12 @@ async def get_sla_at_risk_requests():
             "breach_hours": breach_hours,
             "time_remaining": round(breach_hours - age_hours, 1),
             "created_at": created_at,
-            "assigned_agent_id": req.get("assigned_agent_id")
+            "assigned_agent_id": req.get("assigned_agent_id"),
+            "sla_state": sla_state
         }
-        
-        if age_hours >= breach_hours:
-            req_data["sla_state"] = "breached"
-            breached.append(req_data)
-        elif age_hours >= target_hours:
-            req_data["sla_state"] = "at_risk"
-            at_risk.append(req_data)
+    
+    at_risk = [summarize(r, "at_risk") for r in at_risk_docs]
+    breached = [summarize(r, "breached") for r in breached_docs]
     
     return {
         "at_risk_count": len(at_risk),
@@ -565,7 +788,7 @@ async def get_request_sla_status(request_id: str):
         - age_hours, target_hours, breach_hours
         - time_remaining_to_breach (can be negative if overdue)
     """
-    req = db.service_requests.find_one({"request_id": request_id})
+    req = await db.service_requests.find_one({"request_id": request_id})
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     
@@ -621,16 +844,6 @@ async def resolve_request(
     resolved_by: str = Body(...)
 ):
     """Mark a request as resolved with evidence and notes"""
-    req = db.service_requests.find_one({"request_id": request_id})
-    if not req:
-        raise HTTPException(status_code=404, detail="Request not found")
-    
-    if req["status"] not in ["assigned", "in_progress"]:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Can only resolve requests in 'assigned' or 'in_progress' status. Current status: {req['status']}"
-        )
-    
     now = datetime.utcnow()
     
     # Add resolution milestone with evidence
@@ -642,62 +855,69 @@ async def resolve_request(
         "resolved_by": resolved_by
     }
     
-    # Calculate resolution time
-    created_at = req["timestamps"]["created_at"]
-    resolution_hours = (now - created_at).total_seconds() / 3600
-    sla_policy = req.get("sla_policy", {})
-    target_hours = sla_policy.get("target_hours", 72)
-    sla_met = resolution_hours <= target_hours
-    
-    # Update request
-    update_data = {
+    # Resolution time and SLA outcome are computed by the server from the stored
+    # created_at/sla_policy, so the whole resolve is one conditional round trip
+    resolution_hours = {"$divide": [{"$subtract": [now, "$timestamps.created_at"]}, 3600000]}
+    target_hours = {"$ifNull": ["$sla_policy.target_hours", 72]}
+    update_pipeline = [{"$set": {
         "status": "resolved",
         "workflow.current_state": "resolved",
-        "workflow.allowed_next": ["closed"],
+        "workflow.allowed_next": {"$literal": ["closed"]},
         "timestamps.resolved_at": now,
         "timestamps.updated_at": now,
         "resolution": {
-            "notes": resolution_notes,
-            "resolved_by": resolved_by,
+            "notes": {"$literal": resolution_notes},
+            "resolved_by": {"$literal": resolved_by},
             "resolved_at": now,
-            "resolution_hours": round(resolution_hours, 1),
-            "sla_met": sla_met
-        }
-    }
+            "resolution_hours": {"$round": [resolution_hours, 1]},
+            "sla_met": {"$lte": [resolution_hours, target_hours]}
+        },
+        "milestones": {"$concatArrays": [{"$ifNull": ["$milestones", []]}, [{"$literal": milestone}]]}
+    }}]
+    
+    req = await db.service_requests.find_one_and_update(
+        {"request_id": request_id, "status": {"$in": MILESTONE_STATES}},
+        update_pipeline,
+        projection={"timestamps.created_at": 1, "sla_policy": 1, "resolution": 1, "status": 1, "assigned_agent_id": 1, "location": 1},
+        return_document=ReturnDocument.AFTER
+    )
     
-    db.service_requests.update_one(
-        {"request_id": request_id},
+    if not req:
+        current = await db.service_requests.find_one({"request_id": request_id}, {"status": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Request not found")
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Can only resolve requests in 'assigned' or 'in_progress' status. Current status: {current['status']}"
+        )
+    # It left one of MILESTONE_STATES, all of which count against the agent
+    await move_workloads([({**req, "status": "in_progress"}, req)])
+    queue_rollup_sync(request_id)
+    map_changed(req)
+    request_clusters.remove(request_id)
+    
+    resolution = req["resolution"]
+    target_hours = req.get("sla_policy", {}).get("target_hours", 72)
+    resolution_minutes = int((now - req["timestamps"]["created_at"]).total_seconds() / 60)
+    
+    log_event(
+        request_id,
         {
-            "$set": update_data,
-            "$push": {"milestones": milestone}
+            "type": "resolved",
+            "by": {"actor_type": "agent", "actor_id": resolved_by},
+            "at": now,
+            "meta": {"resolution_hours": resolution["resolution_hours"], "sla_met": resolution["sla_met"]}
+        },
+        set_fields={
+            "computed_kpis.resolution_minutes": resolution_minutes,
+            "computed_kpis.sla_state": "met" if resolution["sla_met"] else "breached"
         }
     )
     
-    # Update performance log
-    try:
-        db.performance_logs.update_one(
-            {"request_id": request_id},
-            {
-                "$set": {
-                    "computed_kpis.resolution_minutes": int(resolution_hours * 60),
-                    "computed_kpis.sla_state": "met" if sla_met else "breached"
-                },
-                "$push": {"event_stream": {
-                    "type": "resolved",
-                    "by": {"actor_type": "agent", "actor_id": resolved_by},
-                    "at": now,
-                    "meta": {"resolution_hours": round(resolution_hours, 1), "sla_met": sla_met}
-                }}
-            }
-        )
-    except Exception as e:
-        print(f"Performance log error: {e}")
-    
     return {
         "message": "Request marked as resolved",
         "request_id": request_id,
-        "resolution_hours": round(resolution_hours, 1),
-        "sla_met": sla_met,
+        "resolution_hours": resolution["resolution_hours"],
+        "sla_met": resolution["sla_met"],
         "target_hours": target_hours
     }
-
@@ -0,0 +1,358 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+from app.utils.zones import PreparedZone
+
+# In-memory routing index for auto-assignment.
+#
+# Every active agent with a geo-fence is a row: its fence is prepared once
+# (NumPy rings + bbox), its skills are a column per skill, and its weekly
+# schedule is a packed bitmap with one bit per minute of the week. Fences
+# are rasterized onto a uniform grid: per cell, the agents whose fence
+# covers the whole cell, and the agents whose fence edge passes through it.
+# A lookup reads one cell, runs the polygon test only for the edge agents,
+# and filters skills, availability and workload with array operations, so
+# an assignment never queries MongoDB for candidates. load() builds it from
+# every agent at startup; agent writes go through upsert()/remove(), which
+# re-rasterize only that agent's fence on the same grid.
+#
+# current_workload is kept here too: seeded from the agent documents on
+# load, moved by move_workloads() alongside the stored counters, and re-read
+# after each reconciliation.
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+FENCE_CELLS_PER_SPAN = 4        # grid cell = median fence span / this
+MIN_CELL_DEG = 0.0005
+EMPTY = np.zeros(0, dtype=np.int64)
+
+def _minute_of_day(hhmm: str):
+    try:
+        hours, minutes = hhmm.split(":")
+        return int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        return None
+
+def weekly_availability(schedule: dict) -> np.ndarray:
+    """Packed bitmap (MINUTES_PER_WEEK bits) of the minutes an agent can take work"""
+    schedule = schedule or {}
+    week = np.zeros(MINUTES_PER_WEEK, dtype=bool)
+    if schedule.get("on_call", False):
+        week[:] = True
+    else:
+        for shift in schedule.get("shifts", []):
+            start, end = _minute_of_day(shift.get("start")), _minute_of_day(shift.get("end"))
+            if shift.get("day") not in WEEKDAYS or start is None or end is None:
+                continue
+            offset = WEEKDAYS.index(shift["day"]) * MINUTES_PER_DAY
+            if end >= start:
+                week[offset + start:offset + end + 1] = True
+            else:
+                # Overnight shift: runs on past midnight into the next day
+                week[offset + start:offset + MINUTES_PER_DAY] = True
+                week[(offset + MINUTES_PER_DAY) % MINUTES_PER_WEEK:][:end + 1] = True
+    return np.packbits(week)
+
+def minute_of_week(moment: datetime) -> int:
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+class AgentIndex:
+    def __init__(self, agents: list = ()):
+        self.load(agents)
+
+    @staticmethod
+    def _prepare(agent: dict):
+        """PreparedZone for an active agent with a usable geo-fence, else None"""
+        fence = (agent.get("coverage") or {}).get("geo_fence")
+        if not agent.get("active", True) or not fence:
+            return None
+        prepared = PreparedZone(str(agent["_id"]), fence)
+        return prepared if prepared.bbox is not None else None
+
+    def load(self, agents: list):
+        """Rebuild from agent documents (_id, name, active, skills, coverage.geo_fence, schedule, current_workload)"""
+        fences, rows = [], []
+        for agent in agents:
+            prepared = self._prepare(agent)
+            if prepared:
+                fences.append(prepared)
+                rows.append(agent)
+
+        skill_names = sorted({skill for agent in rows for skill in agent.get("skills") or []})
+        skills = {name: np.zeros(len(rows), dtype=bool) for name in skill_names}
+        for row, agent in enumerate(rows):
+            for skill in agent.get("skills") or []:
+                skills[skill][row] = True
+        availability = np.zeros((len(rows), MINUTES_PER_WEEK // 8), dtype=np.uint8)
+        for row, agent in enumerate(rows):
+            availability[row] = weekly_availability(agent.get("schedule"))
+        workload = np.array([a.get("current_workload") or 0 for a in rows], dtype=np.int64)
+
+        spans = [max(f.bbox[2] - f.bbox[0], f.bbox[3] - f.bbox[1]) for f in fences]
+        cell_deg = max(float(np.median(spans)) / FENCE_CELLS_PER_SPAN, MIN_CELL_DEG) if spans else None
+        inside, edge, footprints = defaultdict(list), defaultdict(list), []
+        for row, fence in enumerate(fences):
+            inside_cells, edge_cells = self._rasterize(fence, row, cell_deg)
+            for cell in inside_cells:
+                inside[cell].append(row)
+            for cell, part in edge_cells.items():
+                edge[cell].append(part)
+            footprints.append((inside_cells, list(edge_cells)))
+        # Swap in one assignment so concurrent lookups see either the old or the new index
+        self._state = {
+            "ids": [f.zone_id for f in fences],
+            "names": [a.get("name") for a in rows],
+            "positions": {f.zone_id: row for row, f in enumerate(fences)},
+            "skills": skills,
+            "availability": availability,
+            "workload": workload,
+            # Fence centroid (mean exterior vertex): the agent's base for distance costs
+            "centers": np.array([self._center(f) for f in fences]).reshape(-1, 2),
+            "cell_deg": cell_deg,
+            "inside": {cell: np.array(rows, dtype=np.int64) for cell, rows in inside.items()},
+            "edge": {cell: (np.concatenate([s for s, _ in parts]), np.concatenate([r for _, r in parts])) for cell, parts in edge.items()},
+            # Per row, the cells it was rasterized into, so upsert()/remove() can take it out again
+            "footprints": footprints
+        }
+
+    def __len__(self):
+        return len(self._state["positions"])
+
+    @staticmethod
+    def _center(fence: PreparedZone) -> np.ndarray:
+        return np.vstack([ext[:-1] for ext, _ in fence.parts]).mean(axis=0)
+
+    @staticmethod
+    def _cell(lon, lat, cell_deg):
+        return (math.floor(lon / cell_deg), math.floor(lat / cell_deg))
+
+    def _rasterize(self, fence: PreparedZone, row: int, cell_deg: float) -> tuple:
+        """
+        One agent's cells: those its fence covers entirely, and cell -> (edges, owner
+        rows) for the fence edges an even-odd ray cast from a point in the cell can
+        cross, where its boundary passes through
+        """
+        segments = np.vstack([
+            np.hstack([ring[:-1], ring[1:]])
+            for exterior, holes in fence.parts for ring in [exterior, *holes]
+        ])
+        lo = np.floor(np.minimum(segments[:, :2], segments[:, 2:]) / cell_deg).astype(np.int64)
+        hi = np.floor(np.maximum(segments[:, :2], segments[:, 2:]) / cell_deg).astype(np.int64)
+        touched = set()
+        for (x0, y0), (x1, y1) in zip(lo.tolist(), hi.tolist()):
+            touched.update((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+        min_x, min_y = self._cell(fence.bbox[0], fence.bbox[1], cell_deg)
+        max_x, max_y = self._cell(fence.bbox[2], fence.bbox[3], cell_deg)
+        xs, ys = np.meshgrid(np.arange(min_x, max_x + 1), np.arange(min_y, max_y + 1), indexing="ij")
+        xs, ys = xs.ravel(), ys.ravel()
+        # A cell no edge passes through is entirely inside or entirely outside: its center decides
+        covered = fence.contains((xs + 0.5) * cell_deg, (ys + 0.5) * cell_deg)
+        inside = [cell for cell in zip(xs[covered].tolist(), ys[covered].tolist()) if cell not in touched]
+        band_edges, edge = {}, {}
+        for x, y in touched:
+            # Edges in the cell's latitude band (the only ones a ray from the cell can cross)
+            if y not in band_edges:
+                near = (hi[:, 1] >= y) & (lo[:, 1] <= y)
+                band_edges[y] = (segments[near], np.full(int(near.sum()), row))
+            edge[(x, y)] = band_edges[y]
+        return inside, edge
+
+    @staticmethod
+    def _clear_row(state: dict, row: int):
+        """Take a row out of every cell it was rasterized into (state's cell maps must be private copies)"""
+        inside_cells, edge_cells = state["footprints"][row]
+        for cell in inside_cells:
+            rows = state["inside"][cell]
+            rows = rows[rows != row]
+            if len(rows):
+                state["inside"][cell] = rows
+            else:
+                del state["inside"][cell]
+        for cell in edge_cells:
+            segments, owners = state["edge"][cell]
+            keep = owners != row
+            if keep.any():
+                state["edge"][cell] = (segments[keep], owners[keep])
+            else:
+                del state["edge"][cell]
+        state["footprints"][row] = ([], [])
+
+    def _copy_state(self) -> dict:
+        """Copy-on-write view of the state for an incremental change, swapped in when done"""
+        old = self._state
+        return {
+            **old,
+            "ids": list(old["ids"]),
+            "names": list(old["names"]),
+            "positions": dict(old["positions"]),
+            "skills": {name: column.copy() for name, column in old["skills"].items()},
+            "availability": old["availability"].copy(),
+            "workload": old["workload"].copy(),
+            "centers": old["centers"].copy(),
+            "inside": dict(old["inside"]),
+            "edge": dict(old["edge"]),
+            "footprints": list(old["footprints"])
+        }
+
+    def upsert(self, agent: dict):
+        """
+        Add or refresh one agent from its document, re-rasterizing only its fence on
+        the grid chosen at load(); inactive or fenceless agents are removed. A new
+        agent takes the last row, so it loses workload ties until the next load().
+        """
+        prepared = self._prepare(agent)
+        if prepared is None:
+            self.remove(str(agent["_id"]))
+            return
+        state = self._copy_state()
+        if state["cell_deg"] is None:
+            span = max(prepared.bbox[2] - prepared.bbox[0], prepared.bbox[3] - prepared.bbox[1])
+            state["cell_deg"] = max(span / FENCE_CELLS_PER_SPAN, MIN_CELL_DEG)
+        row = state["positions"].get(prepared.zone_id)
+        if row is None:
+            row = len(state["ids"])
+            state["ids"].append(prepared.zone_id)
+            state["names"].append(None)
+            state["footprints"].append(([], []))
+            state["positions"][prepared.zone_id] = row
+            state["skills"] = {name: np.append(column, False) for name, column in state["skills"].items()}
+            state["availability"] = np.vstack([state["availability"], np.zeros((1, MINUTES_PER_WEEK // 8), dtype=np.uint8)])
+            state["workload"] = np.append(state["workload"], 0)
+            state["centers"] = np.vstack([state["centers"], np.zeros((1, 2))])
+        else:
+            self._clear_row(state, row)
+
+        state["names"][row] = agent.get("name")
+        for column in state["skills"].values():
+            column[row] = False
+        for skill in agent.get("skills") or []:
+            if skill not in state["skills"]:
+                state["skills"][skill] = np.zeros(len(state["ids"]), dtype=bool)
+            state["skills"][skill][row] = True
+        state["availability"][row] = weekly_availability(agent.get("schedule"))
+        state["workload"][row] = agent.get("current_workload") or 0
+        state["centers"][row] = self._center(prepared)
+
+        inside_cells, edge_cells = self._rasterize(prepared, row, state["cell_deg"])
+        for cell in inside_cells:
+            state["inside"][cell] = np.append(state["inside"].get(cell, EMPTY), row)
+        for cell, (segments, owners) in edge_cells.items():
+            if cell in state["edge"]:
+                old_segments, old_owners = state["edge"][cell]
+                segments, owners = np.concatenate([old_segments, segments]), np.concatenate([old_owners, owners])
+            state["edge"][cell] = (segments, owners)
+        state["footprints"][row] = (inside_cells, list(edge_cells))
+        self._state = state
+
+    def remove(self, agent_id: str):
+        """Drop one agent from lookups; its row stays behind as a tombstone until the next load()"""
+        if agent_id not in self._state["positions"]:
+            return
+        state = self._copy_state()
+        row = state["positions"].pop(agent_id)
+        self._clear_row(state, row)
+        self._state = state
+
+    def _covering(self, state: dict, lon: float, lat: float) -> np.ndarray:
+        if state["cell_deg"] is None:
+            return EMPTY
+        cell = self._cell(lon, lat, state["cell_deg"])
+        inside = state["inside"].get(cell, EMPTY)
+        if cell not in state["edge"]:
+            return inside
+        # Even-odd ray cast eastwards against every boundary agent's nearby edges at once
+        segments, owners = state["edge"][cell]
+        x1, y1, x2, y2 = segments.T
+        straddles = (y1 > lat) != (y2 > lat)
+        dy = np.where(y2 == y1, np.inf, y2 - y1)
+        crossings = straddles & (lon < x1 + (lat - y1) * (x2 - x1) / dy)
+        odd = np.bincount(owners[crossings], minlength=len(state["ids"])) % 2 == 1
+        return np.union1d(inside, np.nonzero(odd)[0])
+
+    def _eligible(self, state: dict, lon: float, lat: float, required_skill: str, moment: datetime) -> np.ndarray:
+        """Rows covering the point, narrowed by skill and then shift (a filter is skipped if it would leave no one)"""
+        rows = self._covering(state, lon, lat)
+        if not len(rows):
+            return rows
+        skilled = np.zeros(len(rows), dtype=bool)
+        for skill in [required_skill, "general"]:
+            if skill in state["skills"]:
+                skilled |= state["skills"][skill][rows]
+        if skilled.any():
+            rows = rows[skilled]
+        minute = minute_of_week(moment)
+        on_shift = (state["availability"][rows, minute >> 3] >> (7 - (minute & 7))) & 1 == 1
+        if on_shift.any():
+            rows = rows[on_shift]
+        return rows
+
+    def candidates(self, lon: float, lat: float, required_skill: str, moment: datetime) -> list:
+        """Eligible agent ids for a request, least loaded first"""
+        state = self._state
+        rows = self._eligible(state, lon, lat, required_skill, moment)
+        rows = rows[np.argsort(state["workload"][rows], kind="stable")]
+        return [state["ids"][row] for row in rows.tolist()]
+
+    def best(self, lon: float, lat: float, required_skill: str, moment: datetime):
+        """{"_id", "name"} of the least loaded eligible agent (first loaded wins ties), or None"""
+        state = self._state
+        rows = self._eligible(state, lon, lat, required_skill, moment)
+        if not len(rows):
+            return None
+        row = int(rows[np.argmin(state["workload"][rows])])
+        return {"_id": state["ids"][row], "name": state["names"][row]}
+
+    def batch_view(self, lons, lats, required_skills: list, moment: datetime) -> dict:
+        """
+        Inputs for dispatching many requests at once: per request, the rows of the
+        agents whose fence covers it and whether each has the skill; per agent row,
+        id, name, base (fence centroid), on-shift flag and cached workload
+        """
+        state = self._state
+        minute = minute_of_week(moment)
+        covering, skilled = [], []
+        for lon, lat, skill in zip(lons, lats, required_skills):
+            rows = self._covering(state, lon, lat)
+            has_skill = np.zeros(len(rows), dtype=bool)
+            for name in [skill, "general"]:
+                if name in state["skills"]:
+                    has_skill |= state["skills"][name][rows]
+            covering.append(rows)
+            skilled.append(has_skill)
+        return {
+            "covering": covering,
+            "skilled": skilled,
+            "ids": state["ids"],
+            "names": state["names"],
+            "centers": state["centers"],
+            "on_shift": (state["availability"][:, minute >> 3] >> (7 - (minute & 7))) & 1 == 1,
+            "workload": state["workload"].copy()
+        }
+
+    def workload(self, agent_id: str):
+        """Cached current_workload of an indexed agent, or None"""
+        row = self._state["positions"].get(agent_id)
+        return None if row is None else int(self._state["workload"][row])
+
+    def center(self, agent_id: str):
+        """(lon, lat) base of an indexed agent (fence centroid), or None"""
+        row = self._state["positions"].get(agent_id)
+        return None if row is None else tuple(self._state["centers"][row].tolist())
+
+    def add_workload(self, agent_id: str, delta: int):
+        row = self._state["positions"].get(agent_id)
+        if row is not None:
+            self._state["workload"][row] += delta
+
+    def set_workloads(self, agents: list):
+        """Overwrite the cached workloads from agent documents (_id, current_workload)"""
+        state = self._state
+        for agent in agents:
+            row = state["positions"].get(str(agent["_id"]))
+            if row is not None:
+                state["workload"][row] = agent.get("current_workload") or 0
+
+# Active agents with a geo-fence; loaded at startup, reloaded on agent create/update
+agent_index = AgentIndex()
@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "256"))
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "300"))  # 5 minutes
+
+class AsyncLRUCache:
+    """
+    Bounded LRU cache with a TTL and single-flight recomputation.
+
+    Concurrent misses on the same key share one computation instead of each
+    running the query. A key's scope is its first element when it is a tuple
+    (the endpoint, e.g. "kpis"), and invalidate() drops and bumps the
+    generation of just the scopes a write changed, so results computed from
+    data read before the write are never stored and unrelated entries stay.
+    """
+
+    def __init__(self, max_entries: int = ANALYTICS_CACHE_MAX_ENTRIES, ttl: float = ANALYTICS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._inflight = {}            # key -> asyncio.Future
+        self._generation = 0           # full invalidations
+        self._scope_generations = {}   # scope -> scoped invalidations
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _scope(key: Hashable):
+        return key[0] if isinstance(key, tuple) and key else key
+
+    def _generation_of(self, key: Hashable) -> tuple:
+        return self._generation, self._scope_generations.get(self._scope(key), 0)
+
+    def get(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]):
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        generation = self._generation_of(key)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # waiters re-raise it; don't warn if there were none
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+        if generation == self._generation_of(key):
+            self.set(key, value)
+        future.set_result(value)
+        return value
+
+    def discard(self, key: Hashable):
+        """Drop one entry the caller found to be stale"""
+        self._entries.pop(key, None)
+
+    def invalidate(self, *scopes):
+        """Drop the entries of the given scopes, or every entry if none are given; call after a write they depend on"""
+        self.invalidations += 1
+        if not scopes:
+            self._generation += 1
+            self._entries.clear()
+            self._inflight.clear()
+            return
+        for scope in scopes:
+            self._scope_generations[scope] = self._scope_generations.get(scope, 0) + 1
+        for key in [key for key in self._entries if self._scope(key) in scopes]:
+            del self._entries[key]
+        for key in [key for key in self._inflight if self._scope(key) in scopes]:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0
+        }
+
+# Shared by the analytics endpoints. Write paths invalidate only the scopes
+# whose source data they changed:
+# - read from the rollups; sync_rollups() invalidates them when it moves counters
+ROLLUP_SCOPES = ("kpis", "trends")
+# - read from open requests' location, status and priority
+REQUEST_MAP_SCOPES = ("heatmap_grid", "zone_counts", "zones_geojson")
+# - read from the zone definitions
+ZONE_SCOPES = ("zones", "zones_geojson")
+analytics_cache = AsyncLRUCache()
@@ -0,0 +1,231 @@
+import numpy as np
+from app.utils.common import OPEN_STATUSES
+from app.utils.tiles import lonlat_to_unit, PRIORITY_CODES
+
+# Hierarchical point clustering for the staff map.
+#
+# Clusters are Web Mercator quadtree cells: at zoom z a cluster is a cell
+# CLUSTER_CELLS_PER_TILE times smaller than a map tile, so a cell at zoom z
+# splits into exactly four cells at zoom z + 1. A cluster id ("z/cx/cy") thus
+# identifies the same set of points at every zoom and expand() just descends
+# into the children. Points live in flat NumPy columns with tombstones, so
+# create/transition updates are O(1) and a viewport query is one masked
+# np.unique over the points inside the bbox.
+
+CLUSTER_CELLS_PER_TILE = 4      # 64px clusters on 256px tiles
+CLUSTER_CELL_BITS = 2           # log2(CLUSTER_CELLS_PER_TILE)
+CLUSTER_MAX_ZOOM = 18           # beyond this every point is returned on its own
+INITIAL_CAPACITY = 1024
+DENSE_CELL_LIMIT = 1 << 20      # above this many cells in the bbox, bin with a sort instead
+
+class ClusterIndex:
+    def __init__(self):
+        self._reset(INITIAL_CAPACITY)
+
+    def _reset(self, capacity: int):
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.lon = np.zeros(capacity)
+        self.lat = np.zeros(capacity)
+        self.priority = np.zeros(capacity, dtype=np.int8)
+        self.category = np.zeros(capacity, dtype=np.int16)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.ids = [None] * capacity
+        self.slots = {}          # request_id -> row
+        self.categories = {}     # category name -> code
+        self.size = 0            # rows in use, including tombstones
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _category_code(self, category) -> int:
+        return self.categories.setdefault(category, len(self.categories))
+
+    def _grow(self):
+        capacity = len(self.x) * 2
+        for name in ["x", "y", "lon", "lat", "priority", "category", "alive"]:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+        self.ids.extend([None] * (capacity - len(self.ids)))
+
+    def load(self, requests: list):
+        """Replace the index with (request_id, [lon, lat], priority, category) tuples, vectorized"""
+        requests = [r for r in requests if r[1]]
+        self._reset(max(INITIAL_CAPACITY, len(requests) * 2))
+        count = len(requests)
+        if not count:
+            return
+        coords = np.array([r[1][:2] for r in requests], dtype=float)
+        ux, uy = lonlat_to_unit(coords[:, 0], coords[:, 1])
+        self.x[:count], self.y[:count] = ux, uy
+        self.lon[:count], self.lat[:count] = coords[:, 0], coords[:, 1]
+        self.priority[:count] = [PRIORITY_CODES.index(r[2]) if r[2] in PRIORITY_CODES else -1 for r in requests]
+        self.category[:count] = [self._category_code(r[3]) for r in requests]
+        self.alive[:count] = True
+        self.ids[:count] = [r[0] for r in requests]
+        self.slots = {r[0]: row for row, r in enumerate(requests)}
+        self.size = count
+
+    def upsert(self, request_id: str, coordinates, priority: str, category: str):
+        if not coordinates:
+            return self.remove(request_id)
+        row = self.slots.get(request_id)
+        if row is None:
+            if self.size == len(self.x):
+                self._compact_or_grow()
+            row = self.size
+            self.size += 1
+            self.slots[request_id] = row
+            self.ids[row] = request_id
+        lon, lat = coordinates[0], coordinates[1]
+        ux, uy = lonlat_to_unit([lon], [lat])
+        self.x[row], self.y[row] = ux[0], uy[0]
+        self.lon[row], self.lat[row] = lon, lat
+        self.priority[row] = PRIORITY_CODES.index(priority) if priority in PRIORITY_CODES else -1
+        self.category[row] = self._category_code(category)
+        self.alive[row] = True
+
+    def remove(self, request_id: str):
+        row = self.slots.pop(request_id, None)
+        if row is not None:
+            self.alive[row] = False
+            self.ids[row] = None
+
+    def _compact_or_grow(self):
+        """Reuse tombstoned rows if they make up a quarter of the table, else double it"""
+        if len(self.slots) > self.size * 3 // 4:
+            return self._grow()
+        live = np.nonzero(self.alive[:self.size])[0]
+        for name in ["x", "y", "lon", "lat", "priority", "category"]:
+            column = getattr(self, name)
+            column[:len(live)] = column[live]
+        self.alive[:] = False
+        self.alive[:len(live)] = True
+        self.ids = [self.ids[row] for row in live] + [None] * (len(self.ids) - len(live))
+        self.slots = {request_id: row for row, request_id in enumerate(self.ids[:len(live)])}
+        self.size = len(live)
+
+    def _select(self, bbox=None, priority=None, category=None) -> np.ndarray:
+        mask = self.alive[:self.size].copy()
+        if bbox:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            lon, lat = self.lon[:self.size], self.lat[:self.size]
+            mask &= (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+        if priority:
+            mask &= self.priority[:self.size] == (PRIORITY_CODES.index(priority) if priority in PRIORITY_CODES else -2)
+        if category:
+            mask &= self.category[:self.size] == self.categories.get(category, -1)
+        return np.nonzero(mask)[0]
+
+    def _group(self, rows: np.ndarray, zoom: int) -> list:
+        """Cluster rows into zoom's cells -> GeoJSON features (single points stay points)"""
+        if not len(rows):
+            return []
+        if zoom > CLUSTER_MAX_ZOOM:
+            return [self._point_feature(row) for row in rows]
+        scale = 2 ** (zoom + CLUSTER_CELL_BITS)
+        cx = np.minimum((self.x[rows] * scale).astype(np.int64), scale - 1)
+        cy = np.minimum((self.y[rows] * scale).astype(np.int64), scale - 1)
+        x0, y0 = cx.min(), cy.min()
+        width = int(cx.max() - x0 + 1)
+        local = (cy - y0) * width + (cx - x0)
+        cells = width * int(cy.max() - y0 + 1)
+        if cells <= DENSE_CELL_LIMIT:
+            # Dense bin counts over the occupied cell range: O(n), no sort
+            counts = np.bincount(local, minlength=cells)
+            occupied = np.nonzero(counts)[0]
+            slot = np.empty(cells, dtype=np.int64)
+            slot[occupied] = np.arange(len(occupied))
+            inverse = slot[local]
+            counts = counts[occupied]
+        else:
+            occupied, inverse, counts = np.unique(local, return_inverse=True, return_counts=True)
+        keys = (occupied // width + y0) * scale + (occupied % width + x0)
+        # For single-point cells this is exactly that point's row
+        first = np.bincount(inverse, weights=rows).astype(np.int64)
+        lons = np.bincount(inverse, weights=self.lon[rows]) / counts
+        lats = np.bincount(inverse, weights=self.lat[rows]) / counts
+        codes = self.priority[rows].astype(np.int64)
+        known = codes >= 0
+        by_priority = np.bincount(
+            inverse[known] * len(PRIORITY_CODES) + codes[known], minlength=len(keys) * len(PRIORITY_CODES)
+        ).reshape(len(keys), len(PRIORITY_CODES))
+
+        features = []
+        for i, key in enumerate(keys):
+            if counts[i] == 1:
+                features.append(self._point_feature(first[i]))
+                continue
+            priorities = {PRIORITY_CODES[p]: int(n) for p, n in enumerate(by_priority[i]) if n}
+            top = max(priorities, key=PRIORITY_CODES.index) if priorities else "medium"
+            features.append({
+                "type": "Feature",
+                "properties": {
+                    "cluster": True,
+                    "cluster_id": f"{zoom}/{int(key % scale)}/{int(key // scale)}",
+                    "point_count": int(counts[i]),
+                    "priority": top,
+                    "priorities": priorities
+                },
+                "geometry": {"type": "Point", "coordinates": [round(float(lons[i]), 6), round(float(lats[i]), 6)]}
+            })
+        return features
+
+    def _point_feature(self, row: int) -> dict:
+        code = int(self.priority[row])
+        return {
+            "type": "Feature",
+            "properties": {
+                "cluster": False,
+                "request_id": self.ids[row],
+                "priority": PRIORITY_CODES[code] if code >= 0 else None
+            },
+            "geometry": {"type": "Point", "coordinates": [float(self.lon[row]), float(self.lat[row])]}
+        }
+
+    def clusters(self, bbox, zoom: int, priority=None, category=None) -> list:
+        return self._group(self._select(bbox, priority, category), zoom)
+
+    def _cell_rows(self, cluster_id: str, priority=None, category=None):
+        try:
+            zoom, cx, cy = [int(part) for part in cluster_id.split("/")]
+        except ValueError:
+            return None, None
+        if not 0 <= zoom <= CLUSTER_MAX_ZOOM:
+            return None, None
+        scale = 2 ** (zoom + CLUSTER_CELL_BITS)
+        rows = self._select(None, priority, category)
+        in_cell = (
+            (np.minimum((self.x[rows] * scale).astype(np.int64), scale - 1) == cx) &
+            (np.minimum((self.y[rows] * scale).astype(np.int64), scale - 1) == cy)
+        )
+        return zoom, rows[in_cell]
+
+    def expand(self, cluster_id: str, priority=None, category=None):
+        """
+        Children of a cluster at the first zoom where it actually splits, as
+        (expansion_zoom, features); (None, None) if the id is unknown or empty
+        """
+        zoom, rows = self._cell_rows(cluster_id, priority, category)
+        if rows is None or not len(rows):
+            return None, None
+        for child_zoom in range(zoom + 1, CLUSTER_MAX_ZOOM + 2):
+            features = self._group(rows, child_zoom)
+            if len(features) > 1:
+                return child_zoom, features
+        return CLUSTER_MAX_ZOOM + 1, self._group(rows, CLUSTER_MAX_ZOOM + 1)
+
+# Open requests on the staff map; loaded at startup, kept current by the request write paths
+request_clusters = ClusterIndex()
+
+def track_request(req: dict):
+    """Mirror a request write into request_clusters: open requests are shown, others dropped"""
+    if not req or "request_id" not in req:
+        return
+    if req.get("status") in OPEN_STATUSES:
+        coordinates = (req.get("location") or {}).get("coordinates")
+        request_clusters.upsert(req["request_id"], coordinates, req.get("priority"), req.get("category"))
+    else:
+        request_clusters.remove(req["request_id"])
@@ -2,19 +2,40 @@ import random
 import string
 from datetime import datetime
 
-def generate_request_id(counter: int) -> str:
+# Statuses that still count against a request's SLA
+OPEN_STATUSES = ["new", "triaged", "assigned", "in_progress"]
+
+# Simple State Machine
+WORKFLOW_TRANSITIONS = {
+    "new": ["triaged", "closed"], # Can be rejected/closed directly
+    "triaged": ["assigned", "closed"],
+    "assigned": ["in_progress", "triaged"], # Can be sent back to triage
+    "in_progress": ["resolved", "assigned"], # Can be reassigned
+    "resolved": ["closed", "in_progress"], # Can be reopened
+    "closed": [] # Terminal state
+}
+
+def generate_request_id(counter: int, year: int = None) -> str:
     """Generates a request ID in the format CST-YYYY-XXXX"""
-    year = datetime.now().year
+    year = year or datetime.now().year
     return f"CST-{year}-{counter:04d}"
 
 def get_allowed_transitions(current_status: str) -> list:
     """Returns allowed next states based on current state (Simple State Machine)"""
-    transitions = {
-        "new": ["triaged", "closed"], # Can be rejected/closed directly
-        "triaged": ["assigned", "closed"],
-        "assigned": ["in_progress", "triaged"], # Can be sent back to triage
-        "in_progress": ["resolved", "assigned"], # Can be reassigned
-        "resolved": ["closed", "in_progress"], # Can be reopened
-        "closed": [] # Terminal state
-    }
-    return transitions.get(current_status, [])
+    return WORKFLOW_TRANSITIONS.get(current_status, [])
+
+def get_source_states(new_status: str) -> list:
+    """Returns the states from which a transition to new_status is allowed"""
+    return [state for state, allowed in WORKFLOW_TRANSITIONS.items() if new_status in allowed]
+
+def with_fields(doc: dict, fields: dict) -> dict:
+    """Copy of doc with a $set's (possibly dotted) fields applied"""
+    doc = dict(doc)
+    for path, value in fields.items():
+        target = doc
+        *parents, leaf = path.split(".")
+        for parent in parents:
+            target[parent] = dict(target.get(parent) or {})
+            target = target[parent]
+        target[leaf] = value
+    return doc
@@ -0,0 +1,165 @@
+import heapq
+import numpy as np
+from app.utils.geo import haversine_matrix
+
+# Batch dispatch: assign many triaged requests to agents at once.
+#
+# Each request may go to any agent whose geo-fence covers it. An agent takes
+# several requests through capacity slots: its k-th new request costs
+# WORKLOAD_WEIGHT more per task already on its plate, so work spreads out
+# unless distance says otherwise. A (request, agent) pair costs
+#
+#     DISTANCE_WEIGHT * km from the agent's base
+#   + SKILL_PENALTY if the agent lacks the skill (and is not "general")
+#   + OFF_SHIFT_PENALTY if the agent is off shift
+#
+# plus the workload term for the slot it takes. The penalties dwarf any
+# distance or workload difference, so, like one-at-a-time auto-assignment,
+# a skilled agent is preferred to an unskilled one and an on-shift agent to
+# an off-shift one; an unskilled or off-shift agent is still better than
+# leaving the request unplaced.
+#
+# The plan is a min-cost flow solved with successive shortest paths (Dijkstra
+# with potentials over requests, agents and a sink behind every agent's free
+# slots). Requests enter most urgent first and each one is placed if any
+# chain of reassignments frees a slot for it, so the plan places as many
+# requests as any assignment could, favours the more urgent ones when they
+# compete for the last slots, and has the lowest total cost for the
+# requests it places. Placed requests are never dropped to make room for
+# later ones. Each request is limited to its CANDIDATES cheapest agents so
+# the graph stays sparse however many agents cover a city.
+
+DISTANCE_WEIGHT = 1.0           # per km
+SKILL_PENALTY = 1000.0
+OFF_SHIFT_PENALTY = 100.0
+WORKLOAD_WEIGHT = 2.0           # per active task
+SLA_URGENCY_HOURS = 24          # urgency rises from 0 to 1 over the last day before breach, 2 when well overdue
+CANDIDATES = 25
+DEFAULT_MAX_WORKLOAD = 10       # active tasks an agent is filled up to
+
+def sla_urgency(hours_left: np.ndarray) -> np.ndarray:
+    """0 (a day or more left, or no deadline) .. 1 (due now) .. 2 (a day or more overdue)"""
+    hours = np.nan_to_num(np.asarray(hours_left, dtype=float), nan=SLA_URGENCY_HOURS)
+    return np.clip(1 - hours / SLA_URGENCY_HOURS, 0, 2)
+
+def _candidate_arcs(lons, lats, view, capacity) -> tuple:
+    """Per request: its CANDIDATES cheapest agents with open slots as (agent row, cost) pairs, and km by agent row"""
+    arcs, km_by_agent = [], []
+    for i in range(len(lons)):
+        rows = view["covering"][i]
+        open_rows = capacity[rows] > 0
+        rows, skilled = rows[open_rows], view["skilled"][i][open_rows]
+        if not len(rows):
+            arcs.append([])
+            km_by_agent.append({})
+            continue
+        centers = view["centers"][rows]
+        km = haversine_matrix([lons[i]], [lats[i]], centers[:, 0], centers[:, 1])[0]
+        cost = DISTANCE_WEIGHT * km + SKILL_PENALTY * ~skilled + OFF_SHIFT_PENALTY * ~view["on_shift"][rows]
+        keep = np.argsort(cost + WORKLOAD_WEIGHT * view["workload"][rows], kind="stable")[:CANDIDATES]
+        arcs.append(list(zip(rows[keep].tolist(), cost[keep].tolist())))
+        km_by_agent.append(dict(zip(rows[keep].tolist(), km[keep].tolist())))
+    return arcs, km_by_agent
+
+def plan_dispatch(lons, lats, hours_left, view: dict, max_workload: int) -> list:
+    """
+    (request index, agent row, km) for every request that can be placed, given
+    AgentIndex.batch_view() for the same requests; agents are filled up to
+    max_workload active tasks. Requests are taken most urgent first.
+    Unlike one-at-a-time auto-assignment, the cap is hard: once every skilled
+    agent covering a spot is full, further requests there go to unskilled
+    agents (or stay unplaced) rather than overloading the skilled ones.
+    """
+    count = len(lons)
+    inf = float("inf")
+    capacity = np.maximum(max_workload - view["workload"], 0)
+    arcs, km_by_agent = _candidate_arcs(lons, lats, view, capacity)
+    # Nodes: requests 0..count-1, agents count + row, sink -1 (last slot; popped first on ties)
+    sink = -1
+    size = count + len(view["ids"]) + 1
+    arcs = [[(count + row, cost) for row, cost in request_arcs] for request_arcs in arcs]
+    potential = [0.0] * size
+    dist = [inf] * size
+    prev = [0] * size
+    searched = [-1] * size       # source whose search settled the node
+    agent_of = {}                # request -> agent node
+    members = [{} for _ in view["ids"]]     # agent row -> {request: pair cost}
+    free_slots = capacity.tolist()
+    slot_cost = (WORKLOAD_WEIGHT * view["workload"]).tolist()   # cost of the agent's next slot
+
+    for source in np.argsort(-sla_urgency(hours_left), kind="stable").tolist():
+        if not arcs[source]:
+            continue
+        # Unplaced requests have no incoming arcs, so any potential that keeps their own arcs non-negative will do
+        potential[source] = max(potential[agent] - cost for agent, cost in arcs[source])
+        dist[source] = 0.0
+        touched, settled, heap = [source], [source], []
+        for agent, cost in arcs[source]:
+            reduced = cost + potential[source] - potential[agent]
+            if reduced < dist[agent]:
+                if dist[agent] == inf:
+                    touched.append(agent)
+                dist[agent] = reduced
+                prev[agent] = source
+                heapq.heappush(heap, (reduced, agent))
+        searched[source] = source
+        reached = False
+        while heap:
+            d, node = heapq.heappop(heap)
+            if searched[node] == source:
+                continue
+            if node == sink:
+                reached = True
+                break
+            searched[node] = source
+            settled.append(node)
+            row = node - count
+            base = d + potential[node]
+            if free_slots[row]:
+                reduced = base + slot_cost[row] - potential[sink]
+                if reduced < dist[sink]:
+                    if dist[sink] == inf:
+                        touched.append(sink)
+                    dist[sink] = reduced
+                    prev[sink] = node
+                    heapq.heappush(heap, (reduced, sink))
+            # Hand one of the agent's requests to another agent; the request is reached only from here
+            for request, pair_cost in members[row].items():
+                if searched[request] == source:
+                    continue
+                searched[request] = source
+                dist[request] = base - pair_cost - potential[request]
+                prev[request] = node
+                touched.append(request)
+                settled.append(request)
+                request_base = base - pair_cost
+                for agent, cost in arcs[request]:
+                    reduced = request_base + cost - potential[agent]
+                    if reduced < dist[agent] and agent != node and searched[agent] != source:
+                        if dist[agent] == inf:
+                            touched.append(agent)
+                        dist[agent] = reduced
+                        prev[agent] = request
+                        heapq.heappush(heap, (reduced, agent))
+
+        if reached:
+            top = dist[sink]
+            for node in settled:
+                if dist[node] < top:
+                    potential[node] += dist[node] - top
+            node = prev[sink]
+            free_slots[node - count] -= 1
+            slot_cost[node - count] += WORKLOAD_WEIGHT
+            while True:
+                request = prev[node]
+                if request in agent_of:
+                    del members[agent_of[request] - count][request]
+                agent_of[request] = node
+                members[node - count][request] = dict(arcs[request])[node]
+                if request == source:
+                    break
+                node = prev[request]
+        for node in touched:
+            dist[node] = inf
+
+    return [(i, node - count, km_by_agent[i][node - count]) for i, node in sorted(agent_of.items())]
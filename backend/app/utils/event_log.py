@@ -0,0 +1,46 @@
+import asyncio
+from pymongo import UpdateOne
+from app.database import get_database
+from app.utils.rollups import flush_rollups
+
+db = get_database()
+
+# performance_logs writes are buffered and flushed in ordered batches so the
+# audit trail never sits on the client's critical path. The same loop flushes
+# the rollup syncs queued by request writes (see app/utils/rollups.py).
+FLUSH_INTERVAL_SECONDS = 0.5
+MAX_PENDING = 500
+
+_pending = []
+_flush_lock = asyncio.Lock()
+
+def log_event(request_id: str, event: dict, set_fields: dict = None, inc_fields: dict = None):
+    """Queue an event_stream append (plus optional $set/$inc) for a request's performance log"""
+    update = {"$push": {"event_stream": event}}
+    if set_fields:
+        update["$set"] = set_fields
+    if inc_fields:
+        update["$inc"] = inc_fields
+    _pending.append(UpdateOne({"request_id": request_id}, update))
+    if len(_pending) >= MAX_PENDING:
+        asyncio.get_running_loop().create_task(flush_events())
+
+async def flush_events():
+    """Write all queued events in one ordered bulk_write"""
+    # The lock keeps batches in submission order when a size-triggered flush overlaps the timer
+    async with _flush_lock:
+        if not _pending:
+            return
+        batch = _pending[:]
+        _pending.clear()
+        try:
+            await db.performance_logs.bulk_write(batch, ordered=True)
+        except Exception as e:
+            print(f"Performance log error: {e}")
+
+async def run_event_flusher():
+    """Background loop started with the app"""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        await flush_events()
+        await flush_rollups()
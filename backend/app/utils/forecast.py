@@ -0,0 +1,43 @@
+import numpy as np
+
+# Short-horizon forecasts for many count series at once.
+#
+# Each series is split into a seasonal profile (the average of its last
+# SEASON_CYCLES full cycles, centered on zero: a smoothed seasonal naive
+# model) and a level, tracked by simple exponential smoothing of the
+# deseasonalized series. The forecast is level + profile, floored at zero.
+# Every step is a matrix operation over all series; the smoothing recursion
+# is unrolled into one weighted sum.
+
+SMOOTHING_ALPHA = 0.3
+SEASON_CYCLES = 4
+
+def ses_level(x: np.ndarray, alpha: float = SMOOTHING_ALPHA) -> np.ndarray:
+    """Final simple-exponential-smoothing level of each row of x (level starts at the first value)"""
+    length = x.shape[1]
+    if not length:
+        return np.zeros(x.shape[0])
+    weights = alpha * (1 - alpha) ** np.arange(length - 1, -1, -1, dtype=float)
+    weights[0] = (1 - alpha) ** (length - 1)
+    return x @ weights
+
+def seasonal_profile(y: np.ndarray, season: int) -> np.ndarray:
+    """(series, season) zero-mean profile; phase p is the position p steps after the end of y, mod season"""
+    cycles = min(SEASON_CYCLES, y.shape[1] // season) if season > 1 else 0
+    if not cycles:
+        return np.zeros((y.shape[0], max(season, 1)))
+    recent = y[:, y.shape[1] - cycles * season:].reshape(y.shape[0], cycles, season).mean(axis=1)
+    return recent - recent.mean(axis=1, keepdims=True)
+
+def forecast(y: np.ndarray, horizon: int, season: int, alpha: float = SMOOTHING_ALPHA) -> np.ndarray:
+    """Forecast the next horizon steps of every row of y: shape (series, horizon)"""
+    y = np.asarray(y, dtype=float)
+    if not horizon:
+        return np.zeros((y.shape[0], 0))
+    if not y.shape[1]:
+        return np.zeros((y.shape[0], horizon))
+    profile = seasonal_profile(y, season)
+    period = profile.shape[1]
+    history_phase = (np.arange(y.shape[1]) - y.shape[1]) % period
+    level = ses_level(y - profile[:, history_phase], alpha)
+    return np.maximum(level[:, None] + profile[:, np.arange(horizon) % period], 0)
@@ -0,0 +1,148 @@
+import math
+from collections import defaultdict
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE_LAT = 111.32
+
+def calculate_distance(lon1, lat1, lon2, lat2):
+    """Calculate distance in km between two coordinates using Haversine formula"""
+    R = EARTH_RADIUS_KM
+
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+    return R * c
+
+def haversine_matrix(lons1, lats1, lons2, lats2):
+    """Pairwise Haversine distances in km, shape (len(lons1), len(lons2))"""
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lons2, dtype=float))[None, :] - np.radians(np.asarray(lons1, dtype=float))[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+class PointGridIndex:
+    """
+    Uniform lon/lat grid over point locations for fixed-radius lookups.
+
+    Cells are `cell_km` tall; a radius query only visits the cells overlapping
+    the query's bounding box and runs haversine on those candidates, so lookup
+    cost depends on local density rather than registry size.
+    """
+
+    def __init__(self, locations: list, cell_km: float = 0.5):
+        self.cell_deg = cell_km / KM_PER_DEGREE_LAT
+        self.locations = list(locations)
+        self.cells = defaultdict(list)
+        self.coordinates = np.array([loc["coordinates"] for loc in self.locations], dtype=float).reshape(-1, 2)
+        for position, loc in enumerate(self.locations):
+            lon, lat = loc["coordinates"]
+            self.cells[self._cell(lon, lat)].append(position)
+
+    def _cell(self, lon, lat):
+        return (math.floor(lon / self.cell_deg), math.floor(lat / self.cell_deg))
+
+    def candidates(self, lon, lat, radius_km):
+        """Positions of locations in cells overlapping the radius bounding box"""
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        dlon = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        min_x, min_y = self._cell(lon - dlon, lat - dlat)
+        max_x, max_y = self._cell(lon + dlon, lat + dlat)
+        found = []
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                found.extend(self.cells.get((x, y), ()))
+        return found
+
+    def within(self, lon, lat, radius_km):
+        """(location, distance_km) pairs within radius, in registry order"""
+        matches = []
+        for position in sorted(self.candidates(lon, lat, radius_km)):
+            loc = self.locations[position]
+            distance = calculate_distance(lon, lat, loc["coordinates"][0], loc["coordinates"][1])
+            if distance <= radius_km:
+                matches.append((loc, distance))
+        return matches
+
+    def within_many(self, lons, lats, radius_km, max_pairs=2_000_000):
+        """
+        Batch form of within(): one result list per query point.
+
+        Registry entries outside the batch's bounding box (padded by the radius)
+        are dropped first, then distances are computed as NumPy matrices in row
+        blocks so memory stays bounded by max_pairs.
+        """
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        results = [[] for _ in range(len(lons))]
+        if not len(lons) or not len(self.locations):
+            return results
+
+        dlat = radius_km / KM_PER_DEGREE_LAT
+        max_abs_lat = min(float(np.abs(lats).max()) + dlat, 89.0)
+        dlon = radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(max_abs_lat)))
+        loc_lons, loc_lats = self.coordinates[:, 0], self.coordinates[:, 1]
+        in_box = np.nonzero(
+            (loc_lons >= lons.min() - dlon) & (loc_lons <= lons.max() + dlon) &
+            (loc_lats >= lats.min() - dlat) & (loc_lats <= lats.max() + dlat)
+        )[0]
+        if not len(in_box):
+            return results
+
+        rows_per_block = max(1, max_pairs // len(in_box))
+        for start in range(0, len(lons), rows_per_block):
+            block = slice(start, start + rows_per_block)
+            distances = haversine_matrix(lons[block], lats[block], loc_lons[in_box], loc_lats[in_box])
+            for row, col in zip(*np.nonzero(distances <= radius_km)):
+                results[start + row].append((self.locations[in_box[col]], float(distances[row, col])))
+        return results
+
+def polygon_parts(geometry: dict) -> list:
+    """Polygon / MultiPolygon GeoJSON -> list of polygons, each a list of rings"""
+    if not geometry:
+        return []
+    if geometry.get("type") == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry.get("type") == "MultiPolygon":
+        return list(geometry["coordinates"])
+    return []
+
+def simplify_ring(points, tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker simplification of a closed ring or open line, shape (n, 2).
+    Keeps the endpoints; never reduces a ring below 4 points (3 + closing point).
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) <= 4 or tolerance <= 0:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = math.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    if keep.sum() < 4:
+        # Degenerate at this tolerance; keep the most distant corners so the ring stays valid
+        keep[np.linspace(0, len(points) - 1, 4).astype(int)] = True
+    return points[keep]
@@ -0,0 +1,269 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# Recurring-issue hotspots: grid-based density clustering of request locations.
+#
+# Points are binned into square cells of the requested radius. A cell is
+# dense when its 3x3 neighbourhood holds at least min_reports requests (the
+# grid form of a DBSCAN core test), and touching dense cells form one
+# hotspot. Requests are kept in time order in flat NumPy columns, and each
+# (window, category, radius) query keeps its cell -> rows map between calls:
+# a refresh only adds the requests created since the last one and drops the
+# ones that fell out of the window, so the cost follows new requests, not
+# total history.
+
+METERS_PER_DEGREE = 111_320
+HOTSPOT_MAX_WINDOW_DAYS = 365
+INITIAL_CAPACITY = 1024
+KEY_SHIFT = 1 << 32             # cell key = cx * KEY_SHIFT + (cy + KEY_OFFSET)
+KEY_OFFSET = 1 << 31
+NEIGHBOUR_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+MAX_GRIDS = 64                  # cached (window, category, radius) combinations
+EPOCH = datetime(1970, 1, 1)
+
+def to_meters(lons, lats) -> tuple:
+    """Local equirectangular projection; accurate to well under 1% within a city"""
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    return lons * METERS_PER_DEGREE * np.cos(np.radians(lats)), lats * METERS_PER_DEGREE
+
+def timestamp(moment: datetime) -> float:
+    if moment.tzinfo:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - EPOCH).total_seconds()
+
+class _Grid:
+    """Cell -> rows map for one (window, category, radius), covering rows [lo, hi)"""
+
+    def __init__(self):
+        self.lo = 0
+        self.hi = 0
+        self.cells = {}
+        self.version = 0
+        self.result_key = None
+        self.result = None
+
+class HotspotIndex:
+    def __init__(self):
+        self._reset(INITIAL_CAPACITY)
+
+    def _reset(self, capacity: int):
+        self.t = np.zeros(capacity)
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.lon = np.zeros(capacity)
+        self.lat = np.zeros(capacity)
+        self.category = np.zeros(capacity, dtype=np.int16)
+        self.stars = np.full(capacity, np.nan)
+        self.ids = [None] * capacity
+        self.hints = [None] * capacity
+        self.slots = {}          # request_id -> row
+        self.categories = {}     # category name -> code
+        self.category_names = []
+        self.size = 0
+        self.rating_version = 0
+        self._grids = {}         # (window, category, radius) -> _Grid; dropped whenever rows move
+
+    def __len__(self):
+        return self.size
+
+    def _category_code(self, category) -> int:
+        if category not in self.categories:
+            self.categories[category] = len(self.category_names)
+            self.category_names.append(category)
+        return self.categories[category]
+
+    @staticmethod
+    def _row(req: dict):
+        coordinates = (req.get("location") or {}).get("coordinates")
+        created = (req.get("timestamps") or {}).get("created_at")
+        if not coordinates or not created or "request_id" not in req:
+            return None
+        return (
+            timestamp(created), coordinates[0], coordinates[1], req.get("category"),
+            (req.get("rating") or {}).get("stars"), req["request_id"], (req.get("location") or {}).get("address_hint")
+        )
+
+    def load(self, requests: list):
+        """Replace the index with request documents (location, timestamps.created_at, category, rating, request_id)"""
+        rows = sorted(filter(None, (self._row(r) for r in requests)), key=lambda row: row[0])
+        self._reset(max(INITIAL_CAPACITY, len(rows) * 2))
+        self._write(0, rows)
+
+    def _write(self, start: int, rows: list):
+        end = start + len(rows)
+        if not rows:
+            return
+        t, lons, lats, categories, stars, ids, hints = zip(*rows)
+        self.t[start:end] = t
+        self.lon[start:end], self.lat[start:end] = lons, lats
+        self.x[start:end], self.y[start:end] = to_meters(lons, lats)
+        self.category[start:end] = [self._category_code(c) for c in categories]
+        self.stars[start:end] = [s if s is not None else np.nan for s in stars]
+        self.ids[start:end] = ids
+        self.hints[start:end] = hints
+        for row, request_id in enumerate(ids, start):
+            self.slots[request_id] = row
+        self.size = max(self.size, end)
+
+    def add(self, req: dict):
+        """Index a newly created request"""
+        row = self._row(req)
+        if row is None or row[5] in self.slots:
+            return
+        if self.size and row[0] < self.t[self.size - 1]:
+            # Out of time order (e.g. imported history): rebuild rather than shift every column
+            return self.load([self._as_doc(r) for r in range(self.size)] + [req])
+        if self.size == len(self.t):
+            self._trim_or_grow()
+        self._write(self.size, [row])
+
+    def _as_doc(self, row: int) -> dict:
+        stars = self.stars[row]
+        return {
+            "request_id": self.ids[row],
+            "category": self.category_names[self.category[row]],
+            "location": {"coordinates": [float(self.lon[row]), float(self.lat[row])], "address_hint": self.hints[row]},
+            "timestamps": {"created_at": EPOCH + timedelta(seconds=float(self.t[row]))},
+            "rating": {"stars": float(stars)} if not np.isnan(stars) else None
+        }
+
+    def _trim_or_grow(self):
+        """Drop rows older than the longest window if that frees a quarter of the table, else double it"""
+        cutoff = timestamp(datetime.utcnow()) - HOTSPOT_MAX_WINDOW_DAYS * 86400
+        expired = int(np.searchsorted(self.t[:self.size], cutoff))
+        if expired >= self.size // 4:
+            self.load([self._as_doc(r) for r in range(expired, self.size)])
+            return
+        capacity = len(self.t) * 2
+        for name in ["t", "x", "y", "lon", "lat", "category", "stars"]:
+            column = getattr(self, name)
+            grown = np.full(capacity, np.nan) if name == "stars" else np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+        self.ids.extend([None] * (capacity - len(self.ids)))
+        self.hints.extend([None] * (capacity - len(self.hints)))
+
+    def set_rating(self, request_id: str, stars):
+        row = self.slots.get(request_id)
+        if row is not None:
+            self.stars[row] = stars if stars is not None else np.nan
+            self.rating_version += 1
+
+    def _cell_keys(self, rows: np.ndarray, radius_m: float) -> np.ndarray:
+        cx = np.floor(self.x[rows] / radius_m).astype(np.int64)
+        cy = np.floor(self.y[rows] / radius_m).astype(np.int64)
+        return cx * KEY_SHIFT + (cy + KEY_OFFSET)
+
+    def _refresh(self, grid: _Grid, window_days: int, category, radius_m: float, now: datetime):
+        """Move the grid to rows created within the window: add new rows, drop expired ones"""
+        lo = int(np.searchsorted(self.t[:self.size], timestamp(now) - window_days * 86400))
+        if lo < grid.lo:
+            # Window moved back in time (an explicit older `now`): start over
+            grid.lo, grid.hi, grid.cells = 0, 0, {}
+            grid.version += 1
+        code = self.categories.get(category, -1) if category else None
+        changes = [(grid.lo, min(lo, grid.hi), False), (max(lo, grid.hi), self.size, True)]
+        for start, end, adding in changes:
+            if start >= end:
+                continue
+            rows = np.arange(start, end)
+            if code is not None:
+                rows = rows[self.category[start:end] == code]
+            for row, key in zip(rows.tolist(), self._cell_keys(rows, radius_m).tolist()):
+                if adding:
+                    grid.cells.setdefault(key, set()).add(row)
+                else:
+                    members = grid.cells[key]
+                    members.discard(row)
+                    if not members:
+                        del grid.cells[key]
+            grid.version += 1
+        grid.lo, grid.hi = lo, self.size
+
+    def hotspots(self, window_days: int, category, radius_m: float, min_reports: int, limit: int, now: datetime = None) -> list:
+        """The `limit` largest hotspots among requests created in the last window_days"""
+        now = now or datetime.utcnow()
+        window_days = min(window_days, HOTSPOT_MAX_WINDOW_DAYS)
+        grid_key = (window_days, category, radius_m)
+        grid = self._grids.get(grid_key)
+        if grid is None:
+            if len(self._grids) >= MAX_GRIDS:
+                self._grids.pop(next(iter(self._grids)))
+            grid = self._grids[grid_key] = _Grid()
+        self._refresh(grid, window_days, category, radius_m, now)
+        result_key = (grid.version, self.rating_version, min_reports, limit)
+        if grid.result_key != result_key:
+            grid.result = self._cluster(grid.cells, min_reports, limit)
+            grid.result_key = result_key
+        return grid.result
+
+    def _cluster(self, cells: dict, min_reports: int, limit: int) -> list:
+        if not cells:
+            return []
+        keys = np.fromiter(cells.keys(), dtype=np.int64, count=len(cells))
+        counts = np.fromiter(map(len, cells.values()), dtype=np.int64, count=len(cells))
+        order = np.argsort(keys)
+        keys, counts = keys[order], counts[order]
+
+        neighbours = []
+        density = np.zeros(len(keys), dtype=np.int64)
+        for dx, dy in NEIGHBOUR_OFFSETS:
+            target = keys + dx * KEY_SHIFT + dy
+            pos = np.minimum(np.searchsorted(keys, target), len(keys) - 1)
+            found = keys[pos] == target
+            density[found] += counts[pos[found]]
+            neighbours.append(np.where(found, pos, -1))
+        dense = density >= min_reports
+        if not dense.any():
+            return []
+
+        # Connected components of touching dense cells: hook roots onto the smaller
+        # neighbouring root, then pointer-jump to the roots, until every edge agrees
+        edges = [(np.nonzero(dense & (pos >= 0))[0], pos[dense & (pos >= 0)]) for pos in neighbours]
+        u = np.concatenate([a for a, b in edges])
+        v = np.concatenate([b for a, b in edges])
+        u, v = u[dense[v]], v[dense[v]]
+        parent = np.arange(len(keys))
+        while True:
+            np.minimum.at(parent, parent[u], parent[v])
+            while True:
+                jumped = parent[parent]
+                if np.array_equal(jumped, parent):
+                    break
+                parent = jumped
+            if np.array_equal(parent[u], parent[v]):
+                break
+
+        dense_cells = np.nonzero(dense)[0]
+        sizes = np.bincount(parent[dense_cells], weights=counts[dense_cells])
+        roots = np.nonzero(sizes)[0]
+        roots = roots[np.argsort(-sizes[roots], kind="stable")][:limit]
+        cell_keys = keys.tolist()
+        return [
+            self._describe([row for cell in dense_cells[parent[dense_cells] == root].tolist() for row in cells[cell_keys[cell]]])
+            for root in roots
+        ]
+
+    def _describe(self, rows: list) -> dict:
+        rows = np.array(sorted(rows))
+        lon, lat = float(self.lon[rows].mean()), float(self.lat[rows].mean())
+        cx, cy = to_meters([lon], [lat])
+        radius = float(np.sqrt((self.x[rows] - cx[0]) ** 2 + (self.y[rows] - cy[0]) ** 2).max())
+        stars = self.stars[rows]
+        hints = Counter(h for h in (self.hints[r] for r in rows.tolist()) if h)
+        categories = [self.category_names[c] for c in np.unique(self.category[rows]).tolist()]
+        return {
+            "label": hints.most_common(1)[0][0] if hints else None,
+            "count": len(rows),
+            "center": [round(lon, 6), round(lat, 6)],
+            "radius_m": round(radius, 1),
+            "categories": sorted(c for c in categories if c),
+            "avg_rating": round(float(np.nanmean(stars)), 2) if not np.isnan(stars).all() else None,
+            "last_incident": EPOCH + timedelta(seconds=float(self.t[rows].max())),
+            "request_ids": [self.ids[r] for r in rows[::-1][:20].tolist()]
+        }
+
+# Requests from the last HOTSPOT_MAX_WINDOW_DAYS; loaded at startup, appended to on create
+request_hotspots = HotspotIndex()
@@ -0,0 +1,52 @@
+import json
+import base64
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from fastapi import HTTPException, Response
+
+# Keyset pagination: listings are sorted by (sort_field desc, _id desc) and the
+# next page starts strictly after the last document's (sort_value, _id) pair,
+# so every page is an index range scan no matter how deep it is. Listings
+# take no skip/offset: a page is reached only through the previous page's
+# cursor, since an offset would bring back the scan-and-discard cost.
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(sort_value: datetime, doc_id) -> str:
+    """Opaque, URL-safe token for the position after a document"""
+    payload = json.dumps({"t": sort_value.isoformat() if sort_value else None, "id": str(doc_id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        sort_value = datetime.fromisoformat(payload["t"]) if payload["t"] else None
+        return sort_value, ObjectId(payload["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def keyset_sort(sort_field: str) -> list:
+    return [(sort_field, -1), ("_id", -1)]
+
+def apply_cursor(query: dict, sort_field: str, cursor: Optional[str]) -> dict:
+    """Restrict query to documents that come after the cursor in keyset order"""
+    if not cursor:
+        return query
+    sort_value, doc_id = decode_cursor(cursor)
+    # Expressed as a single range on the sort key (plus a residual filter for ties)
+    # rather than an $or, so the planner keeps one index scan in sort order
+    query[sort_field] = {"$lte": sort_value}
+    query["$nor"] = [{sort_field: sort_value, "_id": {"$gte": doc_id}}]
+    return query
+
+def set_next_cursor(response: Response, docs: list, sort_field: str, limit: int):
+    """Expose the cursor for the following page, if a full page was returned"""
+    if len(docs) < limit or not docs:
+        return
+    last = docs[-1]
+    sort_value = last
+    for part in sort_field.split("."):
+        sort_value = (sort_value or {}).get(part)
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sort_value, last["_id"])
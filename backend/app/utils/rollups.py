@@ -0,0 +1,554 @@
+import asyncio
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne, InsertOne
+from app.database import get_database
+from app.utils.common import WORKFLOW_TRANSITIONS, OPEN_STATUSES
+from app.utils.sketches import DDSketch, sketch_increments
+from app.utils.work_queue import work_queues
+from app.utils.cache import analytics_cache, ROLLUP_SCOPES
+
+db = get_database()
+
+# Time-bucketed KPI rollups.
+#
+# Every request contributes counters to one hourly and one daily row in
+# kpi_rollups, keyed by its creation bucket plus (zone, category, priority,
+# agent). Resolution and SLA breach are counted as events in the rows of the
+# bucket they happened in. trend_rollups repeats those created/resolved/
+# breached event counts per single dimension (all, zone or category) so
+# /analytics/trends reads one row per series and bucket.
+#
+# The fields that decide a request's contribution are snapshotted on it as
+# rollup_state. sync_rollups() compares the live fields with that snapshot
+# and moves the counters from the old rows to the new ones in two phases:
+# it first claims the change with a compare-and-set that advances
+# rollup_state and records the (old, new) pair as rollup_pending, so
+# concurrent writers never apply the same change twice, then writes the
+# counters and clears rollup_pending. A claim whose counter writes failed
+# stays pending and is applied again by the next sync of the request; a
+# claim left behind by a writer that went quiet is taken over once it is
+# ROLLUP_CLAIM_LEASE_SECONDS old.
+#
+# Request write paths do not sync inline: they queue_rollup_sync() the
+# request and the event flusher (app/utils/event_log.py) syncs everything
+# queued in one batch every FLUSH_INTERVAL_SECONDS, so readers see a change
+# within about half a second. Failed or contended syncs are queued again.
+# Queued ids are lost if the process dies, and counter writes that failed
+# halfway through a batch may land twice on retry; neither is repaired by
+# the next sync. run_rollup_reconciler() therefore applies abandoned claims
+# and compares rollup totals with the requests every
+# ROLLUP_RECONCILE_SECONDS, running rebuild_kpi_rollups(), which recomputes
+# everything from the requests, when they disagree.
+#
+# The same diff maintains latency_sketches: one DDSketch per (metric,
+# dimension, key) for resolution and first-response times, so percentile
+# reads are a single indexed find with no per-request work. Every synced
+# request is also passed to the agents' work queues (see
+# app/utils/work_queue.py). Agent workload counters are not derived here;
+# the write paths move them directly (see app/utils/workload.py).
+
+ROLLUP_STATUSES = list(WORKFLOW_TRANSITIONS.keys())
+RATING_STARS = [1, 2, 3, 4, 5]
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+ROLLUP_KEY_FIELDS = ["granularity", "bucket", "zone_id", "category", "priority", "agent_id"]
+STATE_PROJECTION = {
+    "request_id": 1, "status": 1, "category": 1, "priority": 1, "assigned_agent_id": 1,
+    "location.zone_id": 1, "timestamps.created_at": 1, "timestamps.triaged_at": 1,
+    "timestamps.assigned_at": 1, "timestamps.resolved_at": 1, "timestamps.closed_at": 1,
+    "sla_breach_at": 1, "rating.stars": 1, "resolution.resolution_hours": 1, "rollup_state": 1,
+    "rollup_pending": 1, "triage_metadata.high_impact_flag": 1
+}
+# Bump when rollup_state gains fields; startup then rebuilds rollups and sketches
+ROLLUP_STATE_VERSION = 3
+# Sketched metric -> rollup_state field holding the request's value (hours)
+SKETCH_METRICS = {"resolution": "resolved_hours", "first_response": "first_response_hours"}
+# Sketch dimension -> rollup_state field holding the key ("all" has a single None key)
+SKETCH_DIMENSIONS = {"all": None, "zone": "zone_id", "category": "category", "agent": "agent_id"}
+RESOLVED_STATUSES = ["resolved", "closed"]
+# Trend dimension -> rollup_state field holding the key ("all" has a single None key)
+TREND_DIMENSIONS = {"all": None, "zone": "zone_id", "category": "category"}
+TREND_KEY_FIELDS = ["granularity", "dimension", "key", "bucket"]
+REBUILD_BATCH_SIZE = 1000
+MAX_PENDING_SYNCS = 500
+ROLLUP_RECONCILE_SECONDS = 3600
+ROLLUP_CLAIM_LEASE_SECONDS = 60
+CLAIM_ATTEMPTS = 5
+
+# Set once rollups are known to cover every request; /analytics/kpis uses the raw pipeline until then
+rollups_ready = False
+
+_pending_syncs = set()
+_sync_lock = asyncio.Lock()
+_unapplied_claims = set()      # rollup_pending tokens whose counter writes failed in this process
+BUSY = "busy"                  # _claim(): another writer holds the request's claim
+
+def truncate(moment: datetime, granularity: str) -> datetime:
+    if granularity == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _hours_since(created: datetime, moment: datetime):
+    return round((moment - created).total_seconds() / 3600, 4) if moment else None
+
+def rollup_state(req: dict) -> dict:
+    """The fields of a request that decide its rollup contribution (None if it has no creation time)"""
+    timestamps = req.get("timestamps") or {}
+    created = timestamps.get("created_at")
+    if not created:
+        return None
+    stars = (req.get("rating") or {}).get("stars")
+    hours = (req.get("resolution") or {}).get("resolution_hours")
+    # First staff action: triage, assignment or resolution, whichever came first
+    responses = [timestamps.get(f) for f in ["triaged_at", "assigned_at", "resolved_at"] if timestamps.get(f)]
+    resolved = req.get("status") in RESOLVED_STATUSES
+    resolved_at = timestamps.get("resolved_at") if resolved else None
+    finished_at = (resolved_at or timestamps.get("closed_at")) if resolved else None
+    # A request breaches at its deadline unless it was finished by then; deadlines in the
+    # future are counted ahead of time, so readers only look at buckets that have ended
+    breach_at = req.get("sla_breach_at")
+    if breach_at and finished_at and finished_at <= breach_at:
+        breach_at = None
+    return {
+        "version": ROLLUP_STATE_VERSION,
+        "bucket": truncate(created, "hour"),
+        "zone_id": (req.get("location") or {}).get("zone_id"),
+        "category": req.get("category"),
+        "priority": req.get("priority"),
+        "agent_id": req.get("assigned_agent_id"),
+        "status": req.get("status"),
+        "stars": int(stars) if stars is not None else None,
+        "resolution_hours": hours,
+        "resolved_hours": _hours_since(created, resolved_at),
+        "first_response_hours": _hours_since(created, min(responses)) if responses else None,
+        "resolved_bucket": truncate(resolved_at, "hour") if resolved_at else None,
+        "breach_bucket": truncate(breach_at, "hour") if breach_at else None
+    }
+
+def rollup_counters(state: dict, sign: int = 1) -> dict:
+    counters = {"count": sign, f"status.{state['status']}": sign}
+    if state["stars"] is not None:
+        counters[f"rating.{state['stars']}"] = sign
+        counters["rating_sum"] = sign * state["stars"]
+        counters["rating_count"] = sign
+    if state["resolution_hours"] is not None:
+        counters["resolution_hours_sum"] = sign * state["resolution_hours"]
+        counters["resolution_count"] = sign
+    return counters
+
+def rollup_keys(state: dict, bucket: datetime = None) -> list:
+    """Hourly and daily row keys for a request's dimensions, at its creation bucket by default"""
+    return [
+        {
+            "granularity": granularity,
+            "bucket": truncate(bucket or state["bucket"], granularity),
+            "zone_id": state["zone_id"],
+            "category": state["category"],
+            "priority": state["priority"],
+            "agent_id": state["agent_id"]
+        }
+        for granularity in GRANULARITIES
+    ]
+
+def rollup_increments(state: dict, sign: int = 1) -> list:
+    """(row key, $inc counters) for every kpi_rollups row a request contributes to"""
+    increments = [(key, rollup_counters(state, sign)) for key in rollup_keys(state)]
+    for field, counter in [("resolved_bucket", "resolved"), ("breach_bucket", "breached")]:
+        if state[field]:
+            increments.extend((key, {counter: sign}) for key in rollup_keys(state, state[field]))
+    return increments
+
+def trend_increments(state: dict, sign: int = 1) -> list:
+    """(row key, $inc counters) for every trend_rollups row a request contributes to"""
+    increments = []
+    for event, bucket in [("created", state["bucket"]), ("resolved", state["resolved_bucket"]), ("breached", state["breach_bucket"])]:
+        if not bucket:
+            continue
+        for granularity in GRANULARITIES:
+            for dimension, field in TREND_DIMENSIONS.items():
+                key = {
+                    "granularity": granularity,
+                    "dimension": dimension,
+                    "key": state[field] if field else None,
+                    "bucket": truncate(bucket, granularity)
+                }
+                increments.append((key, {event: sign}))
+    return increments
+
+def sketch_values(state: dict) -> list:
+    """(metric, dimension, key, hours) for every sketch a request contributes to"""
+    values = []
+    for metric, field in SKETCH_METRICS.items():
+        hours = state.get(field)
+        if hours is None:
+            continue
+        for dimension, key_field in SKETCH_DIMENSIONS.items():
+            values.append((metric, dimension, state[key_field] if key_field else None, hours))
+    return values
+
+def _state_ops(old: dict, new: dict) -> tuple:
+    """$inc ops moving one request's contribution from old to new: (kpi_rollups, trend_rollups, latency_sketches ops)"""
+    rollup_ops, trend_ops, sketch_ops = [], [], []
+    for state, sign in [(old, -1), (new, 1)]:
+        if not state:
+            continue
+        rollup_ops.extend(UpdateOne(key, {"$inc": counters}, upsert=True) for key, counters in rollup_increments(state, sign))
+        trend_ops.extend(UpdateOne(key, {"$inc": counters}, upsert=True) for key, counters in trend_increments(state, sign))
+        for metric, dimension, key, hours in sketch_values(state):
+            sketch_ops.append(UpdateOne(
+                {"metric": metric, "dimension": dimension, "key": key},
+                {"$inc": sketch_increments(hours, sign)},
+                upsert=True
+            ))
+    return rollup_ops, trend_ops, sketch_ops
+
+async def _claim(req: dict):
+    """
+    Claim one request's rollup change: (_id, token, old, new, taken_over), None
+    if there is nothing to apply, or BUSY if another writer's claim is in flight
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        now = datetime.utcnow()
+        pending = req.get("rollup_pending")
+        if pending:
+            # Applied by nobody yet: ours after failed counter writes, or abandoned by its writer
+            abandoned = pending["claimed_at"] < now - timedelta(seconds=ROLLUP_CLAIM_LEASE_SECONDS)
+            if pending["token"] not in _unapplied_claims and not abandoned:
+                return BUSY
+            _unapplied_claims.discard(pending["token"])
+            token = ObjectId()
+            taken = await db.service_requests.update_one(
+                {"_id": req["_id"], "rollup_pending.token": pending["token"]},
+                {"$set": {"rollup_pending.token": token, "rollup_pending.claimed_at": now}}
+            )
+            if taken.modified_count:
+                return req["_id"], token, pending["old"], pending["new"], True
+        else:
+            old, new = req.get("rollup_state"), rollup_state(req)
+            if old == new:
+                return None
+            token = ObjectId()
+            claimed = await db.service_requests.update_one(
+                {"_id": req["_id"], "rollup_state": old, "rollup_pending": None},
+                {"$set": {"rollup_state": new, "rollup_pending": {"old": old, "new": new, "token": token, "claimed_at": now}}}
+            )
+            if claimed.modified_count:
+                return req["_id"], token, old, new, False
+        # Someone else claimed (or wrote) in between; re-read and try again
+        req = await db.service_requests.find_one({"_id": req["_id"]}, STATE_PROJECTION)
+        if not req:
+            return None
+    return BUSY
+
+async def sync_rollups(query: dict):
+    """Bring the rollup collections, latency_sketches and work queues up to date with every request matching query; call after request writes"""
+    docs = await db.service_requests.find(query, STATE_PROJECTION).to_list()
+    claims = await asyncio.gather(*[_claim(doc) for doc in docs])
+    changes = [claim for claim in claims if claim and claim is not BUSY]
+    # Contended requests, and taken-over claims whose request may have moved on since, need another pass
+    _pending_syncs.update(
+        doc["request_id"] for doc, claim in zip(docs, claims)
+        if claim is BUSY or (claim and claim[4])
+    )
+    collections = [db.kpi_rollups, db.trend_rollups, db.latency_sketches]
+    ops = [[] for _ in collections]
+    for _, _, old, new, _ in changes:
+        for pending, new_ops in zip(ops, _state_ops(old, new)):
+            pending.extend(new_ops)
+    try:
+        for collection, pending in zip(collections, ops):
+            if pending:
+                await collection.bulk_write(pending, ordered=False)
+    except Exception:
+        # The claims stay pending; the next sync of these requests writes their counters again
+        _unapplied_claims.update(token for _, token, _, _, _ in changes)
+        _pending_syncs.update(doc["request_id"] for doc in docs)
+        raise
+    if changes:
+        await db.service_requests.bulk_write([
+            UpdateOne({"_id": _id, "rollup_pending.token": token}, {"$unset": {"rollup_pending": ""}})
+            for _id, token, _, _, _ in changes
+        ], ordered=False)
+        # Only the rollup-backed reads moved; other cached analytics are left alone
+        analytics_cache.invalidate(*ROLLUP_SCOPES)
+    for doc in docs:
+        work_queues.track(doc)
+
+def queue_rollup_sync(request_id: str):
+    """Have the next flush_rollups() sync a request after a write (the request write paths' sync_rollups())"""
+    _pending_syncs.add(request_id)
+    if len(_pending_syncs) >= MAX_PENDING_SYNCS:
+        asyncio.get_running_loop().create_task(flush_rollups())
+
+async def flush_rollups():
+    """Sync every queued request in one batch; called by the event flusher"""
+    async with _sync_lock:
+        if not _pending_syncs:
+            return
+        batch = list(_pending_syncs)
+        _pending_syncs.clear()
+        try:
+            await sync_rollups({"request_id": {"$in": batch}})
+        except Exception as e:
+            print(f"Rollup sync error: {e}")
+            _pending_syncs.update(batch)
+
+async def sync_abandoned_claims():
+    """Apply rollup claims whose writer went quiet (e.g. died between the claim and the counter writes)"""
+    cutoff = datetime.utcnow() - timedelta(seconds=ROLLUP_CLAIM_LEASE_SECONDS)
+    await sync_rollups({"rollup_pending.claimed_at": {"$lt": cutoff}})
+
+async def rollup_drift() -> dict:
+    """Totals on which kpi_rollups and service_requests disagree: {total: (rolled up, actual)}"""
+    rolled_up = await (await db.kpi_rollups.aggregate([
+        {"$match": {"granularity": "day"}},
+        {"$group": {
+            "_id": None,
+            **{status: {"$sum": f"$status.{status}"} for status in ROLLUP_STATUSES},
+            "rated": {"$sum": "$rating_count"},
+            "resolution_timed": {"$sum": "$resolution_count"}
+        }}
+    ])).to_list()
+    actual = await (await db.service_requests.aggregate([
+        {"$match": {"timestamps.created_at": {"$ne": None}}},
+        {"$group": {
+            "_id": None,
+            **{status: {"$sum": {"$cond": [{"$eq": ["$status", status]}, 1, 0]}} for status in ROLLUP_STATUSES},
+            "rated": {"$sum": {"$cond": [{"$ifNull": ["$rating.stars", False]}, 1, 0]}},
+            "resolution_timed": {"$sum": {"$cond": [{"$gt": [{"$ifNull": ["$resolution.resolution_hours", -1]}, -1]}, 1, 0]}}
+        }}
+    ])).to_list()
+    rolled_up, actual = (rolled_up or [{}])[0], (actual or [{}])[0]
+    totals = ROLLUP_STATUSES + ["rated", "resolution_timed"]
+    return {
+        total: (rolled_up.get(total, 0), actual.get(total, 0))
+        for total in totals if rolled_up.get(total, 0) != actual.get(total, 0)
+    }
+
+async def reconcile_rollups() -> bool:
+    """Rebuild the rollups if their totals drifted from the requests; returns whether it rebuilt"""
+    await sync_abandoned_claims()
+    await flush_rollups()
+    if not await rollup_drift():
+        return False
+    # A write may have landed between the two aggregations; only drift that survives a second look counts
+    await flush_rollups()
+    drift = await rollup_drift()
+    if not drift:
+        return False
+    print(f"KPI rollups drifted from the requests ({drift}); rebuilding.")
+    await rebuild_kpi_rollups()
+    return True
+
+async def run_rollup_reconciler():
+    """Background loop started with the app: check for rollup drift every ROLLUP_RECONCILE_SECONDS"""
+    while True:
+        await asyncio.sleep(ROLLUP_RECONCILE_SECONDS)
+        try:
+            await reconcile_rollups()
+        except Exception as e:
+            print(f"Rollup reconciler error: {e}")
+
+async def rebuild_kpi_rollups():
+    """Recompute kpi_rollups, trend_rollups, latency_sketches and every request's rollup_state from scratch"""
+    global rollups_ready
+    rollups_ready = False
+    rows = {}
+    trends = {}
+    sketches = {}
+    state_ops = []
+    async for req in db.service_requests.find({}, STATE_PROJECTION).batch_size(REBUILD_BATCH_SIZE):
+        state = rollup_state(req)
+        if req.get("rollup_state") != state or req.get("rollup_pending"):
+            # Unapplied claims are moot: every counter is recomputed below
+            state_ops.append(UpdateOne({"_id": req["_id"]}, {"$set": {"rollup_state": state}, "$unset": {"rollup_pending": ""}}))
+            if len(state_ops) >= REBUILD_BATCH_SIZE:
+                await db.service_requests.bulk_write(state_ops, ordered=False)
+                state_ops = []
+        if not state:
+            continue
+        for metric, dimension, key, hours in sketch_values(state):
+            sketches.setdefault((metric, dimension, key), DDSketch()).add(hours)
+        for key, counters in rollup_increments(state):
+            row = rows.setdefault(tuple(key[f] for f in ROLLUP_KEY_FIELDS), {})
+            for field, value in counters.items():
+                row[field] = row.get(field, 0) + value
+        for key, counters in trend_increments(state):
+            row = trends.setdefault(tuple(key[f] for f in TREND_KEY_FIELDS), {})
+            for field, value in counters.items():
+                row[field] = row.get(field, 0) + value
+    if state_ops:
+        await db.service_requests.bulk_write(state_ops, ordered=False)
+    _unapplied_claims.clear()
+
+    await db.kpi_rollups.delete_many({})
+    inserts = []
+    for key, counters in rows.items():
+        doc = dict(zip(ROLLUP_KEY_FIELDS, key))
+        for field, value in counters.items():
+            # "status.new" style counters become nested documents, as $inc writes them
+            parent, _, child = field.partition(".")
+            if child:
+                doc.setdefault(parent, {})[child] = value
+            else:
+                doc[field] = value
+        inserts.append(InsertOne(doc))
+    for start in range(0, len(inserts), REBUILD_BATCH_SIZE):
+        await db.kpi_rollups.bulk_write(inserts[start:start + REBUILD_BATCH_SIZE], ordered=False)
+
+    await db.trend_rollups.delete_many({})
+    trend_docs = [{**dict(zip(TREND_KEY_FIELDS, key)), **counters} for key, counters in trends.items()]
+    for start in range(0, len(trend_docs), REBUILD_BATCH_SIZE):
+        await db.trend_rollups.insert_many(trend_docs[start:start + REBUILD_BATCH_SIZE], ordered=False)
+
+    await db.latency_sketches.delete_many({})
+    if sketches:
+        await db.latency_sketches.insert_many([
+            {
+                "metric": metric, "dimension": dimension, "key": key,
+                "count": sketch.count, "zero": sketch.zero,
+                "bins": {str(index): count for index, count in sketch.bins.items()}
+            }
+            for (metric, dimension, key), sketch in sketches.items()
+        ])
+    rollups_ready = True
+    analytics_cache.invalidate(*ROLLUP_SCOPES)
+    print(f"Rebuilt {len(rows)} KPI rollup rows, {len(trends)} trend rows and {len(sketches)} latency sketches.")
+
+async def ensure_kpi_rollups():
+    """At startup: rebuild if any request was never rolled up (or by an older version), else just mark rollups ready"""
+    global rollups_ready
+    stale = {"$or": [
+        {"rollup_state": {"$exists": False}},
+        {"rollup_state": {"$ne": None}, "rollup_state.version": {"$ne": ROLLUP_STATE_VERSION}}
+    ]}
+    if await db.service_requests.find_one(stale, {"_id": 1}):
+        await rebuild_kpi_rollups()
+    else:
+        await sync_abandoned_claims()
+    rollups_ready = True
+
+# --- Reading ---
+
+def empty_totals() -> dict:
+    return {"count": 0, "status": {}, "category": {}, "zone": {}, "rating": {}, "rating_sum": 0, "rating_count": 0}
+
+def add_state(totals: dict, state: dict):
+    """Fold one raw request (as a rollup_state) into totals, for windows not covered by buckets"""
+    totals["count"] += 1
+    totals["status"][state["status"]] = totals["status"].get(state["status"], 0) + 1
+    totals["category"][state["category"]] = totals["category"].get(state["category"], 0) + 1
+    totals["zone"][state["zone_id"]] = totals["zone"].get(state["zone_id"], 0) + 1
+    if state["stars"] is not None:
+        totals["rating"][state["stars"]] = totals["rating"].get(state["stars"], 0) + 1
+        totals["rating_sum"] += state["stars"]
+        totals["rating_count"] += 1
+
+def _add(target: dict, key, value):
+    if value:
+        target[key] = target.get(key, 0) + value
+
+async def _add_rollup_rows(totals: dict, match: dict):
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "overall": [{"$group": {
+                "_id": None,
+                "count": {"$sum": "$count"},
+                "rating_sum": {"$sum": "$rating_sum"},
+                "rating_count": {"$sum": "$rating_count"},
+                **{f"status_{s}": {"$sum": f"$status.{s}"} for s in ROLLUP_STATUSES},
+                **{f"rating_{n}": {"$sum": f"$rating.{n}"} for n in RATING_STARS}
+            }}],
+            "by_category": [{"$group": {"_id": "$category", "count": {"$sum": "$count"}}}],
+            "by_zone": [{"$group": {"_id": "$zone_id", "count": {"$sum": "$count"}}}]
+        }}
+    ]
+    result = (await (await db.kpi_rollups.aggregate(pipeline)).to_list())[0]
+    if result["overall"]:
+        overall = result["overall"][0]
+        totals["count"] += overall["count"]
+        totals["rating_sum"] += overall["rating_sum"]
+        totals["rating_count"] += overall["rating_count"]
+        for s in ROLLUP_STATUSES:
+            _add(totals["status"], s, overall[f"status_{s}"])
+        for n in RATING_STARS:
+            _add(totals["rating"], n, overall[f"rating_{n}"])
+    for r in result["by_category"]:
+        _add(totals["category"], r["_id"], r["count"])
+    for r in result["by_zone"]:
+        _add(totals["zone"], r["_id"], r["count"])
+
+def _rollup_match(granularity: str, lo, hi, dims: dict) -> dict:
+    match = {"granularity": granularity, **dims}
+    bucket = {}
+    if lo is not None:
+        bucket["$gte"] = lo
+    if hi is not None:
+        bucket["$lt"] = hi
+    if bucket:
+        match["bucket"] = bucket
+    return match
+
+def _ceil(moment: datetime, granularity: str) -> datetime:
+    floor = truncate(moment, granularity)
+    return floor if floor == moment else floor + GRANULARITIES[granularity]
+
+async def kpi_totals(start_date=None, end_date=None, zone=None, category=None, priority=None, agent_id=None) -> dict:
+    """
+    Request counts/ratings for the filters: whole days and hours come from
+    kpi_rollups, the partial hours at the window edges from the requests
+    themselves (an indexed created_at range of at most two hours)
+    """
+    dims = {"zone_id": zone, "category": category, "priority": priority, "agent_id": agent_id}
+    dims = {field: value for field, value in dims.items() if value}
+    totals = empty_totals()
+
+    hour_lo = _ceil(start_date, "hour") if start_date else None
+    hour_hi = truncate(end_date, "hour") if end_date else None
+    if hour_lo is not None and hour_hi is not None and hour_lo > hour_hi:
+        raw_windows = [(start_date, end_date)]
+    else:
+        raw_windows = []
+        if start_date and start_date < hour_lo:
+            raw_windows.append((start_date, hour_lo - timedelta(microseconds=1)))
+        if end_date:
+            raw_windows.append((hour_hi, end_date))
+
+        day_lo = _ceil(hour_lo, "day") if hour_lo is not None else None
+        day_hi = truncate(hour_hi, "day") if hour_hi is not None else None
+        if day_lo is None or day_hi is None or day_lo < day_hi:
+            hour_ranges = []
+            if hour_lo is not None:
+                hour_ranges.append((hour_lo, day_lo))
+            if hour_hi is not None:
+                hour_ranges.append((day_hi, hour_hi))
+            await _add_rollup_rows(totals, _rollup_match("day", day_lo, day_hi, dims))
+        else:
+            hour_ranges = [(hour_lo, hour_hi)]
+        for lo, hi in hour_ranges:
+            if lo < hi:
+                await _add_rollup_rows(totals, _rollup_match("hour", lo, hi, dims))
+
+    raw_dims = {"location.zone_id": zone, "category": category, "priority": priority, "assigned_agent_id": agent_id}
+    raw_dims = {field: value for field, value in raw_dims.items() if value}
+    for lo, hi in raw_windows:
+        query = {"timestamps.created_at": {"$gte": lo, "$lte": hi}, **raw_dims}
+        async for req in db.service_requests.find(query, STATE_PROJECTION):
+            state = rollup_state(req)
+            if state:
+                add_state(totals, state)
+    return totals
+
+def open_count(totals: dict) -> int:
+    return sum(totals["status"].get(s, 0) for s in OPEN_STATUSES)
+
+async def load_sketches(dimension: str, keys: list = None) -> dict:
+    """{key: {metric: DDSketch}} for one sketch dimension, optionally only some keys"""
+    query = {"dimension": dimension}
+    if keys is not None:
+        query["key"] = {"$in": keys}
+    sketches = {}
+    async for doc in db.latency_sketches.find(query, {"_id": 0}):
+        sketches.setdefault(doc["key"], {})[doc["metric"]] = DDSketch.from_doc(doc)
+    return sketches
@@ -0,0 +1,123 @@
+import numpy as np
+from app.utils.geo import haversine_matrix
+from app.utils.dispatch import sla_urgency
+
+# Stop ordering for an agent's active tasks.
+#
+# The route minimizes total km plus SLA_ROUTE_WEIGHT * urgency-weighted
+# arrival distance: each stop's SLA urgency (see dispatch.sla_urgency) times
+# the km driven before reaching it, so overdue and nearly-due stops are
+# pulled forward as long as the detour is worth it. A nearest-neighbour
+# tour is improved by 2-opt. With prefix sums of urgency and of urgency x
+# arrival distance, the objective change of reversing any segment is O(1),
+# so every candidate move is scored at once as one NumPy matrix per pass.
+# Each pass applies the best move of every row whose segments do not
+# overlap; if together they do not beat the single best move (arrival
+# shifts couple them), only the best one is kept.
+
+SLA_ROUTE_WEIGHT = 0.5
+MAX_TWO_OPT_PASSES = 2000
+IMPROVEMENT_EPS = 1e-9
+
+def _objective(ordered: np.ndarray, urgency: np.ndarray, weight: float) -> float:
+    legs = np.diagonal(ordered, 1)
+    arrival = np.concatenate([[0.0], np.cumsum(legs)])
+    return float(legs.sum() + weight * (urgency * arrival).sum())
+
+def _two_opt_deltas(ordered: np.ndarray, urgency: np.ndarray, weight: float, invalid: np.ndarray,
+                    delta: np.ndarray, scratch: np.ndarray) -> np.ndarray:
+    """
+    Objective change of reversing tour positions a+1..b, for every a (rows) and
+    b (cols), given the distance matrix and urgencies already in tour order;
+    inf where the move is not valid. Written into `delta` (scratch is reused).
+    """
+    n = len(urgency)
+    legs = np.diagonal(ordered, 1)
+    arrival = np.concatenate([[0.0], np.cumsum(legs)])[:n - 1]
+    u_prefix = np.cumsum(urgency)
+    uc_prefix = np.cumsum(urgency * np.concatenate([arrival, [arrival[-1] + legs[-1]]]))[:n - 1]
+    d_ab = ordered[:-1, :-1]
+
+    # Distance change, counted once more per unit of urgency still ahead of the segment
+    np.add(d_ab, ordered[1:, 1:], out=delta)
+    delta -= legs[:, None]
+    delta -= legs[None, :]
+    delta *= 1 + weight * (u_prefix[n - 1] - u_prefix[None, :n - 1])
+    # Reversed segment: arrival at p becomes arrival[a] + d(a, b) + arrival[b] - arrival[p]
+    np.add(d_ab, arrival[:, None], out=scratch)
+    scratch += arrival[None, :]
+    scratch *= u_prefix[None, :n - 1] - u_prefix[:n - 1, None]
+    scratch -= 2 * uc_prefix[None, :]
+    scratch += 2 * uc_prefix[:, None]
+    scratch *= weight
+    delta += scratch
+    delta[invalid] = np.inf
+    return delta
+
+def _reverse(ordered: np.ndarray, arrays: list, a: int, b: int):
+    block = slice(a + 1, b + 1)
+    for array in arrays:
+        array[block] = array[block][::-1].copy()
+    ordered[block] = ordered[block][::-1].copy()
+    ordered[:, block] = ordered[:, block][:, ::-1].copy()
+
+def plan_route(lons, lats, hours_left, start: tuple = None, weight: float = SLA_ROUTE_WEIGHT) -> tuple:
+    """
+    Visit order for stops (lon/lat) with hours until SLA breach (NaN if none),
+    starting from `start` (lon, lat) or, without one, wherever is best.
+    Returns (order, leg_km): indices into the stops and the km of each leg.
+    """
+    count = len(lons)
+    if not count:
+        return [], []
+    # Nodes: 0 = start, 1..count = stops, count + 1 = open end (0 km from everywhere)
+    dist = np.zeros((count + 2, count + 2))
+    dist[1:count + 1, 1:count + 1] = haversine_matrix(lons, lats, lons, lats)
+    if start is not None:
+        from_start = haversine_matrix([start[0]], [start[1]], lons, lats)[0]
+        dist[0, 1:count + 1] = from_start
+        dist[1:count + 1, 0] = from_start
+    urgency = np.concatenate([[0.0], sla_urgency(hours_left), [0.0]])
+
+    # Nearest neighbour; ties (e.g. a free start) go to the most urgent stop
+    tour = [0]
+    unvisited = np.ones(count + 2, dtype=bool)
+    unvisited[[0, count + 1]] = False
+    for _ in range(count):
+        score = np.where(unvisited, dist[tour[-1]] - 1e-9 * urgency, np.inf)
+        nearest = int(np.argmin(score))
+        tour.append(nearest)
+        unvisited[nearest] = False
+    tour = np.array(tour + [count + 1])
+
+    # Distances and urgencies kept in tour order, so a move reverses a block in place
+    ordered = dist[tour[:, None], tour[None, :]]
+    ordered_urgency = urgency[tour]
+    invalid = ~np.triu(np.ones((count + 1, count + 1), dtype=bool), 2)   # only b >= a + 2 reverses anything
+    delta, scratch = np.empty((count + 1, count + 1)), np.empty((count + 1, count + 1))
+    for _ in range(MAX_TWO_OPT_PASSES):
+        _two_opt_deltas(ordered, ordered_urgency, weight, invalid, delta, scratch)
+        best_b = np.argmin(delta, axis=1)
+        gains = delta[np.arange(count + 1), best_b]
+        improving = np.nonzero(gains < -IMPROVEMENT_EPS)[0]
+        if not len(improving):
+            break
+        # Best move per row, best first, skipping any that share a position with one already taken
+        moves, taken = [], np.zeros(count + 2, dtype=bool)
+        for a in improving[np.argsort(gains[improving])].tolist():
+            b = int(best_b[a])
+            if not taken[a:b + 2].any():
+                taken[a:b + 2] = True
+                moves.append((a, b))
+        if len(moves) > 1:
+            before = _objective(ordered, ordered_urgency, weight)
+            saved = (ordered.copy(), ordered_urgency.copy(), tour.copy())
+            for a, b in moves:
+                _reverse(ordered, [tour, ordered_urgency], a, b)
+            if _objective(ordered, ordered_urgency, weight) < before + gains[moves[0][0]] + IMPROVEMENT_EPS:
+                continue
+            ordered, ordered_urgency, tour = saved
+        _reverse(ordered, [tour, ordered_urgency], *moves[0])
+
+    legs = dist[tour[:-2], tour[1:-1]]
+    return (tour[1:-1] - 1).tolist(), legs.tolist()
@@ -0,0 +1,69 @@
+import os
+import asyncio
+from datetime import datetime
+from pymongo import ReturnDocument
+from app.database import get_database
+
+db = get_database()
+
+# How many IDs each worker reserves per round trip. 1 keeps IDs gap-free;
+# larger blocks let bursts of submissions skip the counter entirely, at the
+# cost of gaps when a worker restarts with unused IDs in hand.
+REQUEST_ID_BLOCK_SIZE = int(os.getenv("REQUEST_ID_BLOCK_SIZE", "1"))
+
+def counter_key(year: int) -> str:
+    return f"service_requests:{year}"
+
+async def reserve_sequence(key: str, count: int = 1) -> int:
+    """Atomically advance a counter by `count` and return its new value"""
+    counter = await db.counters.find_one_and_update(
+        {"_id": key},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def seed_request_counter(year: int = None):
+    """Make sure the year's counter is never behind IDs already in the collection"""
+    year = year or datetime.now().year
+    pipeline = [
+        {"$match": {"request_id": {"$regex": f"^CST-{year}-"}}},
+        {"$group": {
+            "_id": None,
+            "max_seq": {"$max": {"$toInt": {"$arrayElemAt": [{"$split": ["$request_id", "-"]}, 2]}}}
+        }}
+    ]
+    result = await (await db.service_requests.aggregate(pipeline)).to_list()
+    if result and result[0]["max_seq"]:
+        await db.counters.update_one(
+            {"_id": counter_key(year)},
+            {"$max": {"seq": result[0]["max_seq"]}},
+            upsert=True
+        )
+
+class RequestSequence:
+    """Per-worker allocator handing out request sequence numbers from reserved blocks"""
+
+    def __init__(self, block_size: int = REQUEST_ID_BLOCK_SIZE):
+        self.block_size = max(1, block_size)
+        self._lock = asyncio.Lock()
+        self._year = None
+        self._next = 0
+        self._end = 0
+
+    async def next(self) -> tuple:
+        """Returns (year, sequence) for the next request"""
+        year = datetime.now().year
+        if self.block_size == 1:
+            return year, await reserve_sequence(counter_key(year))
+        async with self._lock:
+            if year != self._year or self._next > self._end:
+                self._end = await reserve_sequence(counter_key(year), self.block_size)
+                self._next = self._end - self.block_size + 1
+                self._year = year
+            seq = self._next
+            self._next += 1
+        return year, seq
+
+request_sequence = RequestSequence()
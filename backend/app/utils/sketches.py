@@ -0,0 +1,81 @@
+import math
+
+# DDSketch-style quantile sketches for duration metrics (hours).
+#
+# A value v > SKETCH_MIN_VALUE lands in bin ceil(log_gamma(v)); every value
+# in a bin is within SKETCH_RELATIVE_ACCURACY of the bin's representative
+# value, so any quantile is reported with that relative error whatever the
+# distribution. Bins are plain counters, which makes sketches mergeable by
+# addition and lets MongoDB maintain them with $inc (including decrements
+# when a request's value changes). Values at or below SKETCH_MIN_VALUE
+# (under a minute) are counted in a single zero bin.
+
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_MIN_VALUE = 1 / 60
+GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+DEFAULT_QUANTILES = [0.5, 0.9, 0.99]
+
+def bin_index(value: float):
+    """Bin for a value, or None for the zero bin"""
+    if value <= SKETCH_MIN_VALUE:
+        return None
+    return math.ceil(math.log(value) / LOG_GAMMA)
+
+def bin_value(index: int) -> float:
+    """Representative value of a bin (relative error <= SKETCH_RELATIVE_ACCURACY)"""
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+def sketch_increments(value: float, sign: int = 1) -> dict:
+    """$inc document adding (sign=1) or removing (sign=-1) one value from a stored sketch"""
+    index = bin_index(value)
+    return {"count": sign, "zero" if index is None else f"bins.{index}": sign}
+
+class DDSketch:
+    def __init__(self, bins: dict = None, zero: int = 0):
+        self.bins = {int(index): count for index, count in (bins or {}).items() if count}
+        self.zero = zero
+
+    @classmethod
+    def from_doc(cls, doc: dict):
+        return cls(doc.get("bins"), doc.get("zero", 0))
+
+    @property
+    def count(self) -> int:
+        return self.zero + sum(self.bins.values())
+
+    def add(self, value: float, count: int = 1):
+        index = bin_index(value)
+        if index is None:
+            self.zero += count
+        else:
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other: "DDSketch"):
+        self.zero += other.zero
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        return self
+
+    def quantile(self, q: float):
+        """Value at quantile q (0..1), or None if the sketch is empty"""
+        total = self.count
+        if total <= 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return bin_value(index)
+        return bin_value(max(self.bins))
+
+    def summary(self, quantiles: list = DEFAULT_QUANTILES) -> dict:
+        """{"count": n, "p50": .., "p90": .., "p99": ..} rounded to 0.1 h"""
+        result = {"count": self.count}
+        for q in quantiles:
+            value = self.quantile(q)
+            result[f"p{round(q * 100):g}"] = round(value, 1) if value is not None else None
+        return result
@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timedelta
+from pymongo import UpdateMany
+from app.database import get_database
+from app.utils.common import OPEN_STATUSES
+from app.utils.work_queue import effective_deadline, effective_deadline_expr
+
+db = get_database()
+
+DEFAULT_TARGET_HOURS = 72
+DEFAULT_BREACH_HOURS = 120
+
+# The sweeper sleeps until the next deadline, but never longer than this so
+# requests created with a nearer deadline are still picked up promptly
+SLA_SWEEP_MAX_SLEEP_SECONDS = 60
+SLA_SWEEP_MIN_SLEEP_SECONDS = 1
+# Re-triage can pull a deadline into the past behind the sweep watermark, so
+# periodically re-check every overdue request (idempotent thanks to the state filter)
+SLA_FULL_SWEEP_SECONDS = 600
+SWEEP_BATCH_SIZE = 1000
+
+def sla_deadlines(created_at: datetime, sla_policy: dict, priority: str = None, high_impact: bool = False) -> dict:
+    """Absolute target/breach deadlines for a request, plus the work queue's effective deadline"""
+    sla_policy = sla_policy or {}
+    breach_at = created_at + timedelta(hours=sla_policy.get("breach_threshold_hours", DEFAULT_BREACH_HOURS))
+    return {
+        "sla_target_at": created_at + timedelta(hours=sla_policy.get("target_hours", DEFAULT_TARGET_HOURS)),
+        "sla_breach_at": breach_at,
+        "queue_due_at": effective_deadline(breach_at, priority, high_impact)
+    }
+
+def _deadline_expr(hours_field: str, default_hours: int) -> dict:
+    return {"$add": ["$timestamps.created_at", {"$multiply": [{"$ifNull": [hours_field, default_hours]}, 3600000]}]}
+
+def deadline_stages() -> list:
+    """Update pipeline stages recomputing the stored deadlines from sla_policy and created_at"""
+    return [
+        {"$set": {
+            "sla_target_at": _deadline_expr("$sla_policy.target_hours", DEFAULT_TARGET_HOURS),
+            "sla_breach_at": _deadline_expr("$sla_policy.breach_threshold_hours", DEFAULT_BREACH_HOURS)
+        }},
+        # Second stage so it sees the new sla_breach_at
+        {"$set": {"queue_due_at": effective_deadline_expr()}}
+    ]
+
+async def refresh_sla_deadlines(query: dict):
+    """Recompute stored deadlines server-side for every request matching query"""
+    return await db.service_requests.update_many(query, deadline_stages())
+
+async def backfill_sla_deadlines():
+    """Give requests created before deadlines were stored their sla_target_at/sla_breach_at/queue_due_at"""
+    result = await refresh_sla_deadlines({
+        "$or": [{"sla_breach_at": {"$exists": False}}, {"queue_due_at": {"$exists": False}}],
+        "timestamps.created_at": {"$ne": None}
+    })
+    if result.modified_count:
+        print(f"Backfilled SLA deadlines on {result.modified_count} requests.")
+
+async def _flip_sla_state(deadline_field: str, since, now, new_state: str, from_states: list):
+    """Set computed_kpis.sla_state for open requests whose deadline fell in (since, now]"""
+    window = {"$lte": now}
+    if since:
+        window["$gt"] = since
+    request_ids = []
+    cursor = db.service_requests.find(
+        {"status": {"$in": OPEN_STATUSES}, deadline_field: window},
+        {"_id": 0, "request_id": 1}
+    ).batch_size(SWEEP_BATCH_SIZE)
+    async for req in cursor:
+        request_ids.append(req["request_id"])
+
+    ops = [
+        UpdateMany(
+            {"request_id": {"$in": request_ids[i:i + SWEEP_BATCH_SIZE]}, "computed_kpis.sla_state": {"$in": from_states}},
+            {"$set": {"computed_kpis.sla_state": new_state, "computed_kpis.sla_state_changed_at": now}}
+        )
+        for i in range(0, len(request_ids), SWEEP_BATCH_SIZE)
+    ]
+    if ops:
+        await db.performance_logs.bulk_write(ops, ordered=False)
+    return len(request_ids)
+
+async def sweep_sla_states(since, now):
+    """One sweep: promote on_time -> at_risk -> breached for deadlines passed since the last sweep"""
+    at_risk = await _flip_sla_state("sla_target_at", since, now, "at_risk", ["on_time"])
+    breached = await _flip_sla_state("sla_breach_at", since, now, "breached", ["on_time", "at_risk"])
+    return at_risk, breached
+
+async def next_deadline_after(now):
+    """Earliest upcoming target/breach deadline among open requests, if any"""
+    upcoming = []
+    for field in ["sla_target_at", "sla_breach_at"]:
+        req = await db.service_requests.find_one(
+            {"status": {"$in": OPEN_STATUSES}, field: {"$gt": now}},
+            {"_id": 0, field: 1},
+            sort=[(field, 1)]
+        )
+        if req:
+            upcoming.append(req[field])
+    return min(upcoming) if upcoming else None
+
+async def run_sla_sweeper():
+    """Background loop started with the app; wakes when the next deadline passes"""
+    since = None  # first sweep catches up on everything already overdue
+    last_full_sweep = datetime.utcnow()
+    while True:
+        now = datetime.utcnow()
+        if (now - last_full_sweep).total_seconds() >= SLA_FULL_SWEEP_SECONDS:
+            since, last_full_sweep = None, now
+        try:
+            await sweep_sla_states(since, now)
+            since = now
+            next_deadline = await next_deadline_after(now)
+        except Exception as e:
+            print(f"SLA sweeper error: {e}")
+            next_deadline = None
+        sleep_for = SLA_SWEEP_MAX_SLEEP_SECONDS
+        if next_deadline:
+            sleep_for = (next_deadline - datetime.utcnow()).total_seconds()
+        await asyncio.sleep(min(max(sleep_for, SLA_SWEEP_MIN_SLEEP_SECONDS), SLA_SWEEP_MAX_SLEEP_SECONDS))
@@ -0,0 +1,219 @@
+import math
+import time
+import struct
+import numpy as np
+from app.utils.geo import polygon_parts, simplify_ring
+
+# XYZ (slippy map / Web Mercator) tiles in a compact binary layout.
+#
+# Coordinates are tile-local integers on a TILE_EXTENT grid, as in Mapbox
+# Vector Tiles. All integers are little-endian.
+#
+#   header   4s magic "CSTT", u8 version, u8 z, u32 x, u32 y, u16 extent,
+#            u32 point_count, u32 zone_count
+#   points   point_count records of POINT_DTYPE:
+#            u16 x, u16 y, u8 priority (index into PRIORITY_CODES, 255 unknown),
+#            u16 count, f32 weight
+#            (requests that land on the same tile pixel are merged: count and
+#            weight are summed, priority is the highest)
+#   zones    zone_count records:
+#            u16 request_count, u8 len + utf-8 zone_id, u8 len + utf-8 name,
+#            u16 ring_count, then per ring u16 vertex_count + vertex_count
+#            pairs of i16 x, i16 y (may fall slightly outside 0..extent,
+#            see TILE_BUFFER)
+
+TILE_MAGIC = b"CSTT"
+TILE_FORMAT_VERSION = 1
+TILE_EXTENT = 4096
+TILE_BUFFER = 64            # clip zones a little outside the tile so seams don't show
+TILE_SIMPLIFY_UNITS = 8     # Douglas-Peucker tolerance in tile units (half a screen pixel at 256px)
+TILE_MAX_ZOOM = 22
+PRIORITY_CODES = ["low", "medium", "high", "critical"]
+UNKNOWN_PRIORITY = 255
+
+# Counters behind TileVersions; cells hash into these, a collision only costs a rebuild
+TILE_VERSION_SLOTS = 1 << 20
+
+POINT_DTYPE = np.dtype([("x", "<u2"), ("y", "<u2"), ("priority", "u1"), ("count", "<u2"), ("weight", "<f4")])
+HEADER = struct.Struct("<4sBBIIHII")
+
+def tile_bounds(z: int, x: int, y: int) -> tuple:
+    """(min_lon, min_lat, max_lon, max_lat) covered by tile z/x/y"""
+    n = 2 ** z
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+def lonlat_to_unit(lons, lats) -> tuple:
+    """Web Mercator x/y in [0, 1] (origin top-left, as in XYZ tiles)"""
+    lons = np.asarray(lons, dtype=float)
+    lat_rad = np.radians(np.clip(np.asarray(lats, dtype=float), -85.05112878, 85.05112878))
+    return (lons + 180) / 360, (1 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / math.pi) / 2
+
+def project_to_tile(lons, lats, z: int, x: int, y: int, extent: int = TILE_EXTENT) -> np.ndarray:
+    """Web Mercator projection of lon/lat arrays into tile-local units, shape (n, 2)"""
+    n = 2 ** z
+    ux, uy = lonlat_to_unit(lons, lats)
+    return np.column_stack([(ux * n - x) * extent, (uy * n - y) * extent])
+
+def _clip_edge(points: list, inside, intersect) -> list:
+    if not points:
+        return points
+    clipped = []
+    prev = points[-1]
+    for point in points:
+        if inside(point):
+            if not inside(prev):
+                clipped.append(intersect(prev, point))
+            clipped.append(point)
+        elif inside(prev):
+            clipped.append(intersect(prev, point))
+        prev = point
+    return clipped
+
+def clip_ring(ring: np.ndarray, lo: float, hi: float) -> np.ndarray:
+    """Sutherland-Hodgman clip of a ring to the square [lo, hi]^2; result is closed or empty"""
+    def cross_x(bound):
+        return lambda a, b: (bound, a[1] + (b[1] - a[1]) * (bound - a[0]) / (b[0] - a[0]))
+    def cross_y(bound):
+        return lambda a, b: (a[0] + (b[0] - a[0]) * (bound - a[1]) / (b[1] - a[1]), bound)
+
+    points = [tuple(p) for p in ring[:-1]] if len(ring) and tuple(ring[0]) == tuple(ring[-1]) else [tuple(p) for p in ring]
+    points = _clip_edge(points, lambda p: p[0] >= lo, cross_x(lo))
+    points = _clip_edge(points, lambda p: p[0] <= hi, cross_x(hi))
+    points = _clip_edge(points, lambda p: p[1] >= lo, cross_y(lo))
+    points = _clip_edge(points, lambda p: p[1] <= hi, cross_y(hi))
+    if len(points) < 3:
+        return np.empty((0, 2))
+    return np.array(points + [points[0]], dtype=float)
+
+def zone_tile_rings(boundary: dict, z: int, x: int, y: int) -> list:
+    """Zone boundary projected, clipped and simplified for one tile; [] if it misses the tile"""
+    rings = []
+    for polygon in polygon_parts(boundary):
+        for ring in polygon:
+            if len(ring) < 4:
+                continue
+            coords = np.asarray(ring, dtype=float)
+            projected = project_to_tile(coords[:, 0], coords[:, 1], z, x, y)
+            clipped = clip_ring(projected, -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER)
+            if not len(clipped):
+                continue
+            simplified = np.rint(simplify_ring(clipped, TILE_SIMPLIFY_UNITS)).astype(np.int16)
+            # Drop rings that collapsed onto a pixel or two at this zoom
+            if len(np.unique(simplified[:-1], axis=0)) >= 3:
+                rings.append(simplified)
+    return rings
+
+def encode_points(pixels: np.ndarray, priorities: list, weights: list) -> np.ndarray:
+    """Merge requests sharing a tile pixel into POINT_DTYPE records"""
+    if not len(pixels):
+        return np.empty(0, dtype=POINT_DTYPE)
+    xy = np.clip(np.floor(pixels), 0, TILE_EXTENT - 1).astype(np.int64)
+    codes = np.array([PRIORITY_CODES.index(p) if p in PRIORITY_CODES else -1 for p in priorities])
+    keys = xy[:, 0] * TILE_EXTENT + xy[:, 1]
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    records = np.zeros(len(unique_keys), dtype=POINT_DTYPE)
+    records["x"] = unique_keys // TILE_EXTENT
+    records["y"] = unique_keys % TILE_EXTENT
+    records["count"] = np.minimum(np.bincount(inverse), 65535)
+    records["weight"] = np.bincount(inverse, weights=np.asarray(weights, dtype=float))
+    top = np.full(len(unique_keys), -1)
+    np.maximum.at(top, inverse, codes)
+    records["priority"] = np.where(top < 0, UNKNOWN_PRIORITY, top)
+    return records
+
+def _short_string(value) -> bytes:
+    data = str(value or "").encode()[:255]
+    return struct.pack("<B", len(data)) + data
+
+def encode_tile(z: int, x: int, y: int, points: np.ndarray, zones: list) -> bytes:
+    """zones: list of (zone_id, name, request_count, rings)"""
+    parts = [HEADER.pack(TILE_MAGIC, TILE_FORMAT_VERSION, z, x, y, TILE_EXTENT, len(points), len(zones)), points.tobytes()]
+    for zone_id, name, request_count, rings in zones:
+        parts.append(struct.pack("<H", min(request_count, 65535)))
+        parts.append(_short_string(zone_id))
+        parts.append(_short_string(name))
+        parts.append(struct.pack("<H", len(rings)))
+        for ring in rings:
+            parts.append(struct.pack("<H", len(ring)))
+            parts.append(ring.astype("<i2").tobytes())
+    return b"".join(parts)
+
+def decode_tile(data: bytes) -> dict:
+    """Inverse of encode_tile, used by tests and debugging tools"""
+    magic, version, z, x, y, extent, point_count, zone_count = HEADER.unpack_from(data, 0)
+    if magic != TILE_MAGIC:
+        raise ValueError("Not a CST tile")
+    offset = HEADER.size
+    points = np.frombuffer(data, dtype=POINT_DTYPE, count=point_count, offset=offset)
+    offset += points.nbytes
+
+    def read_string():
+        nonlocal offset
+        length = data[offset]
+        value = data[offset + 1:offset + 1 + length].decode()
+        offset += 1 + length
+        return value
+
+    zones = []
+    for _ in range(zone_count):
+        (request_count,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        zone_id, name = read_string(), read_string()
+        (ring_count,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        rings = []
+        for _ in range(ring_count):
+            (vertex_count,) = struct.unpack_from("<H", data, offset)
+            offset += 2
+            rings.append(np.frombuffer(data, dtype="<i2", count=vertex_count * 2, offset=offset).reshape(-1, 2))
+            offset += vertex_count * 4
+        zones.append({"zone_id": zone_id, "name": name, "request_count": request_count, "rings": rings})
+    return {"version": version, "z": z, "x": x, "y": y, "extent": extent, "points": points, "zones": zones}
+
+class TileVersions:
+    """
+    Data versions for individual tiles, so a write only changes the cache
+    key and ETag of the tiles that show it: the tile holding the written
+    point at every zoom, and every tile outlining a zone whose open request
+    count moved. reset() changes them all (zone boundaries, bulk rewrites).
+    """
+
+    def __init__(self, slots: int = TILE_VERSION_SLOTS):
+        self.cells = np.zeros(slots, dtype=np.int64)
+        self.zones = {}    # zone_id -> version
+        self.reset()
+
+    def reset(self):
+        self.epoch = format(time.time_ns(), "x")
+
+    def _slot(self, z: int, x: int, y: int) -> int:
+        return hash((z, x, y)) % len(self.cells)
+
+    def touch(self, coordinates=None, zone_ids=()):
+        """Record a write at coordinates ([lon, lat]) and/or one that moved these zones' open counts"""
+        if coordinates:
+            ux, uy = lonlat_to_unit([coordinates[0]], [coordinates[1]])
+            for z in range(TILE_MAX_ZOOM + 1):
+                n = 2 ** z
+                x = min(max(int(ux[0] * n), 0), n - 1)
+                y = min(max(int(uy[0] * n), 0), n - 1)
+                self.cells[self._slot(z, x, y)] += 1
+        for zone_id in zone_ids:
+            self.zones[zone_id] = self.zones.get(zone_id, 0) + 1
+
+    def cell(self, z: int, x: int, y: int) -> str:
+        """Version of the points in tile z/x/y"""
+        return f"{self.epoch}.{self.cells[self._slot(z, x, y)]}"
+
+    def zone_version(self, zone_ids, versions: dict = None) -> int:
+        """Combined version of these zones' counts (from a snapshot of self.zones if given)"""
+        versions = self.zones if versions is None else versions
+        return sum(versions.get(zone_id, 0) for zone_id in zone_ids)
+
+# Bumped by the request and zone write paths, read by the tile endpoint
+tile_versions = TileVersions()
@@ -0,0 +1,147 @@
+import heapq
+from datetime import datetime, timedelta
+
+# Per-agent work queues for "next task" claiming.
+#
+# Every request in QUEUED_STATUS with an assigned agent sits in that agent's
+# binary heap, keyed by an effective deadline: its SLA breach time brought
+# forward by a head start for its priority and for high-impact locations, so
+# a critical task due tomorrow still comes before a low one due in a few
+# hours, but anything far enough overdue rises to the top. The key does not
+# depend on the clock, so it never needs re-sorting.
+#
+# sync_rollups() passes every request it syncs to track(), so assignment,
+# transitions, re-triage and resolution keep the queues current. A change
+# pushes a new heap entry and the old one is skipped when it reaches the top
+# (lazy deletion); heaps are rebuilt once stale entries outnumber live ones.
+# Claiming pops in O(log n) and never scans service_requests. The queues are
+# per process, so the claim endpoint falls back to the database when this
+# process has nothing queued for the agent; the effective deadline is stored
+# on every request as queue_due_at (see app/utils/sla.py) so that fallback
+# sorts on the same key as the heaps.
+
+QUEUED_STATUS = "assigned"
+PRIORITY_HEAD_START_HOURS = {"critical": 48, "high": 24, "medium": 8, "low": 0}
+HIGH_IMPACT_HEAD_START_HOURS = 12
+NO_DEADLINE = float("inf")
+
+def effective_deadline(breach_at, priority, high_impact) -> datetime:
+    """SLA breach time brought forward by the priority and high-impact head starts (None without a deadline)"""
+    if not breach_at:
+        return None
+    head_start = PRIORITY_HEAD_START_HOURS.get(priority, 0)
+    if high_impact:
+        head_start += HIGH_IMPACT_HEAD_START_HOURS
+    return breach_at - timedelta(hours=head_start)
+
+def effective_deadline_expr() -> dict:
+    """effective_deadline() as an aggregation expression over a request's stored fields"""
+    head_start = {"$add": [
+        {"$switch": {
+            "branches": [{"case": {"$eq": ["$priority", p]}, "then": h} for p, h in PRIORITY_HEAD_START_HOURS.items()],
+            "default": 0
+        }},
+        {"$cond": [{"$eq": ["$triage_metadata.high_impact_flag", True]}, HIGH_IMPACT_HEAD_START_HOURS, 0]}
+    ]}
+    return {"$cond": [
+        {"$ifNull": ["$sla_breach_at", False]},
+        {"$subtract": ["$sla_breach_at", {"$multiply": [head_start, 3600000]}]},
+        None
+    ]}
+
+def urgency_key(req: dict) -> float:
+    """Effective deadline in epoch seconds (smaller = more urgent)"""
+    due_at = effective_deadline(
+        req.get("sla_breach_at"), req.get("priority"), (req.get("triage_metadata") or {}).get("high_impact_flag")
+    )
+    if not due_at:
+        return NO_DEADLINE
+    return (due_at - datetime(1970, 1, 1)).total_seconds()
+
+class WorkQueues:
+    def __init__(self):
+        self.load([])
+
+    def load(self, requests: list):
+        """Rebuild from request documents (request_id, status, assigned_agent_id, priority, sla_breach_at, triage_metadata)"""
+        self.entries = {}       # request_id -> (agent_id, key) of its live heap entry
+        self.heaps = {}         # agent_id -> [(key, request_id)], live and stale
+        self.counts = {}        # agent_id -> live entries
+        for req in requests:
+            entry = self._entry(req)
+            if entry:
+                self._set(req["request_id"], entry)
+                self.heaps.setdefault(entry[0], []).append((entry[1], req["request_id"]))
+        for heap in self.heaps.values():
+            heapq.heapify(heap)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _entry(req: dict):
+        if req.get("status") != QUEUED_STATUS or not req.get("assigned_agent_id"):
+            return None
+        return req["assigned_agent_id"], urgency_key(req)
+
+    def _set(self, request_id: str, entry):
+        old = self.entries.pop(request_id, None)
+        if old:
+            self.counts[old[0]] -= 1
+        if entry:
+            self.entries[request_id] = entry
+            self.counts[entry[0]] = self.counts.get(entry[0], 0) + 1
+
+    def track(self, req: dict):
+        """Mirror a request's current status, agent and urgency"""
+        request_id = req.get("request_id")
+        if not request_id:
+            return
+        entry = self._entry(req)
+        if self.entries.get(request_id) == entry:
+            return
+        self._set(request_id, entry)
+        if entry is None:
+            return
+        agent_id, key = entry
+        heap = self.heaps.setdefault(agent_id, [])
+        heapq.heappush(heap, (key, request_id))
+        if len(heap) > 2 * self.counts[agent_id] + 16:
+            # Mostly stale entries: rebuild from the live ones
+            heap = [(k, rid) for k, rid in heap if self.entries.get(rid) == (agent_id, k)]
+            heapq.heapify(heap)
+            self.heaps[agent_id] = heap
+
+    def _top(self, agent_id: str) -> list:
+        """The agent's heap with stale entries popped off the top"""
+        heap = self.heaps.get(agent_id, [])
+        while heap and self.entries.get(heap[0][1]) != (agent_id, heap[0][0]):
+            heapq.heappop(heap)
+        return heap
+
+    def queued(self, agent_id: str) -> int:
+        return self.counts.get(agent_id, 0)
+
+    def peek(self, agent_id: str):
+        """request_id of the agent's most urgent queued task, or None"""
+        heap = self._top(agent_id)
+        return heap[0][1] if heap else None
+
+    def pop(self, agent_id: str):
+        """Remove and return (request_id, key) of the agent's most urgent queued task, or None"""
+        heap = self._top(agent_id)
+        if not heap:
+            return None
+        key, request_id = heapq.heappop(heap)
+        self._set(request_id, None)
+        return request_id, key
+
+    def requeue(self, agent_id: str, request_id: str, key: float):
+        """Put back a popped task whose claim failed, unless track() has seen it since"""
+        if request_id in self.entries:
+            return
+        self._set(request_id, (agent_id, key))
+        heapq.heappush(self.heaps.setdefault(agent_id, []), (key, request_id))
+
+# Assigned, not yet started tasks per agent; loaded at startup, moved by sync_rollups()
+work_queues = WorkQueues()
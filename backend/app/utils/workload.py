@@ -0,0 +1,88 @@
+import asyncio
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.database import get_database
+from app.utils.agent_index import agent_index
+
+db = get_database()
+
+# Agent workload counters.
+#
+# service_agents.current_workload counts the requests assigned to the agent
+# that are still being worked (WORKLOAD_STATUSES). Every write path that can
+# move a request into, out of or between agents' workloads (assign, batch
+# assign, reassign, transition, milestone, resolve) reads the request's
+# status and agent as it writes them (find_one_and_update) and passes the
+# before/after pair to move_workloads(), which $incs the agents concerned
+# and the routing index's cached copy right away, so auto-assignment never
+# waits on the rollup sync. reconcile_workloads() recounts every agent with
+# one $group and corrects any drift (e.g. a process that died between a
+# request write and its $inc, or data imported around the API); it runs at
+# startup and periodically. The routing index in app/utils/agent_index.py
+# caches the same counters for auto-assignment and is moved and re-read
+# alongside them.
+
+WORKLOAD_STATUSES = ["assigned", "in_progress"]
+WORKLOAD_RECONCILE_SECONDS = 900
+
+def _counted(req: dict) -> bool:
+    return bool(req) and req.get("status") in WORKLOAD_STATUSES and ObjectId.is_valid(req.get("assigned_agent_id") or "")
+
+def workload_deltas(changes: list) -> dict:
+    """{agent_id: net change} for (before, after) request versions (status, assigned_agent_id)"""
+    deltas = {}
+    for before, after in changes:
+        for req, sign in [(before, -1), (after, 1)]:
+            if _counted(req):
+                deltas[req["assigned_agent_id"]] = deltas.get(req["assigned_agent_id"], 0) + sign
+    return {agent_id: delta for agent_id, delta in deltas.items() if delta}
+
+async def move_workloads(changes: list):
+    """Apply request writes, as (before, after) versions, to the agents' current_workload and the routing index"""
+    deltas = workload_deltas(changes)
+    if not deltas:
+        return
+    for agent_id, delta in deltas.items():
+        agent_index.add_workload(agent_id, delta)
+    await db.service_agents.bulk_write([
+        UpdateOne({"_id": ObjectId(agent_id)}, {"$inc": {"current_workload": delta}})
+        for agent_id, delta in deltas.items()
+    ], ordered=False)
+
+async def workload_counts() -> dict:
+    """Active request count per agent id (string), from one aggregation over service_requests"""
+    pipeline = [
+        {"$match": {"status": {"$in": WORKLOAD_STATUSES}, "assigned_agent_id": {"$ne": None}}},
+        {"$group": {"_id": "$assigned_agent_id", "count": {"$sum": 1}}}
+    ]
+    return {row["_id"]: row["count"] for row in await (await db.service_requests.aggregate(pipeline)).to_list()}
+
+async def reconcile_workloads() -> int:
+    """Set every agent's current_workload to its actual count; returns how many agents were corrected"""
+    counts = await workload_counts()
+    ops = []
+    agents = await db.service_agents.find({}, {"current_workload": 1}).to_list()
+    for agent in agents:
+        actual = counts.get(str(agent["_id"]), 0)
+        if agent.get("current_workload") != actual:
+            # Only if no increment landed since we read the counter; otherwise the next pass fixes it
+            ops.append(UpdateOne(
+                {"_id": agent["_id"], "current_workload": agent.get("current_workload")},
+                {"$set": {"current_workload": actual}}
+            ))
+    if not ops:
+        agent_index.set_workloads(agents)
+        return 0
+    result = await db.service_agents.bulk_write(ops, ordered=False)
+    print(f"Corrected workload counters for {result.modified_count} agents.")
+    agent_index.set_workloads(await db.service_agents.find({}, {"current_workload": 1}).to_list())
+    return result.modified_count
+
+async def run_workload_reconciler():
+    """Background loop started with the app: reconcile at startup, then every WORKLOAD_RECONCILE_SECONDS"""
+    while True:
+        try:
+            await reconcile_workloads()
+        except Exception as e:
+            print(f"Workload reconciler error: {e}")
+        await asyncio.sleep(WORKLOAD_RECONCILE_SECONDS)
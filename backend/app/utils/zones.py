@@ -0,0 +1,147 @@
+import math
+from collections import defaultdict
+import numpy as np
+from app.utils.geo import polygon_parts, simplify_ring
+
+# Douglas-Peucker tolerances (degrees, roughly 5 m / 20 m / 100 m / 500 m) at
+# which zone boundaries are pre-simplified and stored on the zone document
+ZONE_SIMPLIFY_TOLERANCES = [0.00005, 0.0002, 0.001, 0.005]
+
+# Max point x edge pairs evaluated at once by the vectorized ray-casting test
+MAX_PIP_PAIRS = 2_000_000
+
+def points_in_ring(lons: np.ndarray, lats: np.ndarray, ring: np.ndarray) -> np.ndarray:
+    """Even-odd ray casting of many points against one closed ring, in row blocks"""
+    inside = np.zeros(len(lons), dtype=bool)
+    if not len(lons) or len(ring) < 4:
+        return inside
+    x1, y1 = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    dy = np.where(y2 == y1, np.inf, y2 - y1)  # horizontal edges never cross the ray
+    rows_per_block = max(1, MAX_PIP_PAIRS // len(x1))
+    for start in range(0, len(lons), rows_per_block):
+        px = lons[start:start + rows_per_block, None]
+        py = lats[start:start + rows_per_block, None]
+        straddles = (y1 > py) != (y2 > py)
+        crossing_x = x1 + (py - y1) * (x2 - x1) / dy
+        inside[start:start + rows_per_block] = (np.count_nonzero(straddles & (px < crossing_x), axis=1) % 2) == 1
+    return inside
+
+def simplify_boundary(boundary: dict, tolerance: float) -> dict:
+    """Polygon/MultiPolygon simplified ring by ring; rings stay closed with >= 4 points"""
+    parts = [
+        [[[round(float(v), 7) for v in point] for point in simplify_ring(ring, tolerance)] for ring in rings]
+        for rings in polygon_parts(boundary)
+    ]
+    if boundary.get("type") == "MultiPolygon":
+        return {"type": "MultiPolygon", "coordinates": parts}
+    return {"type": "Polygon", "coordinates": parts[0] if parts else []}
+
+def simplified_boundaries(boundary: dict) -> list:
+    """The stored simplification levels for a zone, coarsest last"""
+    return [
+        {"tolerance": tolerance, "geometry": simplify_boundary(boundary, tolerance)}
+        for tolerance in ZONE_SIMPLIFY_TOLERANCES
+    ]
+
+def zoom_tolerance(zoom: int) -> float:
+    """Half a screen pixel, in degrees, at a slippy-map zoom level"""
+    return 360 / 256 / (2 ** zoom) / 2
+
+def pick_boundary(zone: dict, tolerance: float = 0) -> dict:
+    """Coarsest stored boundary whose tolerance does not exceed the requested one"""
+    chosen = zone.get("boundary")
+    for level in zone.get("simplified_boundaries") or []:
+        if level["tolerance"] <= tolerance:
+            chosen = level["geometry"]
+    return chosen
+
+class PreparedZone:
+    """A zone boundary as NumPy rings plus its bounding box, ready for point tests"""
+
+    def __init__(self, zone_id: str, boundary: dict):
+        self.zone_id = zone_id
+        # [(exterior, [holes])] per polygon part
+        self.parts = [
+            (np.asarray(rings[0], dtype=float), [np.asarray(hole, dtype=float) for hole in rings[1:]])
+            for rings in polygon_parts(boundary) if rings and len(rings[0]) >= 4
+        ]
+        if self.parts:
+            exteriors = np.vstack([exterior for exterior, _ in self.parts])
+            self.bbox = (*exteriors.min(axis=0), *exteriors.max(axis=0))
+        else:
+            self.bbox = None
+
+    def contains(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        inside = np.zeros(len(lons), dtype=bool)
+        for exterior, holes in self.parts:
+            in_part = points_in_ring(lons, lats, exterior)
+            for hole in holes:
+                candidates = np.nonzero(in_part)[0]
+                in_part[candidates[points_in_ring(lons[candidates], lats[candidates], hole)]] = False
+            inside |= in_part
+        return inside
+
+class ZoneIndex:
+    """
+    Point -> zone lookup over municipal zone polygons.
+
+    Zone bounding boxes are bucketed into a uniform grid sized to the typical
+    zone, so a lookup only runs the polygon test on the few zones whose box
+    covers the point's cell. Where zones overlap, the first one in load order wins.
+    """
+
+    def __init__(self, zones: list = ()):
+        self.load(zones)
+
+    def load(self, zones: list):
+        """Rebuild from zone documents ({zone_id, boundary}); safe to call while serving"""
+        prepared = [PreparedZone(z.get("zone_id"), z.get("boundary")) for z in zones]
+        prepared = [z for z in prepared if z.bbox is not None]
+        spans = [max(z.bbox[2] - z.bbox[0], z.bbox[3] - z.bbox[1]) for z in prepared]
+        cell_deg = max(float(np.median(spans)) / 2, 0.001) if spans else 1.0
+        cells = defaultdict(list)
+        for position, zone in enumerate(prepared):
+            min_x, min_y = self._cell(zone.bbox[0], zone.bbox[1], cell_deg)
+            max_x, max_y = self._cell(zone.bbox[2], zone.bbox[3], cell_deg)
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    cells[(x, y)].append(position)
+        # Swap in one assignment so concurrent lookups see either the old or the new index
+        self._state = (prepared, dict(cells), cell_deg)
+
+    def __len__(self):
+        return len(self._state[0])
+
+    @staticmethod
+    def _cell(lon, lat, cell_deg):
+        return (math.floor(lon / cell_deg), math.floor(lat / cell_deg))
+
+    def locate(self, lon: float, lat: float):
+        """zone_id containing the point, or None"""
+        zones, cells, cell_deg = self._state
+        lons, lats = np.array([lon], dtype=float), np.array([lat], dtype=float)
+        for position in cells.get(self._cell(lon, lat, cell_deg), ()):
+            zone = zones[position]
+            min_lon, min_lat, max_lon, max_lat = zone.bbox
+            if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat and zone.contains(lons, lats)[0]:
+                return zone.zone_id
+        return None
+
+    def locate_many(self, lons, lats) -> list:
+        """Batch locate(): zone_id (or None) per point, testing each zone against its bbox hits at once"""
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        zones = self._state[0]
+        result = np.full(len(lons), -1)
+        for position, zone in enumerate(zones):
+            min_lon, min_lat, max_lon, max_lat = zone.bbox
+            candidates = np.nonzero(
+                (result < 0) & (lons >= min_lon) & (lons <= max_lon) & (lats >= min_lat) & (lats <= max_lat)
+            )[0]
+            if len(candidates):
+                result[candidates[zone.contains(lons[candidates], lats[candidates])]] = position
+        return [zones[p].zone_id if p >= 0 else None for p in result]
+
+# Shared by request creation and the zone backfill job; reloaded on zone create/delete
+zone_index = ZoneIndex()
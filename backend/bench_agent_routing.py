@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the agent routing index behind auto-assignment.
+
+Loads 5,000 agents with irregular geo-fences across a metro area (a few
+with holes), mixed skills and weekly shifts, then times auto-assignment
+lookups for random request locations, categories and times of the week.
+Target: 1,000 assignments per second. Every pick is checked against a
+brute-force pass over all agents doing what the old per-request query and
+Python filters did (fence contains the point, then skill, then shift, then
+lowest workload, first agent wins ties).
+
+Usage: python3 bench_agent_routing.py
+Runs in-process; no server or database needed.
+"""
+import os
+import sys
+import math
+import time
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from app.utils.agent_index import AgentIndex, WEEKDAYS
+from app.utils.zones import PreparedZone
+from app.routers.agents import CATEGORY_SKILLS
+
+AGENTS = 5000
+LOOKUPS = 5000
+CHECKED = 1000
+TARGET_PER_SECOND = 1000
+CENTER = (35.21, 31.77)
+SPREAD_DEG = 0.12
+SKILLS = ["road", "water", "waste", "general", "electrical", "parks"]
+CATEGORIES = list(CATEGORY_SKILLS) + ["graffiti"]
+
+def ring(lon, lat, radius, vertices):
+    angles = sorted(random.uniform(0, 2 * math.pi) for _ in range(vertices))
+    points = [[lon + radius * random.uniform(0.6, 1.0) * math.cos(a), lat + radius * random.uniform(0.6, 1.0) * math.sin(a)] for a in angles]
+    return points + [points[0]]
+
+def random_fence():
+    lon, lat = random.gauss(CENTER[0], SPREAD_DEG), random.gauss(CENTER[1], SPREAD_DEG)
+    radius = random.uniform(0.01, 0.06)
+    rings = [ring(lon, lat, radius, random.randint(6, 24))]
+    if random.random() < 0.1:
+        rings.append(ring(lon, lat, radius / 4, 6))
+    return {"type": "Polygon", "coordinates": rings}
+
+def random_schedule():
+    if random.random() < 0.1:
+        return {"shifts": [], "on_call": True}
+    start = random.choice([6, 7, 8, 14, 15])
+    days = random.sample(WEEKDAYS, random.randint(3, 5))
+    return {"shifts": [{"day": d, "start": f"{start:02d}:00", "end": f"{start + 8:02d}:00"} for d in days], "on_call": False}
+
+def random_agent(i):
+    return {
+        "_id": f"agent-{i:05d}", "name": f"Agent {i}", "active": True,
+        "skills": random.sample(SKILLS, random.randint(1, 2)),
+        "coverage": {"geo_fence": random_fence()},
+        "schedule": random_schedule(),
+        "current_workload": random.randint(0, 12)
+    }
+
+def brute_force(agents, fences, lon, lat, category, moment):
+    """The selection the per-request $geoIntersects query and Python filters made"""
+    lons, lats = np.array([lon]), np.array([lat])
+    candidates = [
+        a for a, f in zip(agents, fences)
+        if f.bbox[0] <= lon <= f.bbox[2] and f.bbox[1] <= lat <= f.bbox[3] and f.contains(lons, lats)[0]
+    ]
+    required = CATEGORY_SKILLS.get(category, "general")
+    skilled = [a for a in candidates if required in a["skills"] or "general" in a["skills"]]
+    candidates = skilled or candidates
+    day, now = WEEKDAYS[moment.weekday()], moment.strftime("%H:%M")
+    on_shift = [
+        a for a in candidates
+        if a["schedule"]["on_call"] or any(s["day"] == day and s["start"] <= now <= s["end"] for s in a["schedule"]["shifts"])
+    ]
+    candidates = on_shift or candidates
+    return min(candidates, key=lambda a: a["current_workload"])["_id"] if candidates else None
+
+def random_lookup():
+    lon, lat = random.gauss(CENTER[0], SPREAD_DEG), random.gauss(CENTER[1], SPREAD_DEG)
+    moment = datetime(2026, 1, 5) + timedelta(minutes=random.randrange(7 * 24 * 60))
+    return lon, lat, random.choice(CATEGORIES), moment
+
+def run_benchmark():
+    print("=" * 60)
+    print(f"AGENT ROUTING INDEX BENCHMARK ({AGENTS:,} agents)")
+    print("=" * 60)
+    agents = [random_agent(i) for i in range(AGENTS)]
+    index = AgentIndex()
+    start = time.perf_counter()
+    index.load(agents)
+    print(f"\n   Load:          {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    lookups = [random_lookup() for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    picks = [index.best(lon, lat, CATEGORY_SKILLS.get(category, "general"), moment) for lon, lat, category, moment in lookups]
+    elapsed = time.perf_counter() - start
+    per_second = LOOKUPS / elapsed
+    print(f"   Lookups:       {elapsed / LOOKUPS * 1000:.3f} ms each, {per_second:,.0f} per second")
+    print(f"   Unassignable:  {sum(p is None for p in picks)} of {LOOKUPS:,} locations")
+
+    fences = [PreparedZone(a["_id"], a["coverage"]["geo_fence"]) for a in agents]
+    errors = 0
+    for (lon, lat, category, moment), pick in list(zip(lookups, picks))[:CHECKED]:
+        expected = brute_force(agents, fences, lon, lat, category, moment)
+        if (pick or {}).get("_id") != expected:
+            errors += 1
+            if errors <= 5:
+                print(f"   ❌ ({lon:.5f}, {lat:.5f}) {category} {moment:%a %H:%M}: index={pick} brute force={expected}")
+
+    print(f"\n   {'✅' if errors == 0 else '❌'} {CHECKED - errors}/{CHECKED} picks match brute force; "
+          f"{'✅' if per_second >= TARGET_PER_SECOND else '❌'} {per_second:,.0f}/s (target {TARGET_PER_SECOND:,}/s)")
+    return errors == 0 and per_second >= TARGET_PER_SECOND
+
+if __name__ == "__main__":
+    sys.exit(0 if run_benchmark() else 1)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Load benchmark: p99 latency of GET /requests/{id} while heavy analytics
+queries run concurrently against the same uvicorn worker.
+
+Usage: python3 bench_async_latency.py [REQUEST_ID]
+Requires the API running on localhost:8000 with at least one request seeded.
+"""
+import sys
+import time
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+BASE_URL = "http://localhost:8000"
+READERS = 16
+ANALYTICS_WORKERS = 4
+DURATION_SECONDS = 20
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def reader(request_id, stop, latencies):
+    session = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        res = session.get(f"{BASE_URL}/requests/{request_id}")
+        elapsed = (time.perf_counter() - start) * 1000
+        if res.status_code == 200:
+            latencies.append(elapsed)
+
+def analytics_load(stop, counter):
+    session = requests.Session()
+    day = 0
+    while not stop.is_set():
+        # Vary the date window so every call misses the KPI cache
+        day = (day + 1) % 365
+        session.get(f"{BASE_URL}/analytics/kpis", params={"start_date": f"2020-01-01T00:00:{day % 60:02d}"})
+        session.get(f"{BASE_URL}/analytics/agents")
+        counter.append(1)
+
+def run_phase(request_id, with_analytics):
+    stop = threading.Event()
+    latencies, analytics_calls = [], []
+    workers = READERS + (ANALYTICS_WORKERS if with_analytics else 0)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in range(READERS):
+            pool.submit(reader, request_id, stop, latencies)
+        if with_analytics:
+            for _ in range(ANALYTICS_WORKERS):
+                pool.submit(analytics_load, stop, analytics_calls)
+        time.sleep(DURATION_SECONDS)
+        stop.set()
+    return latencies, len(analytics_calls)
+
+def report(label, latencies, analytics_calls):
+    if not latencies:
+        print(f"{label}: no successful reads")
+        return
+    print(f"{label}:")
+    print(f"  reads:      {len(latencies)} ({len(latencies) / DURATION_SECONDS:.0f} req/s)")
+    print(f"  p50:        {statistics.median(latencies):.1f} ms")
+    print(f"  p99:        {percentile(latencies, 99):.1f} ms")
+    print(f"  max:        {max(latencies):.1f} ms")
+    print(f"  analytics:  {analytics_calls} heavy calls completed")
+
+def run_benchmark():
+    if len(sys.argv) > 1:
+        request_id = sys.argv[1]
+    else:
+        recent = requests.get(f"{BASE_URL}/requests/", params={"limit": 1}).json()
+        if not recent:
+            print("No requests found. Seed data first (python3 seed_and_test.py).")
+            sys.exit(1)
+        request_id = recent[0]["request_id"]
+
+    print("=" * 60)
+    print(f"ASYNC LATENCY BENCHMARK ({request_id}, {DURATION_SECONDS}s per phase)")
+    print("=" * 60)
+    report("Baseline (reads only)", *run_phase(request_id, with_analytics=False))
+    report("Under analytics load", *run_phase(request_id, with_analytics=True))
+
+if __name__ == "__main__":
+    run_benchmark()
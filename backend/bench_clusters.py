@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the staff-map cluster index behind /analytics/clusters.
+
+Loads 100k open requests spread over a metro area, then times viewport
+queries from city-wide down to street zoom, cluster expansion, and the
+incremental updates applied on create/transition. Also checks that every
+query accounts for each request in the viewport exactly once.
+
+Usage: python3 bench_clusters.py
+Runs in-process; no server or database needed.
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.clusters import ClusterIndex
+
+POINTS = 100_000
+QUERIES = 200
+UPDATES = 20_000
+CENTER = (35.21, 31.77)
+SPREAD_DEG = 0.15  # ~15 km around the center
+PRIORITIES = ["low", "medium", "high", "critical"]
+CATEGORIES = ["pothole", "water_leak", "trash", "lighting", "sewage"]
+
+def random_request(i):
+    # Gaussian around the center with a few dense hotspots, like real demand
+    spread = SPREAD_DEG / (8 if i % 5 == 0 else 1)
+    lon = random.gauss(CENTER[0], spread)
+    lat = random.gauss(CENTER[1], spread)
+    return (f"CST-BENCH-{i:06d}", [lon, lat], random.choice(PRIORITIES), random.choice(CATEGORIES))
+
+def viewport(zoom):
+    # A 1280x800 px window at this zoom, centered near the city
+    width = 1280 / 256 * 360 / 2 ** zoom
+    height = 800 / 256 * 360 / 2 ** zoom * 0.85
+    lon = random.gauss(CENTER[0], SPREAD_DEG / 2)
+    lat = random.gauss(CENTER[1], SPREAD_DEG / 2)
+    return (lon - width / 2, lat - height / 2, lon + width / 2, lat + height / 2)
+
+def brute_force_count(requests, bbox):
+    return sum(1 for _, (lon, lat), _, _ in requests if bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3])
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+def run_benchmark():
+    print("=" * 60)
+    print(f"CLUSTER INDEX BENCHMARK ({POINTS:,} open requests)")
+    print("=" * 60)
+    requests = [random_request(i) for i in range(POINTS)]
+    index = ClusterIndex()
+    _, build_ms = timed(lambda: index.load(requests))
+    print(f"\n   Load:          {build_ms:.0f} ms")
+
+    errors = 0
+    print(f"\n   {'zoom':>4}  {'avg ms':>7}  {'p95 ms':>7}  {'features':>8}")
+    for zoom in [8, 10, 12, 14, 16, 18]:
+        timings, sizes = [], []
+        for query in range(QUERIES):
+            bbox = viewport(zoom)
+            features, ms = timed(lambda: index.clusters(bbox, zoom))
+            timings.append(ms)
+            sizes.append(len(features))
+            if query < 5:
+                covered = sum(f["properties"].get("point_count", 1) for f in features)
+                errors += covered != brute_force_count(requests, bbox)
+        timings.sort()
+        print(f"   {zoom:>4}  {sum(timings) / QUERIES:>7.2f}  {timings[int(QUERIES * 0.95)]:>7.2f}  {sum(sizes) / QUERIES:>8.0f}")
+
+    clusters = [f for f in index.clusters(None, 10) if f["properties"]["cluster"]]
+    expand_times = []
+    for feature in clusters[:QUERIES]:
+        (zoom, children), ms = timed(lambda: index.expand(feature["properties"]["cluster_id"]))
+        expand_times.append(ms)
+        errors += sum(c["properties"].get("point_count", 1) for c in children) != feature["properties"]["point_count"]
+    print(f"\n   Expand:        {sum(expand_times) / len(expand_times):.2f} ms avg over {len(expand_times)} clusters")
+
+    start = time.perf_counter()
+    for i in range(UPDATES):
+        if i % 2:
+            index.remove(requests[random.randrange(POINTS)][0])
+        else:
+            new = random_request(POINTS + i)
+            index.upsert(*new)
+    update_us = (time.perf_counter() - start) / UPDATES * 1e6
+    print(f"   Updates:       {update_us:.1f} µs per create/close")
+
+    print(f"\n   Count parity:  {'✅ every request in the viewport counted once' if errors == 0 else f'❌ {errors} mismatches'}")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark for batch dispatch behind POST /agents/assign-batch.
+
+Loads 1,000 agents with geo-fences, skills and shifts into the routing
+index, then plans a morning backlog of 5,000 triaged requests with mixed
+SLA deadlines. Checks that every assignment respects fences and the
+workload cap and that no request is placed twice, and compares the plan
+with one-at-a-time greedy assignment (least-loaded eligible agent, as
+POST /agents/assign-request does) on travel distance, skill matches and
+how many overdue requests were placed. Target: under 5 s for the backlog.
+
+Usage: python3 bench_dispatch.py
+Runs in-process; no server or database needed.
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from app.utils.agent_index import AgentIndex
+from app.utils.dispatch import plan_dispatch, DEFAULT_MAX_WORKLOAD
+from app.utils.geo import haversine_matrix
+from app.routers.agents import CATEGORY_SKILLS
+from bench_agent_routing import random_agent, CENTER, SPREAD_DEG, CATEGORIES
+
+AGENTS = 1000
+REQUESTS = 5000
+TARGET_SECONDS = 5
+MOMENT = datetime(2026, 1, 5, 8, 30)
+
+def random_request():
+    return (
+        random.gauss(CENTER[0], SPREAD_DEG), random.gauss(CENTER[1], SPREAD_DEG), random.choice(CATEGORIES),
+        random.choice([-12, -2, 1, 4, 20, 48, 96]) + random.random()
+    )
+
+def greedy(index, lons, lats, skills):
+    """One request at a time, least-loaded eligible agent, in arrival order (no workload cap)"""
+    plan = []
+    for i, (lon, lat, skill) in enumerate(zip(lons, lats, skills)):
+        pick = index.best(lon, lat, skill, MOMENT)
+        if pick:
+            index.add_workload(pick["_id"], 1)
+            plan.append((i, pick["_id"]))
+    return plan
+
+def capped_greedy(view, max_workload):
+    """Greedy as above, but only over agents still under max_workload"""
+    plan, workload = [], view["workload"].copy()
+    for i, rows in enumerate(view["covering"]):
+        open_rows = workload[rows] < max_workload
+        rows, skilled = rows[open_rows], view["skilled"][i][open_rows]
+        if skilled.any():
+            rows = rows[skilled]
+        on_shift = view["on_shift"][rows]
+        if on_shift.any():
+            rows = rows[on_shift]
+        if len(rows):
+            row = int(rows[np.argmin(workload[rows])])
+            workload[row] += 1
+            plan.append((i, view["ids"][row]))
+    return plan
+
+def summarize(label, plan, agents_by_id, lons, lats, skills, hours_left):
+    km = [
+        haversine_matrix([lons[i]], [lats[i]], [agents_by_id[a]["center"][0]], [agents_by_id[a]["center"][1]])[0][0]
+        for i, a in plan
+    ]
+    skilled = sum(skills[i] in agents_by_id[a]["skills"] or "general" in agents_by_id[a]["skills"] for i, a in plan)
+    overdue = sum(hours_left[i] < 0 for i, _ in plan)
+    print(f"   {label:<14} placed {len(plan):>5}   avg {np.mean(km):>5.2f} km   skill match {skilled / max(len(plan), 1):>6.1%}   "
+          f"overdue placed {overdue}/{sum(h < 0 for h in hours_left)}")
+    return len(plan), skilled / max(len(plan), 1)
+
+def run_benchmark():
+    print("=" * 60)
+    print(f"BATCH DISPATCH BENCHMARK ({REQUESTS:,} requests, {AGENTS:,} agents)")
+    print("=" * 60)
+    agents = [random_agent(i) for i in range(AGENTS)]
+    for agent in agents:
+        agent["current_workload"] = random.randint(0, 4)
+    index = AgentIndex(agents)
+    backlog = [random_request() for _ in range(REQUESTS)]
+    lons, lats, categories, hours_left = (list(column) for column in zip(*backlog))
+    skills = [CATEGORY_SKILLS.get(c, "general") for c in categories]
+
+    start = time.perf_counter()
+    view = index.batch_view(lons, lats, skills, MOMENT)
+    plan = plan_dispatch(lons, lats, hours_left, view, DEFAULT_MAX_WORKLOAD)
+    elapsed = time.perf_counter() - start
+    print(f"\n   Planned in {elapsed:.2f} s\n")
+
+    errors = 0
+    loads = {}
+    for i, agent, _ in plan:
+        loads[view["ids"][agent]] = loads.get(view["ids"][agent], 0) + 1
+        errors += agent not in view["covering"][i]
+    by_id = {a["_id"]: a for a in agents}
+    for row, agent_id in enumerate(view["ids"]):
+        by_id[agent_id]["center"] = view["centers"][row]
+    errors += sum(by_id[a]["current_workload"] + n > DEFAULT_MAX_WORKLOAD for a, n in loads.items())
+    errors += len({i for i, _, _ in plan}) != len(plan)
+
+    batch = summarize("batch", [(i, view["ids"][a]) for i, a, _ in plan], by_id, lons, lats, skills, hours_left)
+    capped = summarize("greedy, capped", capped_greedy(index.batch_view(lons, lats, skills, MOMENT), DEFAULT_MAX_WORKLOAD),
+                       by_id, lons, lats, skills, hours_left)
+    uncapped = greedy(AgentIndex(agents), lons, lats, skills)
+    summarize("greedy", uncapped, by_id, lons, lats, skills, hours_left)
+    greedy_loads = {}
+    for _, a in uncapped:
+        greedy_loads[a] = greedy_loads.get(a, 0) + 1
+    over = sum(by_id[a]["current_workload"] + n > DEFAULT_MAX_WORKLOAD for a, n in greedy_loads.items())
+    print(f"   (uncapped greedy leaves {over} agents over {DEFAULT_MAX_WORKLOAD} active tasks)")
+    as_good = batch[0] >= capped[0] and batch[1] >= capped[1]
+
+    print(f"\n   {'✅ fences, caps and uniqueness hold' if errors == 0 else f'❌ {errors} constraint violations'}; "
+          f"{'✅' if as_good else '❌'} placed and skill match vs capped greedy; "
+          f"{'✅' if elapsed < TARGET_SECONDS else '❌'} {elapsed:.2f} s (target {TARGET_SECONDS} s)")
+    return errors == 0 and as_good and elapsed < TARGET_SECONDS
+
+if __name__ == "__main__":
+    sys.exit(0 if run_benchmark() else 1)
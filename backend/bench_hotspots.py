@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the recurring-issue hotspot index behind /analytics/cohorts.
+
+Loads 100k requests spread over a metro area and the past year (with a few
+hundred repeat-problem spots), then times the first query for a window,
+category and radius, repeat queries, and refreshes after batches of new
+requests. Each refreshed result must equal the result of a freshly loaded
+index, and every hotspot must be a set of requests that a brute-force
+grid clustering also groups together.
+
+Usage: python3 bench_hotspots.py
+Runs in-process; no server or database needed.
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.hotspots import HotspotIndex, to_meters, NEIGHBOUR_OFFSETS
+
+POINTS = 100_000
+SPOTS = 300
+BATCHES = 20
+BATCH_SIZE = 200
+CENTER = (35.21, 31.77)
+SPREAD_DEG = 0.15  # ~15 km around the center
+CATEGORIES = ["pothole", "water_leak", "trash", "lighting", "sewage"]
+QUERIES = [(90, None, 50), (30, "pothole", 50), (365, None, 100), (7, None, 25)]
+MIN_REPORTS = 3
+LIMIT = 15
+
+now = datetime.utcnow().replace(microsecond=0)
+spots = [(random.gauss(CENTER[0], SPREAD_DEG / 2), random.gauss(CENTER[1], SPREAD_DEG / 2)) for _ in range(SPOTS)]
+
+def random_request(i, created):
+    if i % 4 == 0:
+        # Repeat problems: within a few meters of a known spot
+        spot = random.randrange(SPOTS)
+        lon, lat = random.gauss(spots[spot][0], 0.0001), random.gauss(spots[spot][1], 0.0001)
+        hint = f"Spot {spot}"
+    else:
+        lon, lat = random.gauss(CENTER[0], SPREAD_DEG), random.gauss(CENTER[1], SPREAD_DEG)
+        hint = None
+    return {
+        "request_id": f"CST-BENCH-{i:06d}",
+        "category": random.choice(CATEGORIES),
+        "location": {"coordinates": [lon, lat], "address_hint": hint},
+        "timestamps": {"created_at": created},
+        "rating": {"stars": random.randint(1, 5)} if random.random() < 0.3 else None
+    }
+
+def brute_force(requests, window_days, category, radius_m, at):
+    """Sets of request ids per hotspot, from a plain dict-of-cells clustering"""
+    cutoff = at - timedelta(days=window_days)
+    rows = [r for r in requests if r["timestamps"]["created_at"] >= cutoff and (not category or r["category"] == category)]
+    cells = {}
+    for r in rows:
+        x, y = to_meters([r["location"]["coordinates"][0]], [r["location"]["coordinates"][1]])
+        cells.setdefault((int(x[0] // radius_m), int(y[0] // radius_m)), []).append(r["request_id"])
+    dense = {c for c in cells if sum(len(cells.get((c[0] + dx, c[1] + dy), [])) for dx, dy in NEIGHBOUR_OFFSETS) >= MIN_REPORTS}
+    groups, seen = [], set()
+    for cell in dense:
+        if cell in seen:
+            continue
+        seen.add(cell)
+        stack, members = [cell], set()
+        while stack:
+            c = stack.pop()
+            members.update(cells[c])
+            for dx, dy in NEIGHBOUR_OFFSETS:
+                n = (c[0] + dx, c[1] + dy)
+                if n in dense and n not in seen:
+                    seen.add(n)
+                    stack.append(n)
+        groups.append(members)
+    return sorted(groups, key=len, reverse=True)
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+def run_benchmark():
+    print("=" * 60)
+    print(f"HOTSPOT INDEX BENCHMARK ({POINTS:,} requests over a year)")
+    print("=" * 60)
+    created = sorted(now - timedelta(seconds=random.randint(0, 365 * 86400)) for _ in range(POINTS))
+    requests = [random_request(i, t) for i, t in enumerate(created)]
+    index = HotspotIndex()
+    _, load_ms = timed(lambda: index.load(requests))
+    print(f"\n   Load:          {load_ms:.0f} ms")
+
+    errors = 0
+    print(f"\n   {'window':>6}  {'category':<10} {'radius':>6}  {'first ms':>8}  {'repeat ms':>9}  {'hotspots':>8}")
+    for window, category, radius in QUERIES:
+        result, first_ms = timed(lambda: index.hotspots(window, category, radius, MIN_REPORTS, LIMIT, now=now))
+        _, repeat_ms = timed(lambda: index.hotspots(window, category, radius, MIN_REPORTS, LIMIT, now=now))
+        print(f"   {window:>6}  {category or 'all':<10} {radius:>6}  {first_ms:>8.1f}  {repeat_ms:>9.3f}  {len(result):>8}")
+        expected = brute_force(requests, window, category, radius, now)
+        if sorted(h["count"] for h in result) != sorted(len(g) for g in expected[:LIMIT]):
+            errors += 1
+            print(f"   ❌ hotspot sizes differ from brute force for {window}d {category} {radius}m")
+        groups = [set(g) for g in expected]
+        errors += sum(1 for h in result if set(h["request_ids"]) - next((g for g in groups if h["request_ids"][0] in g), set()))
+
+    refresh_times = []
+    at = now
+    for batch in range(BATCHES):
+        at += timedelta(hours=6)
+        new = [random_request(POINTS + batch * BATCH_SIZE + i, at - timedelta(seconds=BATCH_SIZE - i)) for i in range(BATCH_SIZE)]
+        requests.extend(new)
+        for req in new:
+            index.add(req)
+        for window, category, radius in QUERIES:
+            _, ms = timed(lambda: index.hotspots(window, category, radius, MIN_REPORTS, LIMIT, now=at))
+            refresh_times.append(ms)
+    refresh_times.sort()
+    print(f"\n   Refresh after {BATCH_SIZE} new requests: avg {sum(refresh_times) / len(refresh_times):.1f} ms, "
+          f"p95 {refresh_times[int(len(refresh_times) * 0.95)]:.1f} ms")
+
+    fresh = HotspotIndex()
+    fresh.load(requests)
+    for window, category, radius in QUERIES:
+        if index.hotspots(window, category, radius, MIN_REPORTS, LIMIT, now=at) != fresh.hotspots(window, category, radius, MIN_REPORTS, LIMIT, now=at):
+            errors += 1
+            print(f"   ❌ refreshed result differs from a fresh index for {window}d {category} {radius}m")
+
+    print(f"\n   {'✅ refreshed hotspots match a fresh index and brute force' if errors == 0 else f'❌ {errors} mismatches'}")
+    return errors == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if run_benchmark() else 1)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark for agent route planning behind GET /agents/{agent_id}/route.
+
+Plans routes for a batch of agents, each with 200 active tasks spread over
+their part of the city with mixed SLA deadlines, starting from the agent's
+base. Compares the planned order with the assigned_at order GET
+/agents/{agent_id}/tasks returns and with a plain nearest-neighbour tour,
+on total km and on how far into the route overdue stops are reached.
+Checks every route visits each stop exactly once. Target: under 50 ms per
+200-stop route.
+
+Usage: python3 bench_route.py
+Runs in-process; no server or database needed.
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from app.utils.routing import plan_route
+from app.utils.geo import haversine_matrix
+
+ROUTES = 20
+STOPS = 200
+TARGET_MS = 50
+BASE = (35.21, 31.77)
+SPREAD_DEG = 0.04
+
+def random_tasks():
+    lons = [random.gauss(BASE[0], SPREAD_DEG) for _ in range(STOPS)]
+    lats = [random.gauss(BASE[1], SPREAD_DEG) for _ in range(STOPS)]
+    hours_left = [random.choice([-12, -2, 1, 4, 20, 48, 96, float("nan")]) + random.random() for _ in range(STOPS)]
+    return lons, lats, hours_left
+
+def measure(order, lons, lats, hours_left):
+    """(total km from the base, mean km driven before reaching an overdue stop)"""
+    path_lons = [BASE[0]] + [lons[i] for i in order]
+    path_lats = [BASE[1]] + [lats[i] for i in order]
+    legs = [haversine_matrix([path_lons[k]], [path_lats[k]], [path_lons[k + 1]], [path_lats[k + 1]])[0][0] for k in range(len(order))]
+    arrival = np.cumsum(legs)
+    overdue = [arrival[k] for k, i in enumerate(order) if hours_left[i] < 0]
+    return sum(legs), float(np.mean(overdue))
+
+def nearest_neighbour(lons, lats):
+    order, position, left = [], BASE, set(range(len(lons)))
+    while left:
+        nearest = min(left, key=lambda i: (lons[i] - position[0]) ** 2 + ((lats[i] - position[1]) * 0.85) ** 2)
+        order.append(nearest)
+        left.remove(nearest)
+        position = (lons[nearest], lats[nearest])
+    return order
+
+def run_benchmark():
+    print("=" * 60)
+    print(f"ROUTE PLANNING BENCHMARK ({ROUTES} routes x {STOPS} stops)")
+    print("=" * 60)
+    plan_route(*random_tasks(), BASE)   # warm up
+
+    timings, errors = [], 0
+    totals = {"assigned_at": [0, 0], "nearest": [0, 0], "planned": [0, 0]}
+    for _ in range(ROUTES):
+        lons, lats, hours_left = random_tasks()
+        start = time.perf_counter()
+        order, _ = plan_route(lons, lats, hours_left, BASE)
+        timings.append((time.perf_counter() - start) * 1000)
+        errors += sorted(order) != list(range(STOPS))
+        for label, candidate in [("assigned_at", list(range(STOPS))), ("nearest", nearest_neighbour(lons, lats)), ("planned", order)]:
+            km, overdue_km = measure(candidate, lons, lats, hours_left)
+            totals[label][0] += km / ROUTES
+            totals[label][1] += overdue_km / ROUTES
+
+    print(f"\n   Planning:  {np.mean(timings):.1f} ms mean, {max(timings):.1f} ms max\n")
+    for label, (km, overdue_km) in totals.items():
+        print(f"   {label:<12} {km:>7.1f} km per route   overdue stops reached after {overdue_km:>6.1f} km on average")
+
+    slowest = max(timings)
+    print(f"\n   {'✅ every stop visited once' if errors == 0 else f'❌ {errors} routes drop or repeat stops'}; "
+          f"{'✅' if slowest < TARGET_MS else '❌'} {slowest:.1f} ms max (target {TARGET_MS} ms)")
+    return errors == 0 and slowest < TARGET_MS
+
+if __name__ == "__main__":
+    sys.exit(0 if run_benchmark() else 1)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the sensitive-location proximity check used by triage.
+
+Builds registries of 10k and 100k random locations spread over a national
+extent (one entry per ~7.5 km² and ~0.75 km² respectively) and compares the grid index against the old linear haversine scan, checking
+that both return the same matches.
+
+Usage: python3 bench_sensitive_locations.py
+Runs in-process; no server or database needed.
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.geo import PointGridIndex, calculate_distance
+
+RADIUS_KM = 0.5
+QUERIES = 2000
+BBOX = (34.25, 29.50, 35.90, 33.30)  # lon/lat box covering the country
+
+def random_point():
+    return [random.uniform(BBOX[0], BBOX[2]), random.uniform(BBOX[1], BBOX[3])]
+
+def linear_scan(locations, lon, lat):
+    matches = []
+    for loc in locations:
+        distance = calculate_distance(lon, lat, loc["coordinates"][0], loc["coordinates"][1])
+        if distance <= RADIUS_KM:
+            matches.append((loc, distance))
+    return matches
+
+def run_benchmark():
+    print("=" * 60)
+    print(f"SENSITIVE LOCATION LOOKUP BENCHMARK ({QUERIES} queries, {RADIUS_KM} km)")
+    print("=" * 60)
+    queries = [random_point() for _ in range(QUERIES)]
+
+    for size in [10_000, 100_000]:
+        locations = [
+            {"coordinates": random_point(), "name": f"Site {i}", "type": random.choice(["school", "hospital", "clinic"])}
+            for i in range(size)
+        ]
+        start = time.perf_counter()
+        index = PointGridIndex(locations, cell_km=RADIUS_KM)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        indexed = [index.within(lon, lat, RADIUS_KM) for lon, lat in queries]
+        index_us = (time.perf_counter() - start) / QUERIES * 1e6
+
+        sample = queries[:50]
+        start = time.perf_counter()
+        linear = [linear_scan(locations, lon, lat) for lon, lat in sample]
+        linear_us = (time.perf_counter() - start) / len(sample) * 1e6
+
+        mismatches = sum(1 for a, b in zip(indexed, linear) if [l["name"] for l, _ in a] != [l["name"] for l, _ in b])
+        avg_hits = sum(len(m) for m in indexed) / QUERIES
+
+        print(f"\n{size:,} locations:")
+        print(f"   Index build:   {build_ms:.0f} ms")
+        print(f"   Grid lookup:   {index_us:.1f} µs/query (avg {avg_hits:.1f} matches)")
+        print(f"   Linear scan:   {linear_us:.0f} µs/query")
+        print(f"   Result parity: {'✅ identical' if mismatches == 0 else f'❌ {mismatches} mismatches'}")
+
+if __name__ == "__main__":
+    run_benchmark()
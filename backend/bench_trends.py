@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark for /analytics/trends.
+
+Seeds kpi_rollups and trend_rollups in a scratch database with two years of
+daily and hourly rows for 50 zones (every category/priority combination
+present each day in busy zones, as in a large city), then times uncached
+trend queries: the 2-year per-zone daily query the staffing dashboard runs,
+per category, a filter that falls back to kpi_rollups, and a week of hourly
+data. Target: under 200 ms for the 2-year, 50-zone query.
+
+Usage: python3 bench_trends.py
+Requires mongod on MONGO_URL (default mongodb://localhost:27017). Uses the
+database cst_trends_bench unless TRENDS_BENCH_DB is set; its rollup
+collections are dropped before and after the run.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+from datetime import datetime, timedelta
+
+os.environ["DB_NAME"] = os.getenv("TRENDS_BENCH_DB", "cst_trends_bench")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import get_database, setup_indexes
+from app.routers.analytics import get_trends
+from app.utils import rollups
+from app.utils.cache import analytics_cache
+
+DAYS = 730
+ZONES = [f"ZONE-{i:02d}" for i in range(50)]
+CATEGORIES = ["pothole", "water_leak", "trash", "lighting", "sewage"]
+PRIORITIES = ["low", "medium", "high", "critical"]
+HOURLY_DAYS = 14
+RUNS = 5
+TARGET_MS = 200
+
+db = get_database()
+
+def rollup_row(granularity, bucket, zone, category, priority, created):
+    resolved = max(0, created - random.randint(0, 2))
+    return {
+        "granularity": granularity, "bucket": bucket, "zone_id": zone, "category": category,
+        "priority": priority, "agent_id": None, "count": created, "resolved": resolved,
+        "breached": random.randint(0, 1) if created else 0, "status": {"resolved": resolved}
+    }
+
+def add_trend_counts(trends, row):
+    for dimension, field in rollups.TREND_DIMENSIONS.items():
+        key = (row["granularity"], dimension, row[field] if field else None, row["bucket"])
+        counts = trends.setdefault(key, {"created": 0, "resolved": 0, "breached": 0})
+        counts["created"] += row["count"]
+        counts["resolved"] += row["resolved"]
+        counts["breached"] += row["breached"]
+
+async def drop_collections():
+    await db.kpi_rollups.drop()
+    await db.trend_rollups.drop()
+
+async def seed():
+    await drop_collections()
+    await setup_indexes()
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = []
+    trends = {}
+    for day in range(DAYS):
+        bucket = today - timedelta(days=DAYS - day)
+        for z, zone in enumerate(ZONES):
+            # Busy zones report every combination daily; quiet ones a few
+            combos = [(c, p) for c in CATEGORIES for p in PRIORITIES]
+            for category, priority in combos[:max(2, 20 - z // 3)]:
+                rows.append(rollup_row("day", bucket, zone, category, priority, random.randint(1, 6)))
+                add_trend_counts(trends, rows[-1])
+        if len(rows) >= 50_000:
+            await db.kpi_rollups.insert_many(rows, ordered=False)
+            rows = []
+    for hour in range(HOURLY_DAYS * 24):
+        bucket = today - timedelta(hours=HOURLY_DAYS * 24 - hour)
+        for zone in ZONES:
+            rows.append(rollup_row("hour", bucket, zone, random.choice(CATEGORIES), random.choice(PRIORITIES), random.randint(0, 3)))
+            add_trend_counts(trends, rows[-1])
+    if rows:
+        await db.kpi_rollups.insert_many(rows, ordered=False)
+    trend_docs = [
+        {**dict(zip(rollups.TREND_KEY_FIELDS, key)), **counts} for key, counts in trends.items()
+    ]
+    for start in range(0, len(trend_docs), 50_000):
+        await db.trend_rollups.insert_many(trend_docs[start:start + 50_000], ordered=False)
+    return await db.kpi_rollups.count_documents({}), len(trend_docs)
+
+async def timed_query(label, **params):
+    query = {"granularity": "day", "start_date": None, "end_date": None, "group_by": "none", "zone": None,
+             "category": None, "priority": None, "agent_id": None, "horizon": None, **params}
+    timings = []
+    for _ in range(RUNS):
+        analytics_cache.invalidate()
+        start = time.perf_counter()
+        result = await get_trends(**query)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"   {label:<38} {timings[len(timings) // 2]:>7.1f} ms  ({len(result['series'])} series x {len(result['buckets'])} buckets)")
+    return timings[len(timings) // 2]
+
+async def run_benchmark():
+    print("=" * 60)
+    print(f"TRENDS BENCHMARK ({DAYS} days x {len(ZONES)} zones)")
+    print("=" * 60)
+    rows, trend_rows = await seed()
+    rollups.rollups_ready = True
+    print(f"\n   Seeded {rows:,} KPI rollup rows and {trend_rows:,} trend rows\n")
+    start = datetime.utcnow() - timedelta(days=DAYS)
+    main_ms = await timed_query("2 years daily, per zone", start_date=start, group_by="zone")
+    await timed_query("2 years daily, per category", start_date=start, group_by="category")
+    await timed_query("2 years daily, zone + priority (kpi)", start_date=start, zone=ZONES[0], priority="high")
+    await timed_query("7 days hourly, per zone", granularity="hour", group_by="zone")
+    await drop_collections()
+    print(f"\n   {'✅' if main_ms < TARGET_MS else '❌'} 2-year per-zone query {main_ms:.0f} ms (target {TARGET_MS} ms)")
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark())
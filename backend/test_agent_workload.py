@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test for the agent current_workload counters behind GET /agents/ and
+auto-assignment.
+
+Seeds a scratch database with agents covering one area and triaged
+requests inside it, then assigns, reassigns, starts, resolves and sends
+requests back to triage concurrently through the router functions, which
+move the counters as they write. Every agent's counter, and the routing
+index's cached copy, must equal its count of assigned/in-progress
+requests. Counters corrupted on purpose must be put right by
+reconcile_workloads(). Finally times GET /agents/ and
+auto-assignment at 100 and 1,000 agents: neither may issue per-agent
+queries, so both must stay well under TARGET_MS.
+
+Usage: python3 test_agent_workload.py
+Requires mongod on MONGO_URL (default mongodb://localhost:27017). Uses the
+database cst_workload_test unless WORKLOAD_TEST_DB is set; its collections
+are dropped before and after the run.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+from datetime import datetime
+from bson import ObjectId
+
+os.environ["DB_NAME"] = os.getenv("WORKLOAD_TEST_DB", "cst_workload_test")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import get_database, setup_indexes
+from fastapi import HTTPException
+from app.routers.agents import list_agents, assign_request_to_best_agent, load_agent_index
+from app.routers.requests import transition_request
+from app.utils.rollups import rebuild_kpi_rollups
+from app.utils.workload import workload_counts, reconcile_workloads
+from app.utils.agent_index import agent_index
+
+AGENT_COUNTS = [100, 1000]
+REQUESTS = 3000
+WRITE_ROUNDS = 5
+WRITES_PER_ROUND = 300
+TIMING_RUNS = 20
+TARGET_MS = 100
+AREA = [[[35.1, 31.7], [35.3, 31.7], [35.3, 31.9], [35.1, 31.9], [35.1, 31.7]]]
+
+db = get_database()
+
+def agent_doc(i):
+    return {
+        "agent_code": f"WL-{i:05d}", "name": f"Agent {i}", "department": "roads", "skills": ["road", "general"],
+        "coverage": {"zone_ids": [], "geo_fence": {"type": "Polygon", "coordinates": AREA}},
+        "schedule": {"shifts": [], "on_call": True}, "active": True, "current_workload": 0,
+        "created_at": datetime.utcnow()
+    }
+
+def request_doc(i):
+    return {
+        "request_id": f"CST-WORKLOAD-{i:06d}", "category": "pothole", "priority": "medium", "status": "triaged",
+        "location": {"type": "Point", "coordinates": [random.uniform(35.1, 35.3), random.uniform(31.7, 31.9)]},
+        "timestamps": {"created_at": datetime.utcnow(), "triaged_at": datetime.utcnow()}
+    }
+
+async def random_write(request_id, agent_ids):
+    """One router write: assign (auto or manual), start, resolve or send back to triage"""
+    req = await db.service_requests.find_one({"request_id": request_id}, {"status": 1})
+    try:
+        if req["status"] in ["triaged", "assigned"] and random.random() < 0.6:
+            await assign_request_to_best_agent(request_id, random.choice(agent_ids) if random.random() < 0.5 else None)
+        else:
+            await transition_request(request_id, random.choice(["in_progress", "resolved", "triaged"]))
+    except HTTPException:
+        pass    # not allowed from the current status, or raced by another write
+
+async def check_counters(label):
+    counts = await workload_counts()
+    mismatches = 0
+    async for agent in db.service_agents.find({}, {"current_workload": 1}):
+        actual = counts.get(str(agent["_id"]), 0)
+        if agent.get("current_workload", 0) != actual or agent_index.workload(str(agent["_id"])) not in (None, actual):
+            mismatches += 1
+    if mismatches:
+        print(f"   ❌ {label}: {mismatches} agents with a wrong current_workload")
+    return mismatches
+
+async def timed(fn):
+    timings = []
+    for _ in range(TIMING_RUNS):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+async def drop_collections():
+    for name in ["service_agents", "service_requests", "kpi_rollups", "trend_rollups", "latency_sketches"]:
+        await db[name].drop()
+
+async def run_test():
+    print("=" * 60)
+    print("AGENT WORKLOAD COUNTERS")
+    print("=" * 60)
+    await drop_collections()
+    await setup_indexes()
+    errors = 0
+    for agent_count in AGENT_COUNTS:
+        await db.service_agents.delete_many({})
+        await db.service_requests.delete_many({})
+        await db.service_agents.insert_many([agent_doc(i) for i in range(agent_count)])
+        await db.service_requests.insert_many([request_doc(i) for i in range(REQUESTS)])
+        await rebuild_kpi_rollups()
+        await load_agent_index()
+        agent_ids = [str(a["_id"]) for a in await db.service_agents.find({}, {"_id": 1}).to_list()]
+
+        for round_number in range(1, WRITE_ROUNDS + 1):
+            targets = random.sample(range(REQUESTS), WRITES_PER_ROUND)
+            await asyncio.gather(*[random_write(f"CST-WORKLOAD-{i:06d}", agent_ids) for i in targets])
+            errors += await check_counters(f"{agent_count} agents, write round {round_number}")
+
+        drifted = random.sample(agent_ids, 10)
+        for agent_id in drifted:
+            await db.service_agents.update_one({"_id": ObjectId(agent_id)}, {"$inc": {"current_workload": random.randint(1, 5)}})
+        corrected = await reconcile_workloads()
+        errors += await check_counters(f"{agent_count} agents, after reconciliation")
+        if corrected != len(drifted):
+            errors += 1
+            print(f"   ❌ reconciliation corrected {corrected} agents, expected {len(drifted)}")
+
+        await db.service_requests.update_many({}, {"$set": {"status": "triaged", "assigned_agent_id": None}})
+        await reconcile_workloads()
+        list_ms = await timed(lambda: list_agents())
+        assign_ms = await timed(lambda: assign_request_to_best_agent(f"CST-WORKLOAD-{random.randrange(REQUESTS):06d}"))
+        print(f"   {agent_count:>5} agents:  GET /agents/ {list_ms:>6.1f} ms   auto-assign {assign_ms:>6.1f} ms")
+        if list_ms > TARGET_MS or assign_ms > TARGET_MS:
+            errors += 1
+            print(f"   ❌ slower than {TARGET_MS} ms at {agent_count} agents")
+
+    await drop_collections()
+    print(f"\n   {'✅ workload counters match the requests' if errors == 0 else f'❌ {errors} failures'}")
+    return errors == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run_test()) else 1)
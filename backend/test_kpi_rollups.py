@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Parity test for the rollups behind /analytics/kpis and /analytics/trends and
+the latency sketches behind /analytics/percentiles.
+
+Seeds a scratch database with requests spread over two months, builds
+kpi_rollups, then applies a stream of random writes (status changes,
+ratings, resolutions, reassignment, zone retagging, re-dated requests) the
+way the routers do: write the request, then sync_rollups(). After every
+batch of writes the rollup KPIs must equal the raw aggregation for a set of
+filter combinations, including windows that start and end mid-hour, trend
+series must match per-bucket counts computed from the requests, and every
+sketched percentile must be within the sketch's relative accuracy of the
+exact one. A full rebuild must reproduce the incrementally maintained rows
+and sketches, a sync whose counter writes fail must apply them when it is
+retried, and writes whose sync was lost must be reported as drift and
+repaired by reconcile_rollups().
+
+Usage: python3 test_kpi_rollups.py
+Requires mongod on MONGO_URL (default mongodb://localhost:27017). Uses the
+database cst_rollup_test unless ROLLUP_TEST_DB is set; its collections are
+dropped before and after the run.
+"""
+import os
+import sys
+import random
+import asyncio
+from datetime import datetime, timedelta
+
+os.environ["DB_NAME"] = os.getenv("ROLLUP_TEST_DB", "cst_rollup_test")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import get_database
+from app.routers.analytics import get_base_filters, compute_kpis, compute_rollup_kpis, compute_trends
+from app.utils.rollups import (
+    rebuild_kpi_rollups, sync_rollups, load_sketches, rollup_state, rollup_drift, reconcile_rollups, STATE_PROJECTION
+)
+from app.utils.sketches import SKETCH_RELATIVE_ACCURACY, SKETCH_MIN_VALUE, DEFAULT_QUANTILES
+
+SEED_REQUESTS = 3000
+WRITE_ROUNDS = 5
+WRITES_PER_ROUND = 200
+STATUSES = ["new", "triaged", "assigned", "in_progress", "resolved", "closed"]
+CATEGORIES = ["pothole", "water_leak", "trash", "lighting", "sewage"]
+PRIORITIES = ["low", "medium", "high", "critical"]
+ZONES = ["ZONE-A", "ZONE-B", "ZONE-C", None]
+AGENTS = [f"agent-{i}" for i in range(8)]
+ROLLUP_COLUMNS = ["count", "status", "rating", "rating_sum", "rating_count", "resolution_hours_sum", "resolution_count"]
+
+db = get_database()
+now = datetime.utcnow().replace(microsecond=0)
+
+def random_created():
+    return now - timedelta(seconds=random.randint(0, 60 * 24 * 3600))
+
+def after(created, max_hours):
+    return min(created + timedelta(seconds=random.randint(0, max_hours * 3600)), now)
+
+def random_request(i):
+    status = random.choice(STATUSES)
+    resolved = status in ["resolved", "closed"]
+    created = random_created()
+    triaged = after(created, 48) if status != "new" else None
+    return {
+        "request_id": f"CST-ROLLUP-{i:06d}",
+        "category": random.choice(CATEGORIES),
+        "priority": random.choice(PRIORITIES),
+        "status": status,
+        "assigned_agent_id": random.choice(AGENTS) if status not in ["new", "triaged"] else None,
+        "location": {"type": "Point", "coordinates": [35.2, 31.7], "zone_id": random.choice(ZONES)},
+        "timestamps": {
+            "created_at": created,
+            "triaged_at": triaged,
+            "resolved_at": after(triaged, 300) if resolved else None
+        },
+        "sla_breach_at": created + timedelta(hours=random.choice([24, 72, 120])),
+        "rating": {"stars": random.randint(1, 5)} if resolved and random.random() < 0.6 else None,
+        "resolution": {"resolution_hours": round(random.uniform(1, 200), 1)} if resolved else None
+    }
+
+def random_update():
+    choice = random.randrange(6)
+    if choice == 0:
+        return {"status": random.choice(STATUSES)}
+    if choice == 1:
+        return {"rating": {"stars": random.randint(1, 5)}}
+    if choice == 2:
+        return {
+            "status": "resolved",
+            "timestamps.resolved_at": now - timedelta(seconds=random.randint(0, 3600)),
+            "resolution": {"resolution_hours": round(random.uniform(1, 200), 1)}
+        }
+    if choice == 3:
+        return {"assigned_agent_id": random.choice(AGENTS), "status": "assigned"}
+    if choice == 4:
+        return {"location.zone_id": random.choice(ZONES), "sla_breach_at": now - timedelta(hours=random.randint(0, 500))}
+    return {"timestamps.created_at": random_created()}
+
+def filter_cases():
+    mid_hour = now - timedelta(days=9, minutes=17, seconds=5)
+    cases = [
+        {},
+        {"category": "pothole"},
+        {"zone": "ZONE-B", "priority": "high"},
+        {"agent_id": AGENTS[0]},
+        {"start_date": now - timedelta(days=30)},
+        {"end_date": now - timedelta(days=30)},
+        {"start_date": mid_hour, "end_date": now - timedelta(minutes=42)},
+        {"start_date": mid_hour, "end_date": mid_hour + timedelta(minutes=20)},
+        {"start_date": mid_hour, "end_date": mid_hour + timedelta(hours=5), "category": "trash"},
+        {"start_date": now - timedelta(days=20), "end_date": now - timedelta(days=10), "zone": "ZONE-A"},
+    ]
+    for _ in range(10):
+        start = random_created()
+        cases.append({
+            "start_date": start,
+            "end_date": start + timedelta(seconds=random.randint(60, 20 * 24 * 3600)),
+            random.choice(["zone", "category", "priority", "agent_id"]): random.choice(["ZONE-C", "lighting", "low", AGENTS[1]])
+        })
+    return cases
+
+async def check_parity(label):
+    mismatches = 0
+    for case in filter_cases():
+        raw = await compute_kpis(get_base_filters(**case))
+        rolled = await compute_rollup_kpis(**case)
+        if raw != rolled:
+            mismatches += 1
+            print(f"   ❌ {label}: {case}")
+            for key in raw:
+                if raw[key] != rolled.get(key):
+                    print(f"      {key}: raw={raw[key]} rollup={rolled.get(key)}")
+    return mismatches
+
+def trend_cases():
+    return [
+        ("day", "none", {}), ("day", "zone", {}), ("day", "category", {}), ("day", "none", {"zone_id": "ZONE-A"}),
+        ("day", "zone", {"category": "trash"}), ("day", "category", {"priority": "high"}), ("hour", "zone", {}),
+    ]
+
+async def check_trends(label):
+    """Trend series vs per-bucket event counts computed request by request"""
+    docs = await db.service_requests.find({}, STATE_PROJECTION).to_list()
+    states = [rollup_state(doc) for doc in docs]
+    mismatches = 0
+    for granularity, group_by, dims in trend_cases():
+        step = timedelta(days=1) if granularity == "day" else timedelta(hours=1)
+        buckets = 70 if granularity == "day" else 24 * 14
+        start = now.replace(minute=0, second=0) - buckets * step
+        if granularity == "day":
+            start = start.replace(hour=0)
+        result = await compute_trends(granularity, start, buckets, group_by, dims, 7)
+        actual = {row["key"]: [row[m] for m in ["created", "resolved", "breached"]] for row in result["series"]}
+        expected = {}
+        for state in states:
+            if any(state[field] != value for field, value in dims.items()):
+                continue
+            key = "all" if group_by == "none" else (state["zone_id" if group_by == "zone" else "category"] or "Unknown")
+            for m, field in enumerate(["bucket", "resolved_bucket", "breach_bucket"]):
+                if state[field] and start <= state[field] < start + buckets * step:
+                    series = expected.setdefault(key, [[0] * buckets for _ in range(3)])
+                    series[m][int((state[field] - start) / step)] += 1
+        if {k: v for k, v in actual.items() if any(map(any, v))} != expected:
+            mismatches += 1
+            print(f"   ❌ {label}: trends {granularity} by {group_by} {dims}")
+    return mismatches
+
+async def check_sketches(label):
+    """Sketched p50/p90/p99 per category vs exact nearest-rank percentiles of the same values"""
+    exact = {}
+    async for req in db.service_requests.find({}, STATE_PROJECTION):
+        state = rollup_state(req)
+        for metric, field in [("resolution", "resolved_hours"), ("first_response", "first_response_hours")]:
+            if state[field] is not None:
+                exact.setdefault((state["category"], metric), []).append(state[field])
+    sketches = await load_sketches("category")
+    mismatches = 0
+    for (category, metric), values in exact.items():
+        values.sort()
+        sketch = sketches.get(category, {}).get(metric)
+        for q in DEFAULT_QUANTILES:
+            expected = values[int(q * (len(values) - 1))]
+            expected = 0.0 if expected <= SKETCH_MIN_VALUE else expected
+            estimate = sketch.quantile(q) if sketch else None
+            if estimate is None or abs(estimate - expected) > SKETCH_RELATIVE_ACCURACY * expected + 1e-9:
+                mismatches += 1
+                print(f"   ❌ {label}: {metric} p{q * 100:g} for {category}: exact={expected} sketch={estimate}")
+    return mismatches
+
+async def sketch_docs():
+    docs = {}
+    async for doc in db.latency_sketches.find({}, {"_id": 0}):
+        bins = {k: v for k, v in (doc.get("bins") or {}).items() if v}
+        if doc.get("count"):
+            docs[(doc["metric"], doc["dimension"], doc["key"])] = (doc["count"], doc.get("zero", 0), bins)
+    return docs
+
+async def trend_rows():
+    return {
+        (row["granularity"], row["dimension"], row["key"], row["bucket"]): tuple(row.get(m, 0) for m in ["created", "resolved", "breached"])
+        async for row in db.trend_rollups.find({}, {"_id": 0})
+        if any(row.get(m) for m in ["created", "resolved", "breached"])
+    }
+
+async def rollup_rows():
+    rows = {}
+    async for row in db.kpi_rollups.find({}, {"_id": 0}):
+        key = (row["granularity"], row["bucket"], row["zone_id"], row["category"], row["priority"], row["agent_id"])
+        # Incremental rows keep zeroed counters after decrements; a rebuild never writes them
+        values = {}
+        for column in ROLLUP_COLUMNS:
+            value = row.get(column)
+            if isinstance(value, dict):
+                value = {k: v for k, v in value.items() if v}
+            elif isinstance(value, float):
+                value = round(value, 6)
+            if value:
+                values[column] = value
+        if values:
+            rows[key] = values
+    return rows
+
+async def drop_collections():
+    await db.service_requests.drop()
+    await db.kpi_rollups.drop()
+    await db.trend_rollups.drop()
+    await db.latency_sketches.drop()
+
+async def run_test():
+    print("=" * 60)
+    print("KPI ROLLUP PARITY")
+    print("=" * 60)
+    await drop_collections()
+    await db.service_requests.insert_many([random_request(i) for i in range(SEED_REQUESTS)])
+    await rebuild_kpi_rollups()
+    errors = await check_parity("after rebuild")
+    errors += await check_sketches("after rebuild")
+    errors += await check_trends("after rebuild")
+
+    for round_number in range(1, WRITE_ROUNDS + 1):
+        targets = random.sample(range(SEED_REQUESTS), WRITES_PER_ROUND)
+        for i in targets:
+            request_id = f"CST-ROLLUP-{i:06d}"
+            await db.service_requests.update_one({"request_id": request_id}, {"$set": random_update()})
+        # Concurrent syncs of the same requests must not double count
+        await asyncio.gather(*[
+            sync_rollups({"request_id": f"CST-ROLLUP-{i:06d}"}) for i in targets + targets[:50]
+        ])
+        errors += await check_parity(f"after write round {round_number}")
+        errors += await check_sketches(f"after write round {round_number}")
+        errors += await check_trends(f"after write round {round_number}")
+
+    # Counter writes that fail leave their claims pending; the retry must apply them, not see nothing to do
+    targets = random.sample(range(SEED_REQUESTS), WRITES_PER_ROUND)
+    for i in targets:
+        await db.service_requests.update_one({"request_id": f"CST-ROLLUP-{i:06d}"}, {"$set": random_update()})
+    query = {"request_id": {"$in": [f"CST-ROLLUP-{i:06d}" for i in targets]}}
+    collection_class = type(db.kpi_rollups)
+    bulk_write = collection_class.bulk_write
+    async def failing_bulk_write(self, *args, **kwargs):
+        if self.name == "kpi_rollups":
+            raise RuntimeError("injected kpi_rollups failure")
+        return await bulk_write(self, *args, **kwargs)
+    collection_class.bulk_write = failing_bulk_write
+    try:
+        await sync_rollups(query)
+        errors += 1
+        print("   ❌ injected counter write failure was swallowed")
+    except RuntimeError:
+        pass
+    finally:
+        collection_class.bulk_write = bulk_write
+    await sync_rollups(query)
+    if await db.service_requests.count_documents({"rollup_pending": {"$ne": None}}):
+        errors += 1
+        print("   ❌ rollup claims still pending after the retry")
+    errors += await check_parity("after a failed sync was retried")
+    errors += await check_sketches("after a failed sync was retried")
+    errors += await check_trends("after a failed sync was retried")
+
+    incremental, incremental_sketches, incremental_trends = await rollup_rows(), await sketch_docs(), await trend_rows()
+    await rebuild_kpi_rollups()
+    rebuilt, rebuilt_sketches, rebuilt_trends = await rollup_rows(), await sketch_docs(), await trend_rows()
+    if incremental != rebuilt:
+        errors += 1
+        print(f"   ❌ incremental rows differ from a rebuild ({len(incremental)} vs {len(rebuilt)} rows)")
+    if incremental_sketches != rebuilt_sketches:
+        errors += 1
+        print(f"   ❌ incremental sketches differ from a rebuild ({len(incremental_sketches)} vs {len(rebuilt_sketches)})")
+    if incremental_trends != rebuilt_trends:
+        errors += 1
+        print(f"   ❌ incremental trend rows differ from a rebuild ({len(incremental_trends)} vs {len(rebuilt_trends)})")
+
+    # Writes whose queued sync was lost (process died before the flush) must be caught by the reconciler
+    if await rollup_drift():
+        errors += 1
+        print("   ❌ drift reported for rollups in sync")
+    for i in random.sample(range(SEED_REQUESTS), WRITES_PER_ROUND):
+        await db.service_requests.update_one({"request_id": f"CST-ROLLUP-{i:06d}"}, {"$set": random_update()})
+    drift = await rollup_drift()
+    if not drift or not await reconcile_rollups():
+        errors += 1
+        print(f"   ❌ unsynced writes not reconciled (drift {drift})")
+    errors += await check_parity("after reconciliation")
+
+    await drop_collections()
+    print(f"\n   {'✅ rollups, trends and sketches match the raw data' if errors == 0 else f'❌ {errors} mismatches'}")
+    return errors == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run_test()) else 1)
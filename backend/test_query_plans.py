@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression suite for service_requests.
+
+Seeds a scratch database on a local mongod, creates the production index set
+via setup_indexes(), then runs explain() on the query shapes each router
+issues. Fails if any winning plan contains a COLLSCAN or an in-memory SORT.
+
+Usage: python3 test_query_plans.py
+Requires mongod on MONGO_URL (default mongodb://localhost:27017). Uses the
+database cst_plan_test unless PLAN_TEST_DB is set; it is dropped first.
+"""
+import os
+import sys
+import random
+import asyncio
+from datetime import datetime, timedelta
+
+os.environ["DB_NAME"] = os.getenv("PLAN_TEST_DB", "cst_plan_test")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bson import ObjectId
+from pymongo import MongoClient
+from app.database import setup_indexes, MONGO_URL, DB_NAME
+from app.routers.analytics import get_base_filters
+from app.utils.pagination import apply_cursor, encode_cursor, keyset_sort
+
+SEED_REQUESTS = 20000
+OPEN = ["new", "triaged", "assigned", "in_progress"]
+BAD_STAGES = {"COLLSCAN", "SORT"}
+
+def seed(db):
+    now = datetime.utcnow()
+    agents = [str(ObjectId()) for _ in range(50)]
+    citizens = [str(ObjectId()) for _ in range(500)]
+    docs = []
+    for i in range(SEED_REQUESTS):
+        created = now - timedelta(minutes=random.randint(0, 60 * 24 * 365))
+        status = random.choice(OPEN + ["resolved", "closed"])
+        assigned = status not in ["new", "triaged"]
+        docs.append({
+            "request_id": f"CST-PLAN-{i:06d}",
+            "citizen_id": random.choice(citizens),
+            "category": random.choice(["pothole", "water_leak", "trash", "lighting", "sewage"]),
+            "priority": random.choice(["low", "medium", "high", "critical"]),
+            "status": status,
+            "assigned_agent_id": random.choice(agents) if assigned else None,
+            "location": {
+                "type": "Point",
+                "coordinates": [35.2 + random.random() / 10, 31.7 + random.random() / 10],
+                "zone_id": f"ZONE-{random.randint(1, 20)}"
+            },
+            "sla_policy": {"target_hours": 48, "breach_threshold_hours": 72},
+            "sla_target_at": created + timedelta(hours=48),
+            "sla_breach_at": created + timedelta(hours=72),
+            "queue_due_at": created + timedelta(hours=72),
+            "timestamps": {
+                "created_at": created,
+                "assigned_at": created + timedelta(hours=1) if assigned else None
+            }
+        })
+    db.service_requests.insert_many(docs)
+    return agents, citizens
+
+def plan_stages(node, stages=None):
+    """Collect every 'stage' name under an explain document's winning plans"""
+    stages = set() if stages is None else stages
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "rejectedPlans":
+                continue
+            if key == "stage":
+                stages.add(value)
+            else:
+                plan_stages(value, stages)
+    elif isinstance(node, list):
+        for item in node:
+            plan_stages(item, stages)
+    return stages
+
+def explain_find(db, query, sort=None, limit=50):
+    cursor = db.service_requests.find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    return cursor.limit(limit).explain()
+
+def explain_aggregate(db, pipeline):
+    return db.command("explain", {"aggregate": "service_requests", "pipeline": pipeline, "cursor": {}}, verbosity="queryPlanner")
+
+def build_cases(db, agents, citizens):
+    agent = agents[0]
+    citizen = citizens[0]
+    since = datetime.utcnow() - timedelta(days=30)
+    created_sort = keyset_sort("timestamps.created_at")
+    page_cursor = encode_cursor(datetime.utcnow() - timedelta(days=90), ObjectId())
+
+    def listing(**filters):
+        query = dict(filters)
+        return lambda: explain_find(db, query, created_sort)
+
+    def kpis(**filters):
+        return lambda: explain_aggregate(db, [{"$match": get_base_filters(**filters)}, {"$count": "n"}])
+
+    return {
+        # requests.py
+        "list_requests (no filter)": listing(),
+        "list_requests status": listing(status="new"),
+        "list_requests category": listing(category="pothole"),
+        "list_requests priority": listing(priority="high"),
+        "list_requests agent": listing(assigned_agent_id=agent),
+        "list_requests citizen": listing(citizen_id=citizen),
+        "list_requests status+category": listing(status="new", category="trash"),
+        "list_requests deep page": lambda: explain_find(
+            db, apply_cursor({"status": "new"}, "timestamps.created_at", page_cursor), created_sort),
+        "get_request": lambda: explain_find(db, {"request_id": "CST-PLAN-000001"}),
+        "sla breached": lambda: explain_find(
+            db, {"status": {"$in": OPEN}, "sla_breach_at": {"$lte": datetime.utcnow()}}, limit=0),
+        "sla at-risk": lambda: explain_find(
+            db, {"status": {"$in": OPEN}, "sla_target_at": {"$lte": datetime.utcnow()},
+                 "sla_breach_at": {"$gt": datetime.utcnow()}}, limit=0),
+        "sla next deadline": lambda: explain_find(
+            db, {"status": {"$in": OPEN}, "sla_breach_at": {"$gt": datetime.utcnow()}}, [("sla_breach_at", 1)], limit=1),
+        # citizens.py
+        "citizen requests": listing(citizen_id=citizen),
+        "citizen requests by status": listing(citizen_id=citizen, status="resolved"),
+        # agents.py
+        "agent tasks": lambda: explain_find(
+            db, {"assigned_agent_id": agent, "status": {"$in": ["assigned", "in_progress"]}},
+            keyset_sort("timestamps.assigned_at")),
+        "agent workload count": lambda: explain_aggregate(db, [
+            {"$match": {"assigned_agent_id": agent, "status": {"$in": ["assigned", "in_progress"]}}},
+            {"$group": {"_id": 1, "n": {"$sum": 1}}}]),
+        "agent next task": lambda: explain_find(
+            db, {"assigned_agent_id": agent, "status": "assigned", "queue_due_at": {"$ne": None}},
+            [("queue_due_at", 1), ("_id", 1)], limit=1),
+        "agent detail": lambda: explain_find(db, {"assigned_agent_id": agent}, limit=0),
+        # analytics.py
+        "kpis date range": kpis(start_date=since),
+        "kpis zone": kpis(zone="ZONE-3"),
+        "kpis zone+date": kpis(start_date=since, zone="ZONE-3"),
+        "kpis category+date": kpis(start_date=since, category="pothole"),
+        "kpis priority": kpis(priority="critical"),
+        "kpis agent": kpis(agent_id=agent),
+        "heatmap open": lambda: explain_find(db, {"status": {"$in": OPEN}}, limit=0),
+        "csv export": lambda: explain_find(
+            db, get_base_filters(since, datetime.utcnow()), [("timestamps.created_at", -1)], limit=0),
+    }
+
+def run_test():
+    print("=" * 60)
+    print(f"QUERY PLAN REGRESSION ({DB_NAME}, {SEED_REQUESTS} requests)")
+    print("=" * 60)
+
+    client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=5000)
+    client.drop_database(DB_NAME)
+    db = client[DB_NAME]
+    agents, citizens = seed(db)
+    asyncio.run(setup_indexes())
+
+    failures = []
+    for name, explain in build_cases(db, agents, citizens).items():
+        stages = plan_stages(explain())
+        bad = stages & BAD_STAGES
+        if bad:
+            failures.append(name)
+            print(f"   ❌ {name}: {sorted(bad)} in plan {sorted(stages)}")
+        else:
+            print(f"   ✅ {name}: {sorted(stages)}")
+
+    client.drop_database(DB_NAME)
+    if failures:
+        print(f"\n❌ {len(failures)} query shape(s) regressed: {failures}")
+        sys.exit(1)
+    print("\n✅ All query shapes use indexes with no in-memory sort")
+
+if __name__ == "__main__":
+    run_test()
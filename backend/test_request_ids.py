@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Concurrency test for request ID allocation: fires thousands of parallel
+POST /requests/ calls and checks that no two requests share an ID.
+
+Usage: python3 test_request_ids.py [TOTAL] [THREADS]
+Requires the API running on localhost:8000.
+"""
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+BASE_URL = "http://localhost:8000"
+
+def submit(citizen_id, n):
+    res = requests.post(f"{BASE_URL}/requests/", json={
+        "citizen_id": citizen_id,
+        "category": "trash",
+        "description": f"ID allocation load test #{n}",
+        "priority": "low",
+        "location": {"type": "Point", "coordinates": [35.0 + (n % 100) / 1000, 31.5]}
+    })
+    return res.status_code, res.json().get("request_id") if res.status_code == 200 else res.text
+
+def run_test():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    print("=" * 60)
+    print(f"REQUEST ID CONCURRENCY TEST ({total} POSTs, {threads} threads)")
+    print("=" * 60)
+
+    citizen_id = "000000000000000000000000"
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda n: submit(citizen_id, n), range(total)))
+    elapsed = time.perf_counter() - start
+
+    failures = [body for status, body in results if status != 200]
+    ids = [body for status, body in results if status == 200]
+    duplicates = {rid: c for rid, c in Counter(ids).items() if c > 1}
+
+    print(f"   Submitted: {total} in {elapsed:.1f}s ({total / elapsed:.0f} req/s)")
+    print(f"   Created:   {len(ids)}")
+    print(f"   Failed:    {len(failures)}")
+    print(f"   Duplicate IDs: {len(duplicates)}")
+
+    if failures:
+        print(f"   ❌ First failure: {failures[0]}")
+    if duplicates:
+        print(f"   ❌ Examples: {list(duplicates.items())[:5]}")
+    if failures or duplicates:
+        sys.exit(1)
+
+    print("\n✅ All request IDs unique")
+
+if __name__ == "__main__":
+    run_test()
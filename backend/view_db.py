@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 """Quick script to view MongoDB data"""
-from app.database import get_database
+import os
+from pymongo import MongoClient
 from bson import json_util
 import json
 
-db = get_database()
+# Scripts use the synchronous driver; the API itself runs on the async client
+client = MongoClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+db = client[os.getenv("DB_NAME", "cst_db")]
 
 print("=" * 60)
 print("DATABASE: cst_db")
@@ -1,5 +1,5 @@
 import React from 'react';
-import { MapContainer, TileLayer, CircleMarker, Popup, GeoJSON } from 'react-leaflet';
+import { MapContainer, TileLayer, CircleMarker, Popup, GeoJSON, useMapEvents } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
 
 const priorityColors = {
@@ -9,12 +9,21 @@ const priorityColors = {
     low: '#059669'
 };
 
-const HeatMap = ({ geojson, zoneJson }) => {
-    console.log('HeatMap render - geojson:', geojson);
-    console.log('HeatMap render - zoneJson:', zoneJson);
-    
+// Reports zoom + bounds so the parent can request grid cells for the viewport
+const ViewWatcher = ({ onViewChange }) => {
+    const map = useMapEvents({
+        moveend: () => report(),
+        zoomend: () => report()
+    });
+    const report = () => {
+        const b = map.getBounds();
+        onViewChange({ zoom: map.getZoom(), bbox: [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].map(v => v.toFixed(5)).join(',') });
+    };
+    return null;
+};
+
+const HeatMap = ({ geojson, zoneJson, onViewChange }) => {
     const features = geojson?.features || [];
-    console.log('HeatMap render - features count:', features.length);
 
     // Calculate center from features or use default
     let center = [31.9038, 35.2050]; // Ramallah default
@@ -60,6 +69,8 @@ const HeatMap = ({ geojson, zoneJson }) => {
                 attribution='&copy; <a href="http://osm.org/copyright">OpenStreetMap</a>'
             />
 
+            {onViewChange && <ViewWatcher onViewChange={onViewChange} />}
+
             {/* Zone Choropleth Layer */}
             {zoneJson && (
                 <GeoJSON
@@ -86,7 +97,35 @@ const HeatMap = ({ geojson, zoneJson }) => {
                 
                 const props = feature.properties || {};
                 const color = priorityColors[props.priority] || '#6b7280';
-                const radius = 8 + (props.weight || 1) * 4;
+                const count = props.count || 1;
+                // Grid cells carry a request count; grow with it but keep big cells readable
+                const radius = count > 1
+                    ? Math.min(10 + Math.sqrt(count) * 3, 40)
+                    : 8 + (props.weight || 1) * 4;
+
+                if (props.count) {
+                    return (
+                        <CircleMarker
+                            key={props.cell || idx}
+                            center={[lat, lng]}
+                            radius={radius}
+                            fillColor={color}
+                            fillOpacity={0.6}
+                            color="#fff"
+                            weight={2}
+                        >
+                            <Popup>
+                                <div style={{ minWidth: '150px' }}>
+                                    <strong>{count} request{count === 1 ? '' : 's'}</strong>
+                                    <p style={{ margin: '4px 0', fontSize: '0.8rem', color: '#666' }}>Weight: {props.weight}</p>
+                                    {Object.entries(props.priorities || {}).map(([prio, n]) => (
+                                        <p key={prio} style={{ margin: '0', fontSize: '0.75rem', color: priorityColors[prio] || '#666' }}>{prio}: {n}</p>
+                                    ))}
+                                </div>
+                            </Popup>
+                        </CircleMarker>
+                    );
+                }
 
                 return (
                     <CircleMarker
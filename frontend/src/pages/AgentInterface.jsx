@@ -41,6 +41,17 @@ function AgentInterface() {
         }
     };
 
+    const handleClaimNext = async () => {
+        try {
+            const res = await client.post(`/agents/${selectedAgent._id}/next`);
+            const tasksRes = await client.get(`/agents/${selectedAgent._id}/tasks`);
+            setTasks(tasksRes.data);
+            alert(`Started ${res.data.task.request_id} (${res.data.remaining} still waiting)`);
+        } catch (err) {
+            alert(err.response?.data?.detail || 'Failed to start next task');
+        }
+    };
+
     if (loading) return <div className="loading"><div className="spinner"></div> Loading...</div>;
 
     return (
@@ -84,7 +95,14 @@ function AgentInterface() {
                     </div>
                 )}
 
-                <h2 className="mb-4">My Tasks</h2>
+                <div className="flex justify-between items-center mb-4">
+                    <h2>My Tasks</h2>
+                    {selectedAgent && (
+                        <button className="btn btn-primary" onClick={handleClaimNext}>
+                            Start Next Task
+                        </button>
+                    )}
+                </div>
 
                 {tasks.length === 0 ? (
                     <div className="empty-state card">
@@ -39,7 +39,7 @@ function Analytics() {
                 client.get('/analytics/agents'),
                 client.get('/analytics/cohorts'),
                 client.get('/agents/zones'),
-                client.get('/analytics/zones/geojson'),
+                client.get('/analytics/zones/geojson?zoom=13'),
                 client.get('/agents')
             ]);
             setKpis(kpiRes.data);
@@ -231,6 +231,7 @@ function OverviewTab({ kpis, filters, setFilters, zones, agents }) {
 function MapTab({ zoneGeoJson }) {
     const [heatmapData, setHeatmapData] = useState(null);
     const [mapFilters, setMapFilters] = useState({ category: '', priority: '', status: 'all' });
+    const [view, setView] = useState({ zoom: 13, bbox: null });
 
     useEffect(() => {
         const params = new URLSearchParams();
@@ -241,20 +242,15 @@ function MapTab({ zoneGeoJson }) {
         const includeClosed = mapFilters.status === 'all';
         params.append('include_closed', includeClosed);
 
-        console.log('Fetching heatmap with filters:', { ...mapFilters, includeClosed });
-        console.log('API URL:', `/analytics/heatmap?${params.toString()}`);
+        // Server-side binning: one marker per occupied cell in the viewport
+        params.append('mode', 'grid');
+        params.append('zoom', view.zoom);
+        if (view.bbox) params.append('bbox', view.bbox);
         
         client.get(`/analytics/heatmap?${params.toString()}`)
-            .then(res => {
-                console.log('Heatmap response:', res.data);
-                console.log('Features count:', res.data?.features?.length || 0);
-                setHeatmapData(res.data);
-            })
-            .catch(err => {
-                console.error('Heatmap fetch error:', err);
-                console.error('Error details:', err.response?.data);
-            });
-    }, [mapFilters]);
+            .then(res => setHeatmapData(res.data))
+            .catch(err => console.error('Heatmap fetch error:', err.response?.data || err));
+    }, [mapFilters, view]);
 
     return (
         <div className="card" style={{ padding: '0', overflow: 'hidden' }}>
@@ -278,7 +274,7 @@ function MapTab({ zoneGeoJson }) {
                 </div>
             </div>
             <div style={{ height: '550px' }}>
-                <HeatMap geojson={heatmapData} zoneJson={zoneGeoJson} />
+                <HeatMap geojson={heatmapData} zoneJson={zoneGeoJson} onViewChange={setView} />
             </div>
             <div className="p-4 bg-light flex gap-4 text-xs">
                 <div className="flex items-center gap-1"><span style={{ width: '12px', height: '12px', background: '#991b1b', borderRadius: '2px', opacity: 0.6 }}></span> High Density Zone (&gt;10 open requests)</div>
@@ -301,6 +297,7 @@ function AgentsTab({ stats }) {
                         <th>Active Load</th>
                         <th>LTD Completed</th>
                         <th>Avg Resolution</th>
+                        <th>Resolution p50 / p90</th>
                         <th>Productivity Score</th>
                     </tr>
                 </thead>
@@ -316,6 +313,7 @@ function AgentsTab({ stats }) {
                             <td><span className="badge badge-assigned">{agent.active_tasks} items</span></td>
                             <td><span className="badge badge-resolved">{agent.completed_tasks} resolved</span></td>
                             <td>{agent.avg_resolution_hours > 0 ? `${agent.avg_resolution_hours} hrs` : '--'}</td>
+                            <td>{agent.resolution_p50_hours != null ? `${agent.resolution_p50_hours} / ${agent.resolution_p90_hours} hrs` : '--'}</td>
                             <td>
                                 <div className="flex items-center gap-2">
                                     <div style={{ flex: 1, height: '6px', background: 'var(--border)', borderRadius: '3px' }}>
@@ -326,7 +324,7 @@ function AgentsTab({ stats }) {
                             </td>
                         </tr>
                     ))}
-                    {stats.length === 0 && <tr><td colSpan="5" className="text-center p-4 text-muted">No agent activity recorded yet.</td></tr>}
+                    {stats.length === 0 && <tr><td colSpan="6" className="text-center p-4 text-muted">No agent activity recorded yet.</td></tr>}
                 </tbody>
             </table>
         </div>
@@ -338,13 +336,14 @@ function CohortsTab({ cohorts }) {
         <div className="grid grid-2 gap-4">
             <div className="card">
                 <h3 className="card-title mb-4">Recurring Issue Hotspots</h3>
-                <p className="text-sm text-muted mb-4">Neighborhoods and intersections with multiple reported incidents.</p>
+                <p className="text-sm text-muted mb-4">Spots with repeated reports in the last 90 days.</p>
                 <div className="flex flex-col gap-3">
                     {cohorts.map((cohort, i) => (
                         <div key={i} className="p-3 border rounded hover-bg" style={{ position: 'relative' }}>
                             <div className="flex justify-between items-start">
                                 <div>
-                                    <strong className="block text-primary">{cohort._id || 'General Location'}</strong>
+                                    <strong className="block text-primary">{cohort.label || 'General Location'}</strong>
+                                    <span className="text-xs text-muted">within {Math.round(cohort.radius_m)} m of {cohort.center[1].toFixed(5)}, {cohort.center[0].toFixed(5)}</span>
                                     <div className="flex gap-1 mt-1">
                                         {cohort.categories.map(c => <span key={c} className="badge text-xs" style={{ fontSize: '0.6rem' }}>{c}</span>)}
                                     </div>
@@ -103,23 +103,38 @@ function Dashboard() {
 
 function RequestsManagement() {
     const [requests, setRequests] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [filters, setFilters] = useState({ status: '', category: '', priority: '' });
     const navigate = useNavigate();
 
-    const fetchRequests = async () => {
-        setLoading(true);
+    const fetchPage = async (cursor) => {
         const params = new URLSearchParams();
         if (filters.status) params.append('status', filters.status);
         if (filters.category) params.append('category', filters.category);
         if (filters.priority) params.append('priority', filters.priority);
         params.append('limit', '100');
+        if (cursor) params.append('cursor', cursor);
 
         const res = await client.get(`/requests/?${params.toString()}`);
-        setRequests(res.data);
+        setNextCursor(res.headers['x-next-cursor'] || null);
+        return res.data;
+    };
+
+    const fetchRequests = async () => {
+        setLoading(true);
+        setRequests(await fetchPage(null));
         setLoading(false);
     };
 
+    const loadMore = async () => {
+        setLoadingMore(true);
+        const page = await fetchPage(nextCursor);
+        setRequests(prev => [...prev, ...page]);
+        setLoadingMore(false);
+    };
+
     useEffect(() => { fetchRequests(); }, [filters]);
 
     return (
@@ -186,6 +201,13 @@ function RequestsManagement() {
                             ))}
                         </tbody>
                     </table>
+                    {nextCursor && (
+                        <div className="text-center p-4">
+                            <button className="btn btn-outline" onClick={loadMore} disabled={loadingMore}>
+                                {loadingMore ? 'Loading...' : 'Load more'}
+                            </button>
+                        </div>
+                    )}
                 </div>
             )}
         </div>